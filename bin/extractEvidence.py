@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+# Extract the discordant pairs and split reads from a sample BAM file in a
+# single pass. This replaces scripts/createDiscordants.sh (samtools view
+# -F 3842) and scripts/createSplitReads.sh (LUMPY's extractSplitReads_BwaMem)
+import argparse as ap
+import logging
+import re
+from shared import readRegions, regionAlignments, openBAM, noteRecords
+
+# proper pair, secondary, QC fail, duplicate, supplementary
+DISCORDANT_EXCLUDE_FLAGS = 3842
+# split reads with more than this many segments are ignored
+MAX_SPLITS = 2
+# both segments of a split read must have this many unique query bases
+MIN_NON_OVERLAP = 20
+
+CIGAR_OPS = "MIDNSHP=X"
+CIGAR_PATTERN = re.compile(r"(\d+)([MIDNSHP=X])")
+
+def isDiscordant(alignment):
+    return alignment.flag & DISCORDANT_EXCLUDE_FLAGS == 0
+
+def parseCigar(cigar):
+    return [(CIGAR_OPS.index(op), int(length)) for length, op in CIGAR_PATTERN.findall(cigar)]
+
+def querySpan(cigartuples, reverse):
+    """Start and end of the aligned part of a query, in the orientation of the
+    sequenced read, counted as extractSplitReads_BwaMem does"""
+    if reverse:
+        cigartuples = cigartuples[::-1]
+    qsPos, qePos = 0, 0
+    aligned = False
+    for op, length in cigartuples:
+        if op in (4, 5):
+            if not aligned:
+                qsPos += length
+                qePos += length
+        elif op in (0, 1):
+            qePos += length
+            aligned = True
+    return qsPos, qePos
+
+def isSplitRead(alignment, minNonOverlap):
+    if alignment.is_duplicate or not alignment.has_tag('SA'):
+        return False
+    sa = alignment.get_tag('SA')
+    if len(sa.split(";")) > MAX_SPLITS:
+        return False
+    other = sa.split(",")
+    otherSpan = querySpan(parseCigar(other[3]), other[2] == "-")
+    span = querySpan(alignment.cigartuples or [], alignment.is_reverse)
+    overlap = max(0, 1 + min(span[1], otherSpan[1]) - max(span[0], otherSpan[0]))
+    nonOverlap1 = 1 + span[1] - span[0] - overlap
+    nonOverlap2 = 1 + otherSpan[1] - otherSpan[0] - overlap
+    return min(nonOverlap1, nonOverlap2) >= minNonOverlap
+
+def extractEvidence(sampleBAM, discFile, splitFile, minNonOverlap=MIN_NON_OVERLAP,
+                    regions=None):
+    """Write the discordant pairs and the split reads of sampleBAM, in its
+    order, to discFile and splitFile. The two segments of a read are told
+    apart from those of its mate by a _1 or _2 suffix on the split read names.
+    If (chr, start, stop) regions are given, only the alignments overlapping
+    them and those of their mates are read, through the index.
+    Returns the number of discordant and split read alignments written.
+    """
+    logging.info('Started extracting discordants and split reads from %s', sampleBAM)
+    samfile = openBAM(sampleBAM, "rb")
+    fDisc = openBAM(discFile, "wb", template=samfile)
+    fSplit = openBAM(splitFile, "wb", template=samfile)
+    if regions is None:
+        alignments = samfile.fetch(until_eof=True)
+    else:
+        alignments = regionAlignments(samfile, regions)
+    nDisc, nSplit = 0, 0
+    for alignment in alignments:
+        if isDiscordant(alignment):
+            fDisc.write(alignment)
+            nDisc += 1
+        if isSplitRead(alignment, minNonOverlap):
+            if alignment.is_read1:
+                alignment.query_name += "_1"
+            else:
+                alignment.query_name += "_2"
+            fSplit.write(alignment)
+            nSplit += 1
+    samfile.close()
+    fDisc.close()
+    fSplit.close()
+    noteRecords(discFile, nDisc)
+    noteRecords(splitFile, nSplit)
+    logging.info('Finished extracting %d discordants and %d split reads', nDisc, nSplit)
+    return nDisc, nSplit
+
+if __name__ == "__main__":
+    PARSER = ap.ArgumentParser(description="""
+    Extract discordant pairs and split reads from a BAM file in one pass""",
+    formatter_class=ap.ArgumentDefaultsHelpFormatter)
+    PARSER.add_argument('sampleBAM', help='BAM file of sample alignments')
+    PARSER.add_argument('discFile', help='Output BAM file of discordant pairs')
+    PARSER.add_argument('splitFile', help='Output BAM file of split reads')
+    PARSER.add_argument('-m', default=MIN_NON_OVERLAP, dest='minNonOverlap',
+        type=int, help='Minimum non-overlapping query bases of each split segment')
+    PARSER.add_argument('-r', default=None, dest='regions',
+        help='BED file of target regions; only their evidence and that of their mates is extracted')
+    ARGS = PARSER.parse_args()
+
+    REGIONS = None
+    if ARGS.regions is not None:
+        REGIONS = readRegions(ARGS.regions)
+    extractEvidence(ARGS.sampleBAM, ARGS.discFile, ARGS.splitFile, ARGS.minNonOverlap,
+                    REGIONS)
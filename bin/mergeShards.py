@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+# Merge the results of SVXplorer runs on the shards of a genome (--shard K/N)
+# into one call set. A variant is taken from the shard whose regions hold its
+# first breakpoint, as that shard read all the evidence around it; variants
+# called again by the neighbouring shards from their margins are dropped. The
+# variants are renumbered in shard order, and the fragment numbers of every
+# shard are offset so that they stay distinct.
+import argparse as ap
+import sys
+from os import mkdir, symlink, remove
+from os.path import exists, isdir, lexists, abspath
+from shared import readShardBED, inRegions
+from writeVCF import writeVCF
+
+def readShards(shardDirs):
+    """Workspaces and regions of the shards of a run, ordered by shard number.
+    Exits unless they are shards 1 to N of the same N."""
+    shards = []
+    for shardDir in shardDirs:
+        shardFile = "%s/workspace/shard.bed" % shardDir
+        if not exists(shardFile):
+            print >> sys.stderr, "Not the output directory of a shard: %s" % shardDir
+            exit(1)
+        shard, nShards, _, regions = readShardBED(shardFile)
+        shards.append((shard, nShards, "%s/workspace" % shardDir, regions))
+    shards.sort()
+    nShards = shards[0][1]
+    if [x[0] for x in shards] != range(1, nShards + 1) or \
+       any(x[1] != nShards for x in shards):
+        print >> sys.stderr, "Expected shards 1 to N of one run, found %s" % \
+            " ".join("%d/%d" % (x[0], x[1]) for x in shards)
+        exit(1)
+    return [(x[2], x[3]) for x in shards]
+
+def fragmentRange(variantMapFile):
+    """Largest PE fragment number and largest split read number (these are
+    negative) in a variant map"""
+    maxPE, maxSR = 0, 0
+    with open(variantMapFile, "r") as f:
+        for line in f:
+            for item in line.split()[1:]:
+                number = int(item.split("_")[0])
+                if number > 0:
+                    maxPE = max(maxPE, number)
+                else:
+                    maxSR = max(maxSR, -number)
+    return maxPE, maxSR
+
+def renumberFragment(item, peOffset, srOffset):
+    """Fragment number of a variant map, offset by the fragments of the
+    previous shards; secondary alignments keep their "_n" suffix"""
+    number, sep, suffix = item.partition("_")
+    number = int(number)
+    if number > 0:
+        number += peOffset
+    else:
+        number -= srOffset
+    return "%d%s%s" % (number, sep, suffix)
+
+def vcfHeaderOf(vcfFile):
+    with open(vcfFile, "r") as f:
+        return "".join(line for line in f if line.startswith("#"))
+
+def mergeShards(outDir, shardDirs):
+    """Write the variants of the shards to the workspace of outDir, with the
+    results linked from outDir/results as for a single run. Returns the number
+    of variants merged."""
+    shards = readShards(shardDirs)
+    workspace = "%s/workspace" % outDir
+    for directory in [outDir, workspace, "%s/results" % outDir]:
+        if not isdir(directory):
+            mkdir(directory)
+
+    fAV = open("%s/allVariants.pu.txt" % workspace, "w")
+    fPassed = open("%s/variants.uniqueFilter.txt" % workspace, "w")
+    fVM = open("%s/variantMap.pe_sr.txt" % workspace, "w")
+    fBed = open("%s/variants.pu.bedpe" % workspace, "w")
+    counter = 0
+    peOffset, srOffset = 0, 0
+    for k, (shardWorkspace, regions) in enumerate(shards):
+        # variants whose first breakpoint is in the shard, by row index (which
+        # numbers them in the BEDPE file) and by variant number
+        rowIndex, varNums = {}, {}
+        with open("%s/allVariants.pu.txt" % shardWorkspace, "r") as f:
+            header = f.readline()
+            if k == 0:
+                fAV.write(header)
+            for i, line in enumerate(f):
+                varNum, rest = line.split("\t", 1)
+                chr1, start1 = rest.split("\t", 3)[1:3]
+                if inRegions(chr1, int(start1), regions):
+                    rowIndex[i] = counter
+                    varNums[varNum] = str(counter + 1)
+                    fAV.write("%s\t%s" % (varNums[varNum], rest))
+                    counter += 1
+
+        with open("%s/variants.uniqueFilter.txt" % shardWorkspace, "r") as f:
+            for line in f:
+                if line.strip() in varNums:
+                    fPassed.write("%s\n" % varNums[line.strip()])
+
+        variantMapFile = "%s/variantMap.pe_sr.txt" % shardWorkspace
+        with open(variantMapFile, "r") as f:
+            for line in f:
+                line_split = line.split()
+                if line_split[0] in varNums:
+                    fVM.write("\t".join([varNums[line_split[0]]] +
+                        [renumberFragment(x, peOffset, srOffset) for x in line_split[1:]]) + "\n")
+        maxPE, maxSR = fragmentRange(variantMapFile)
+        peOffset += maxPE
+        srOffset += maxSR
+
+        # BEDPE lines carry the row index as SV<i> and G<i>
+        with open("%s/variants.pu.bedpe" % shardWorkspace, "r") as f:
+            header = f.readline()
+            if k == 0:
+                fBed.write(header)
+            for line in f:
+                tokens = line.rstrip("\n").split("\t")
+                index = int(tokens[6][2:])
+                if index in rowIndex:
+                    tokens[6] = "SV%d" % rowIndex[index]
+                    if tokens[24] != ".":
+                        tokens[24] = "G%d" % rowIndex[index]
+                    fBed.write("\t".join(tokens) + "\n")
+
+    fAV.close()
+    fPassed.close()
+    fVM.close()
+    fBed.close()
+
+    writeVCF("%s/variants.pu.bedpe" % workspace, "%s/variants.pu.vcf" % workspace,
+             vcfHeaderOf("%s/variants.pu.vcf" % shards[0][0]))
+    for ext in ["bedpe", "vcf"]:
+        otpt = "%s/results/variants.%s" % (outDir, ext)
+        if lexists(otpt):
+            remove(otpt)
+        symlink(abspath("%s/variants.pu.%s" % (workspace, ext)), abspath(otpt))
+    return counter
+
+if __name__ == "__main__":
+    PARSER = ap.ArgumentParser(description="""
+    Merge the output directories of SVXplorer runs with --shard 1/N to N/N
+    into one call set, written to the workspace and results directories of
+    outDir as for a single run.""", formatter_class=ap.ArgumentDefaultsHelpFormatter)
+    PARSER.add_argument('outDir', help='output directory of the merged call set')
+    PARSER.add_argument('shardDirs', nargs='+', help='output directories of the shards, in any order')
+    ARGS = PARSER.parse_args()
+
+    NVARIANTS = mergeShards(ARGS.outDir, ARGS.shardDirs)
+    print >> sys.stderr, "Merged %d variants of %d shards" % (NVARIANTS, len(ARGS.shardDirs))
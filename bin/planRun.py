@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+
+# Estimate the cost of an SVXplorer run before starting it, so that a scheduler
+# can request its resources. Only what can be read cheaply is read: the record
+# counts in the BAM indices, the chromosome lengths in the headers, and a few
+# records at evenly spaced positions of the genome, from which the library
+# statistics, the share of discordant and split reads and the density of the
+# discordant fragments are sampled. The wall time and peak memory of every
+# stage are predicted with the cost constants below, and the --threads,
+# --max-mem and --sort-mem to run with are recommended for the cores and
+# memory on offer.
+import argparse as ap
+import json
+import sys
+from multiprocessing import cpu_count
+from os.path import getsize
+from shared import openBAM, bamStats, setMemoryBudget, withinMemoryBudget, \
+                   runContext
+from extractEvidence import isDiscordant, isSplitRead, MIN_NON_OVERLAP
+from writeDiscordantFragments import libraryStats, AS_CALC_THRESH
+from formPEClusters import maxClusterLength
+from consolidatePEClusters import PARSED_TABLE_FACTOR
+from extsort import LINE_OVERHEAD
+
+MB = 1024*1024
+
+# the cost of every stage on one core, as (stage, seconds to start it,
+# microseconds per unit of work). The units are records of the sample BAM
+# ("sample"), of which at most STATS_RECORDS are read for the library
+# statistics ("stats"), records of the discordant and split read BAM files
+# ("disc", "split"), lines of allDiscordants.txt ("lines"), and pairs of
+# discordant fragments close enough to be compared when clustering ("pairs").
+# They were measured on simulated samples and are meant to be scaled to the
+# machines at hand, e.g. by comparing the plan with metrics.json of a run.
+STAGE_COSTS = [("extractEvidence", 0.0, {"sample": 1.9}),
+               ("nameSortDiscordants", 0.0, {"disc": 12.0}),
+               ("calcMeanSig", 0.5, {"stats": 4.0}),
+               ("writeDiscordantFragments", 0.0, {"disc": 17.0}),
+               ("sortDiscordants", 0.0, {"lines": 4.0}),
+               ("formPEClusters", 1.0, {"lines": 110.0, "pairs": 10.0}),
+               ("cleanupClusters", 0.0, {"lines": 1.0}),
+               ("nameSortSplitters", 0.0, {"split": 12.0}),
+               ("preserveSmallClusters", 0.0, {"split": 20.0}),
+               ("consolidatePEClusters", 0.0, {"lines": 2.0}),
+               ("filterAndFormat.pe", 0.0, {"lines": 2.0}),
+               ("addSplitReads", 0.0, {"split": 140.0}),
+               ("filterAndFormat.pe_sr", 0.0, {"lines": 2.0}),
+               ("covPUFilter", 0.6, {"sample": 3.0}),
+               ("filterAndFormat.pu", 0.0, {})]
+# records read by calcMeanSig at most (twice CALC_THRESH of SVXplorer)
+STATS_RECORDS = 20000000
+# stages that read or write BAM files, and the share of their time spent in
+# BGZF compression that --threads spreads over several threads
+BAM_STAGES = set(["extractEvidence", "nameSortDiscordants", "calcMeanSig",
+                  "writeDiscordantFragments", "nameSortSplitters",
+                  "preserveSmallClusters", "addSplitReads", "covPUFilter"])
+BGZF_SHARE = 0.3
+
+# memory of the interpreter with pysam and numpy, and of networkx and sklearn
+# from formPEClusters on
+BASE_BYTES = 40*MB
+LIBRARY_BYTES = 55*MB
+# memory of a clustering process beyond what it shares with the run
+WORKER_BYTES = 10*MB
+# memory of a BAM record being sorted, an insert length sampled for the
+# library statistics, a line of allDiscordants.txt, a discordant fragment and
+# a pair of fragments in the clustering graph, and a line of allClusters.txt
+BAM_RECORD_BYTES = 400
+INSERT_LENGTH_BYTES = 32
+DISCORDANT_LINE_BYTES = 40
+FRAGMENT_BYTES = 1000
+PAIR_BYTES = 300
+CLUSTER_LINE_BYTES = 60
+
+# --sort-mem of SVXplorer, and its default value of DISC_ENHANCER and
+# minimum cluster size below which small clusters are preserved
+DEFAULT_SORT_MEMORY = 512*MB
+DISC_ENHANCER = 1.0
+PRESERVE_SIZE = 3
+# positions of the genome the records are sampled at
+SAMPLE_WINDOWS = 100
+# more threads are only recommended if they save this share of the wall time
+THREAD_GAIN = 0.05
+
+def countRecords(bamName, sampleSize):
+    """Number of records of a BAM file, from its index or else extrapolated
+    from the compressed bytes taken by its first sampleSize records"""
+    bamfile = openBAM(bamName)
+    if bamfile.has_index():
+        count = bamfile.mapped + bamfile.unmapped
+        bamfile.close()
+        return count
+    n = 0
+    start = bamfile.tell() >> 16
+    for _ in bamfile.fetch(until_eof=True):
+        n += 1
+        if n == sampleSize:
+            break
+    read = (bamfile.tell() >> 16) - start
+    bamfile.close()
+    if n < sampleSize or read <= 0:
+        return n
+    return int(n*float(getsize(bamName))/read)
+
+def sampleWindows(bamName, sampleSize):
+    """Records of a BAM file in runs of consecutive records: starting at
+    SAMPLE_WINDOWS evenly spaced positions of the genome through the index,
+    or else the first sampleSize records. Returns the runs and whether they
+    are in coordinate order."""
+    bamfile = openBAM(bamName)
+    header = bamfile.header.to_dict()
+    coordinate = header.get('HD', {}).get('SO') == 'coordinate'
+    windows = []
+    if coordinate and bamfile.has_index():
+        lengths = [(x['SN'], x['LN']) for x in header['SQ']]
+        genome = sum(x[1] for x in lengths)
+        perWindow = max(1, sampleSize/SAMPLE_WINDOWS)
+        offset = 0
+        for chrom, length in lengths:
+            k = int(offset*SAMPLE_WINDOWS/genome)
+            while (k + 0.5)*genome/SAMPLE_WINDOWS < offset + length:
+                pos = int((k + 0.5)*genome/SAMPLE_WINDOWS) - offset
+                window = []
+                for alignment in bamfile.fetch(chrom, max(0, pos)):
+                    window.append(alignment)
+                    if len(window) == perWindow:
+                        break
+                windows.append(window)
+                k += 1
+            offset += length
+    else:
+        window = []
+        for alignment in bamfile.fetch(until_eof=True):
+            window.append(alignment)
+            if len(window) == sampleSize:
+                break
+        windows.append(window)
+    bamfile.close()
+    return windows, coordinate
+
+def sampleLibrary(windows):
+    """Library statistics of the sampled records of the sample BAM, as
+    calcMeanSig computes them, and the shares of those records that are
+    discordant and split"""
+    insertLengths = []
+    summedQL = 0
+    records, discordant, split = 0, 0, 0
+    for window in windows:
+        for m1 in window:
+            records += 1
+            discordant += isDiscordant(m1)
+            split += isSplitRead(m1, MIN_NON_OVERLAP)
+            if m1.is_proper_pair and not m1.is_secondary and \
+               not m1.is_supplementary and m1.template_length > 0 and \
+               m1.get_tag("AS") > AS_CALC_THRESH*m1.infer_query_length():
+                insertLengths.append(m1.template_length)
+                summedQL += m1.infer_query_length()
+    if not insertLengths:
+        print >> sys.stderr, "No concordant pairs found in the sampled records of the sample BAM file"
+        exit(1)
+    meanIL, stdIL, maxIL, disc_thresh, _, dist_penalty, dist_end, _ = \
+        libraryStats(insertLengths)
+    stats = bamStats([summedQL/len(insertLengths), meanIL, stdIL, 0, maxIL,
+                      disc_thresh, dist_penalty, dist_end])
+    return stats, float(discordant)/records, float(split)/records
+
+def fragmentEnds(window):
+    """(tid, mate tid, pos, mate pos) of the discordant fragments of a run of
+    records, from their leftmost primary alignments"""
+    ends = []
+    for x in window:
+        if x.is_unmapped or x.mate_is_unmapped or x.is_secondary or \
+           x.is_supplementary:
+            continue
+        if (x.reference_id, x.reference_start) <= \
+           (x.next_reference_id, x.next_reference_start):
+            ends.append((x.reference_id, x.next_reference_id,
+                         x.reference_start, x.next_reference_start))
+    return sorted(ends)
+
+def sampleDiscordants(windows, coordinate, nDisc, maxLength):
+    """Discordant lines per discordant record, the mean and largest number of
+    fragments within maxLength of both ends of a fragment, and the largest
+    share of the fragments in one chromosome pair, from the sampled runs of
+    discordant records. Runs of a file that is not coordinate-sorted are a
+    sample of fragments from all over the genome, so their neighbours are
+    scaled up to all nDisc records."""
+    records, primary = 0, 0
+    neighbours = []
+    pairs = {}
+    for window in windows:
+        for x in window:
+            if not x.is_supplementary:
+                records += 1
+                primary += not x.is_secondary
+        ends = fragmentEnds(window)
+        counts = [0]*len(ends)
+        for i, (tid, mtid, pos, mpos) in enumerate(ends):
+            pairs[(tid, mtid)] = pairs.get((tid, mtid), 0) + 1
+            j = i + 1
+            while j < len(ends) and ends[j][:2] == (tid, mtid) and \
+                  ends[j][2] - pos <= maxLength:
+                if abs(ends[j][3] - mpos) <= maxLength:
+                    counts[i] += 1
+                    counts[j] += 1
+                j += 1
+        neighbours += counts
+    if primary == 0 or not neighbours:
+        return 0.5, 0.0, 0, 1.0
+    # every secondary alignment of a read adds a combination of alignments
+    linesPerRecord = 0.5*(float(records)/primary)**2
+    scale = 1.0
+    if not coordinate:
+        scale = max(1.0, nDisc/(2.0*len(neighbours)))
+    meanNeighbours = scale*sum(neighbours)/len(neighbours)
+    maxNeighbours = int(scale*max(neighbours))
+    largestShare = float(max(pairs.values()))/sum(pairs.values())
+    return linesPerRecord, meanNeighbours, maxNeighbours, largestShare
+
+class runInputs(object):
+    """What the plan of a run is made from"""
+    def __init__(self, disc, split, samplebam, sampleSize):
+        context = runContext()
+        self.genome = sum(context.chromosomeLengths(samplebam).values())
+        self.sample = countRecords(samplebam, sampleSize)
+        windows, coordinate = sampleWindows(samplebam, sampleSize)
+        stats, discShare, splitShare = sampleLibrary(windows)
+        self.maxLength = maxClusterLength(stats, DISC_ENHANCER, {})
+        self.extract = disc is None
+        if self.extract:
+            # the discordants and split reads of the sample BAM
+            self.disc = int(discShare*self.sample)
+            self.split = int(splitShare*self.sample)
+            self.sortDisc, self.sortSplit = True, True
+            windows = [[x for x in window if isDiscordant(x)] for window in windows]
+        else:
+            self.disc = countRecords(disc, sampleSize)
+            self.split = countRecords(split, sampleSize)
+            windows, coordinate = sampleWindows(disc, sampleSize)
+            self.sortDisc = coordinate
+            self.sortSplit = context.header(split).get('HD', {}).get('SO') == 'coordinate'
+        linesPerRecord, self.meanNeighbours, self.maxNeighbours, \
+            self.largestShare = sampleDiscordants(windows, coordinate,
+                                                  self.disc, self.maxLength)
+        self.lines = int(linesPerRecord*self.disc)
+
+    def summary(self):
+        return dict((x, getattr(self, x)) for x in
+                    ["genome", "sample", "disc", "split", "lines", "maxLength",
+                     "meanNeighbours", "maxNeighbours", "largestShare"])
+
+def stageUnits(inputs):
+    return {"sample": inputs.sample, "stats": min(inputs.sample, STATS_RECORDS),
+            "disc": inputs.disc, "split": inputs.split, "lines": inputs.lines,
+            "pairs": inputs.lines*inputs.meanNeighbours}
+
+def stageRuns(stage, inputs, noCleanup, minClusterSize):
+    """Whether SVXplorer runs stage for the inputs"""
+    if stage == "extractEvidence":
+        return inputs.extract
+    if stage == "nameSortDiscordants":
+        return inputs.sortDisc
+    if stage == "nameSortSplitters":
+        return inputs.sortSplit
+    if stage == "cleanupClusters":
+        return not noCleanup
+    if stage == "preserveSmallClusters":
+        return minClusterSize < PRESERVE_SIZE
+    return True
+
+def tableBytes(size):
+    """Memory of a table of size bytes, none if it is kept in its compact
+    form for the memory budget"""
+    return size if withinMemoryBudget(size) else 0
+
+def stageMemory(stage, inputs, threads, ignoreBED, nhRegions, sortMemory):
+    """Memory used by stage beyond that of the interpreter and its libraries"""
+    if stage in ("nameSortDiscordants", "nameSortSplitters"):
+        records = inputs.disc if stage == "nameSortDiscordants" else inputs.split
+        return min(sortMemory, records*BAM_RECORD_BYTES)
+    if stage == "calcMeanSig":
+        return min(inputs.sample, STATS_RECORDS)/2*INSERT_LENGTH_BYTES
+    if stage == "writeDiscordantFragments" and ignoreBED is not None:
+        return tableBytes(inputs.genome/8)
+    if stage == "sortDiscordants":
+        return min(sortMemory, inputs.lines*(DISCORDANT_LINE_BYTES + LINE_OVERHEAD))
+    if stage == "formPEClusters":
+        block = (1 + inputs.maxNeighbours)*(FRAGMENT_BYTES +
+                                            inputs.meanNeighbours*PAIR_BYTES)
+        if threads == 1:
+            return block
+        # the fragment counts of the partitions, and a block per process
+        return inputs.lines*INSERT_LENGTH_BYTES + threads*(WORKER_BYTES + block)
+    if stage == "preserveSmallClusters":
+        return tableBytes(8*inputs.genome)
+    if stage == "consolidatePEClusters":
+        clusters = inputs.lines/(1 + inputs.meanNeighbours)
+        return tableBytes(PARSED_TABLE_FACTOR*clusters*CLUSTER_LINE_BYTES)
+    if stage == "addSplitReads" and ignoreBED is not None:
+        return tableBytes(inputs.genome/8)
+    if stage == "covPUFilter" and nhRegions is not None:
+        return tableBytes(inputs.genome/8)
+    return 0
+
+def planStages(inputs, threads, maxMemory, sortMemory, noCleanup,
+               minClusterSize, ignoreBED, nhRegions):
+    """(stage, wall seconds, peak bytes) of every stage of a run"""
+    setMemoryBudget(maxMemory)
+    if maxMemory is not None:
+        sortMemory = min(sortMemory, maxMemory)
+    units = stageUnits(inputs)
+    parallel = threads > 1 and minClusterSize >= 2
+    libraries = 0
+    stages = []
+    for stage, start, costs in STAGE_COSTS:
+        if not stageRuns(stage, inputs, noCleanup, minClusterSize):
+            continue
+        wall = 1e-6*sum(units[x]*cost for x, cost in costs.items())
+        if stage in BAM_STAGES:
+            wall *= 1 - BGZF_SHARE + BGZF_SHARE/threads
+        if stage == "formPEClusters":
+            if parallel:
+                wall *= max(inputs.largestShare, 1.0/threads)
+            libraries = LIBRARY_BYTES
+        memory = stageMemory(stage, inputs, threads if parallel else 1,
+                             ignoreBED, nhRegions, sortMemory)
+        stages.append((stage, start + wall, int(BASE_BYTES + libraries + memory)))
+    setMemoryBudget(None)
+    return stages
+
+def planRun(inputs, cores, memory, noCleanup, minClusterSize, ignoreBED,
+            nhRegions):
+    """The stages of the recommended run and its --threads, --max-mem and
+    --sort-mem (None where SVXplorer's default is recommended, sizes in
+    bytes). A memory budget is only recommended if the run would not fit in
+    memory without one, and --sort-mem is raised to sort the discordants in
+    memory if that fits."""
+    options = (noCleanup, minClusterSize, ignoreBED, nhRegions)
+    sortMemory = DEFAULT_SORT_MEMORY
+    need = inputs.lines*(DISCORDANT_LINE_BYTES + LINE_OVERHEAD)
+    if need > sortMemory and (memory is None or
+                              BASE_BYTES + LIBRARY_BYTES + need <= memory):
+        sortMemory = need
+    maxMemory = None
+    if memory is not None and \
+       max(x[2] for x in planStages(inputs, 1, None, sortMemory, *options)) > memory:
+        maxMemory = memory
+
+    plans = []
+    for threads in range(1, cores + 1):
+        stages = planStages(inputs, threads, maxMemory, sortMemory, *options)
+        if threads > 1 and memory is not None and max(x[2] for x in stages) > memory:
+            break
+        plans.append((sum(x[1] for x in stages), threads, stages))
+    fastest = min(x[0] for x in plans)
+    wall, threads, stages = [x for x in plans if x[0] <= (1 + THREAD_GAIN)*fastest][0]
+    if sortMemory == DEFAULT_SORT_MEMORY:
+        sortMemory = None
+    return stages, threads, maxMemory, sortMemory
+
+if __name__ == "__main__":
+    PARSER = ap.ArgumentParser(description="""
+    Predict the wall time and peak memory of every stage of an SVXplorer run
+    from the BAM indices, headers and a sample of the records, and recommend
+    the --threads, --max-mem and --sort-mem to run it with. The input files
+    and the options that change the plan are given as for SVXplorer.""",
+    formatter_class=ap.ArgumentDefaultsHelpFormatter)
+    PARSER.add_argument('-x', action='store_true', help='the run does not use cluster cleanup, as for SVXplorer')
+    PARSER.add_argument('-z', default=3, dest='minClusterSize', type=int, help='minimum fragment support of clusters, as for SVXplorer')
+    PARSER.add_argument('-i', default=None, help='exclude regions in BED format, as for SVXplorer')
+    PARSER.add_argument('-m', default=None, help='mappable intervals in BED format, as for SVXplorer')
+    PARSER.add_argument('--cores', default=cpu_count(), type=int, help='cores available to the run')
+    PARSER.add_argument('--mem', default=None, type=int, help='memory in MB available to the run')
+    PARSER.add_argument('-n', default=100000, dest='sampleSize', type=int, help='records sampled from every BAM file')
+    PARSER.add_argument('-o', default=None, dest='planFile', help='also write the plan to this file as JSON')
+    PARSER.add_argument('disc', nargs='?', help='bam file of discordant pairs, as for SVXplorer')
+    PARSER.add_argument('split', nargs='?', help='bam file of split reads, as for SVXplorer')
+    PARSER.add_argument('samplebam', help='bam file of alignments, coordinate-sorted and indexed for the best estimates')
+    PARSER.add_argument('reference', nargs='?', help='path to reference genome, as for SVXplorer; it is not read')
+    # an SVXplorer command line can be planned as it is; its other options are
+    # accepted and do not change the plan
+    IGNORED = PARSER.add_argument_group('SVXplorer options that do not change the plan',
+        '-c -w -s -q --preview --threads --stage-jobs --sort-mem --max-mem --regions --shard --update --previous-i --previous-c --sweep -d -f -l -u --resume --subsample --stream --in-memory --count-records')
+    for option in ['-c', '-w', '-s', '-q', '--preview', '--threads',
+                   '--stage-jobs', '--sort-mem', '--max-mem', '--regions',
+                   '--shard', '--update', '--previous-i', '--previous-c', '--sweep']:
+        IGNORED.add_argument(option, help=ap.SUPPRESS)
+    for option in ['-d', '-f', '-l', '-u', '--resume', '--subsample', '--stream',
+                   '--in-memory', '--count-records']:
+        IGNORED.add_argument(option, action='store_true', help=ap.SUPPRESS)
+    ARGS = PARSER.parse_args()
+    # two files are the sample bam file and the reference, as for SVXplorer
+    # when it extracts the evidence itself
+    if ARGS.split is None and ARGS.disc is not None and ARGS.reference is None:
+        ARGS.disc, ARGS.samplebam, ARGS.reference = None, ARGS.disc, ARGS.samplebam
+    if ARGS.split is None and ARGS.disc is not None:
+        PARSER.error("provide both the discordant and the split reads bam files, or neither")
+    if ARGS.disc == "-":
+        PARSER.error("the discordants are sampled from their file, not from stdin")
+
+    INPUTS = runInputs(ARGS.disc, ARGS.split, ARGS.samplebam, ARGS.sampleSize)
+    MEMORY = ARGS.mem*MB if ARGS.mem is not None else None
+    STAGES, THREADS, MAX_MEMORY, SORT_MEMORY = planRun(INPUTS, max(1, ARGS.cores),
+        MEMORY, ARGS.x, ARGS.minClusterSize, ARGS.i, ARGS.m)
+
+    print "\t".join(["stage", "wall_s", "peak_mb"])
+    for stage, wall, peak in STAGES:
+        print "%s\t%.1f\t%d" % (stage, wall, peak/MB)
+    WALL = sum(x[1] for x in STAGES)
+    PEAK = max(x[2] for x in STAGES)
+    print "%s\t%.1f\t%d" % ("total", WALL, PEAK/MB)
+    OPTIONS = ["--threads", str(THREADS)]
+    if MAX_MEMORY is not None:
+        OPTIONS += ["--max-mem", str(MAX_MEMORY/MB)]
+    if SORT_MEMORY is not None:
+        OPTIONS += ["--sort-mem", str(SORT_MEMORY/MB + 1)]
+    print "options\t%s" % " ".join(OPTIONS)
+    if MEMORY is not None and PEAK > MEMORY:
+        print >> sys.stderr, "The run is predicted to need %d MB, more than the %d MB available" % (PEAK/MB, ARGS.mem)
+
+    if ARGS.planFile is not None:
+        with open(ARGS.planFile, "w") as fp:
+            json.dump({"inputs": INPUTS.summary(), "options": OPTIONS,
+                       "wall_s": round(WALL, 1), "peak_mb": PEAK/MB,
+                       "stages": [{"name": x[0], "wall_s": round(x[1], 1),
+                                   "peak_mb": x[2]/MB} for x in STAGES]},
+                      fp, indent=1, sort_keys=True)
@@ -0,0 +1,164 @@
+import argparse
+import logging
+import heapq
+import numpy as np
+from array import array
+from bisect import bisect_right
+from shared import openFile, withinMemoryBudget, runContext, openBAM, \
+                   previewKeeps, splitReadFragment
+
+#gloabl
+SVHashPE = {}
+
+class varNumSegments(object):
+    """Cluster numbers assigned to slices of a chromosome, read like a
+    numpy array of its length (later assignments overwrite earlier ones),
+    but stored as sorted segments of equal number"""
+    def __init__(self, length):
+        self.length = length
+        self.assigned = []
+        self.starts = None
+        self.values = None
+
+    def __setitem__(self, index, value):
+        start, stop, _ = index.indices(self.length)
+        if stop > start:
+            self.assigned.append((start, stop, value))
+            self.starts = None
+
+    def segment(self):
+        # sweep the boundaries keeping the assignments that cover them, the
+        # latest assignment on top
+        order = sorted(range(len(self.assigned)), key=lambda i: self.assigned[i][0])
+        bounds = sorted(set([x[0] for x in self.assigned] + [x[1] for x in self.assigned]))
+        self.starts, self.values = array('l'), []
+        covering = []
+        k = 0
+        for pos in bounds:
+            while k < len(order) and self.assigned[order[k]][0] <= pos:
+                start, stop, value = self.assigned[order[k]]
+                heapq.heappush(covering, (-order[k], stop, value))
+                k += 1
+            while covering and covering[0][1] <= pos:
+                heapq.heappop(covering)
+            value = covering[0][2] if covering else 0
+            if not self.values or value != self.values[-1]:
+                self.starts.append(pos)
+                self.values.append(value)
+
+    def __getitem__(self, pos):
+        if pos < 0:
+            pos += self.length
+        if not 0 <= pos < self.length:
+            raise IndexError("varNumSegments index out of range")
+        if self.starts is None:
+            self.segment()
+        i = bisect_right(self.starts, pos) - 1
+        return self.values[i] if i >= 0 else 0
+
+def formExcludeHashVN(clusterFile, lengths):
+    logging.info('Started reading PE clusters for small cluster preservation')
+    global SVHashPE
+    # one float per base of a chromosome, unless that exceeds the budget
+    compact = not withinMemoryBudget(8*sum(lengths.values()))
+    fCl=openFile(clusterFile, "r")
+    for line in fCl:
+        line_s = line.split()
+        varNum = int(line_s[0])
+        currentTID1 = line_s[3]
+        currentTID2 = line_s[6]
+        if currentTID1 not in SVHashPE:
+            SVHashPE[currentTID1] = varNumSegments(lengths[currentTID1]) if compact \
+                                    else np.zeros(lengths[currentTID1])
+        if currentTID2 not in SVHashPE:
+            SVHashPE[currentTID2] = varNumSegments(lengths[currentTID2]) if compact \
+                                    else np.zeros(lengths[currentTID2])
+        SVHashPE[currentTID1][int(line_s[4]):int(line_s[5])] = varNum
+        SVHashPE[currentTID2][int(line_s[7]):int(line_s[8])] = varNum
+    logging.info('Finished forming PE cluster hash table')
+    fCl.close()
+
+def preserveSmallClusters(bamfileSR, clusterFile, mapThresh, preserveSize, slop,
+                          wdir, context=None, preview=1.0):
+    # a preview counts the split reads of the fragments it keeps
+    if context is None:
+        context = runContext()
+    chrLengths = context.chromosomeLengths(bamfileSR)
+    global SVHashPE
+    bamfileSRH = openBAM(bamfileSR,"rb")
+    iObjects = []
+    formExcludeHashVN(clusterFile, chrLengths)
+    sizeAddition = {}
+    counter = 0
+    while True:
+        try:
+            sr1 = bamfileSRH.next()
+            sr2 = bamfileSRH.next()
+        except StopIteration:
+            break
+        if counter % 500 == 0:
+            logging.debug("Done with %s SRs", counter)
+        counter+= 1
+
+        if sr1.qname == sr2.qname:
+            if not previewKeeps(splitReadFragment(sr1.qname), preview):
+                continue
+            sr_bp1 = sr1.reference_start
+            sr_bp2 = sr2.reference_start
+            sr_bp1_tid = sr1.reference_name
+            sr_bp2_tid = sr2.reference_name
+
+            # ignore marked chromosomes
+            if sr1.mapping_quality < mapThresh or sr2.mapping_quality < mapThresh:
+                continue
+
+            match = 0
+            bp, bp2 = sr_bp1, sr_bp2
+            tid, tid_2 = sr_bp1_tid, sr_bp2_tid
+
+            if (tid in SVHashPE) and (tid_2 in SVHashPE) and \
+                SVHashPE[tid][bp] != 0 and SVHashPE[tid][bp] == SVHashPE[tid_2][bp2]:
+                match = 1
+            
+            #store changed size as value of hash
+            if match:
+                varNum = SVHashPE[tid][bp] 
+                if varNum not in sizeAddition:
+                    sizeAddition[varNum] = 1
+                else:    
+                    sizeAddition[varNum]+= 1
+
+    bamfileSRH.close()
+    fCl = openFile(clusterFile,"r")
+    fClw = openFile(clusterFile + ".p", "w")
+
+    for line in fCl:
+        line_split = line.split()
+        clSize, varNum = int(line_split[1]), int(line_split[0])
+        if varNum in sizeAddition:
+            clSize+= sizeAddition[varNum]
+        if clSize >= preserveSize:
+            #write to file
+            fClw.write("%s" %line)
+    fCl.close()
+    fClw.close()
+
+if __name__=="__main__":
+
+    PARSER = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+                                    description='Preserve low-support PE clusters if SRs support them as well')
+    PARSER.add_argument('clusterFile', help='file containing all discordant clusters')
+    PARSER.add_argument('splitBAM', help='file containing name-sorted split reads')
+    PARSER.add_argument('mapThresh', help='mapping quality threshold for split reads')
+    PARSER.add_argument('preserveSize', help='minimum preserve size for PE clusters after SR support addition')
+    PARSER.add_argument('wdir', help='working directory')
+    PARSER.add_argument('--preview', default=1.0, type=float,
+        help='Fraction of the fragments kept, chosen by a hash of their names')
+    ARGS = PARSER.parse_args()
+    logging.basicConfig(filename='%s/run.log' % ARGS.wdir,
+                                level=logging.INFO,
+                                format='%(asctime)s %(levelname)s %(message)s',
+                                datefmt='%m/%d/%Y %I:%M:%S %p',
+                                filemode='w')
+    preserveSmallClusters(ARGS.splitBAM, ARGS.clusterFile, int(ARGS.mapThresh), int(ARGS.preserveSize), 0, ARGS.wdir,
+                          preview=ARGS.preview)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+# Run SVXplorer on a cohort of samples against the same reference. The
+# reference-level structures (exclude and mappability hash tables, reference
+# sequence names) are built once, and the samples run concurrently in forked
+# processes that share them read-only.
+import argparse as ap
+import logging
+import runpy
+import sys
+import time
+from multiprocessing import Process
+from os.path import dirname, realpath, join
+import pysam
+from shared import useReferenceCache, readReferenceNames, readChromosomeLengths, \
+                   excludeHash, setMemoryBudget, cachedReference, lengthsKey
+from covPUFilter import goodRegionsHash
+
+# the driver run for every sample
+DRIVER = join(dirname(realpath(__file__)), "SVXplorer")
+# alignments read to estimate the read length of a sample
+READ_LENGTH_SAMPLE = 100000
+# same criterion as the BAM statistics of writeDiscordantFragments
+AS_CALC_THRESH = .999
+
+def readSamples(manifestFile):
+    """Samples listed one per line as: workDir [discordants splitters] sampleBAM
+    Outputs:
+        list of (workDir, list of BAM files)
+    Raises ValueError on a malformed line.
+    """
+    samples = []
+    with open(manifestFile, "r") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            line_s = line.split()
+            if len(line_s) not in (2, 4):
+                raise ValueError("Expected 2 or 4 columns in manifest line: %s" % line.strip())
+            samples.append((line_s[0], line_s[1:]))
+    return samples
+
+def readManifest(manifestFile):
+    try:
+        return readSamples(manifestFile)
+    except ValueError as error:
+        print >> sys.stderr, error
+        exit(1)
+
+def estimateReadLength(bamName):
+    """Mean query length of the first concordant alignments, as computed for
+    the BAM statistics; None if there are none"""
+    bamfile = pysam.AlignmentFile(bamName, "rb")
+    summedQL, counterRead = 0, 0
+    for counterLoop, m1 in enumerate(bamfile):
+        if counterRead >= READ_LENGTH_SAMPLE or counterLoop >= 2*READ_LENGTH_SAMPLE:
+            break
+        if m1.is_proper_pair and not m1.is_secondary and \
+           not m1.is_supplementary and \
+           m1.get_tag("AS") > AS_CALC_THRESH*m1.infer_query_length() and \
+           m1.template_length > 0:
+            summedQL += m1.infer_query_length()
+            counterRead += 1
+    bamfile.close()
+    if counterRead == 0:
+        return None
+    return summedQL/counterRead
+
+def buildReferenceCache(reference, samples, ignoreBED, nhRegions):
+    """Build the structures every sample needs, for each distinct set of
+    chromosome lengths and read length in the cohort. A sample whose read
+    length differs from the estimate builds its own copy. The reference cache
+    must be on; structures it already holds are not built again."""
+    readReferenceNames(reference)
+    for workDir, bams in samples:
+        lengths = readChromosomeLengths(bams[-1])
+        rdl = estimateReadLength(bams[-1])
+        def build():
+            print >> sys.stderr, "Building reference structures for read length %s" % rdl
+            if ignoreBED is not None:
+                # addSplitReads uses no buffer, writeDiscordantFragments one read length
+                excludeHash(0, ignoreBED, lengths)
+                if rdl is not None:
+                    excludeHash(rdl, ignoreBED, lengths)
+            if nhRegions is not None and rdl is not None:
+                goodRegionsHash(nhRegions, float(rdl), lengths)
+            return True
+        cachedReference(("sampleStructures", ignoreBED, nhRegions,
+                         lengthsKey(lengths), rdl), build)
+
+def runSample(argv):
+    # the driver configures logging to the run.log of the sample
+    logging.root.handlers = []
+    sys.argv = argv
+    runpy.run_path(DRIVER, run_name="__main__")
+
+def waitForSample(running, failed):
+    while True:
+        for workDir, process in running:
+            if not process.is_alive():
+                process.join()
+                if process.exitcode != 0:
+                    failed.append(workDir)
+                print >> sys.stderr, "Finished %s (exit code %d)" % (workDir, process.exitcode)
+                return [x for x in running if x[1] is not process]
+        time.sleep(0.5)
+
+def sampleOptions(ignoreBED, nhRegions, options):
+    """SVXplorer options of every sample"""
+    sharedOptions = list(options)
+    if ignoreBED is not None:
+        sharedOptions += ['-i', ignoreBED]
+    if nhRegions is not None:
+        sharedOptions += ['-m', nhRegions]
+    return sharedOptions
+
+def runBatch(manifestFile, reference, jobs, ignoreBED, nhRegions, options):
+    """Run the samples of the manifest, at most jobs at a time, with the
+    SVXplorer options given. Returns the work directories of failed samples."""
+    samples = readManifest(manifestFile)
+    useReferenceCache()
+    buildReferenceCache(reference, samples, ignoreBED, nhRegions)
+
+    sharedOptions = sampleOptions(ignoreBED, nhRegions, options)
+
+    running = []
+    failed = []
+    for workDir, bams in samples:
+        while len(running) >= jobs:
+            running = waitForSample(running, failed)
+        argv = [DRIVER] + bams + [reference, '-w', workDir] + sharedOptions
+        process = Process(target=runSample, args=(argv,))
+        process.start()
+        print >> sys.stderr, "Started %s" % workDir
+        running.append((workDir, process))
+    while running:
+        running = waitForSample(running, failed)
+    return failed
+
+if __name__ == "__main__":
+    PARSER = ap.ArgumentParser(description="""
+    Run SVXplorer on every sample of a manifest, sharing the reference-level
+    structures between them. Options not listed here are passed to SVXplorer
+    for every sample.""", formatter_class=ap.ArgumentDefaultsHelpFormatter)
+    PARSER.add_argument('manifest', help='file listing one sample per line as: workDir [discordants.bam splitters.bam] sample.bam')
+    PARSER.add_argument('reference', help='path to reference genome')
+    PARSER.add_argument('-j', '--jobs', default=1, type=int, help='number of samples run concurrently')
+    PARSER.add_argument('-i', default=None, help='exclude regions in BED format, as for SVXplorer')
+    PARSER.add_argument('-m', default=None, help='non-homologous regions in BED format, as for SVXplorer')
+    PARSER.add_argument('--max-mem', default=None, type=int, help='memory budget in MB of every sample, as for SVXplorer; also applies to the shared tables')
+    ARGS, OPTIONS = PARSER.parse_known_args()
+    if ARGS.max_mem is not None:
+        setMemoryBudget(ARGS.max_mem*1024*1024)
+        OPTIONS += ['--max-mem', str(ARGS.max_mem)]
+
+    FAILED = runBatch(ARGS.manifest, ARGS.reference, ARGS.jobs, ARGS.i, ARGS.m, OPTIONS)
+    if FAILED:
+        print >> sys.stderr, "Failed samples: %s" % " ".join(FAILED)
+        exit(1)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+# Serve SVXplorer jobs from a spool directory. The stage modules and their
+# libraries are imported once and the reference-level structures (reference
+# sequence names, exclude and mappability hash tables) are kept for the life of
+# the server, so that a job is left with the work of its own samples. Every
+# sample runs in a forked process that shares them read-only, at most -j at a
+# time.
+#
+# A job is a file named NAME.job in the spool directory, listing one sample per
+# line as in a runBatch.py manifest. It is renamed to NAME.running when it is
+# picked up, and to NAME.done or NAME.failed when its samples have finished,
+# with the exit code of every sample appended. A file named "stop" in the
+# spool directory stops the server once the jobs it has picked up are done,
+# and is removed.
+import argparse as ap
+import importlib
+import sys
+import time
+from multiprocessing import Process
+from os import listdir, rename, remove
+from os.path import exists, join
+from shared import useReferenceCache, readReferenceNames, setMemoryBudget
+from runBatch import DRIVER, readSamples, buildReferenceCache, sampleOptions, \
+                     runSample
+
+# modules the driver would import for every job
+WARM_MODULES = ["writeDiscordantFragments", "formPEClusters",
+                "consolidatePEClusters", "uniqueSuppFilter", "writeBEDs",
+                "writeVCF", "addSplitReads", "covPUFilter",
+                "markDuplicateClusterRegions", "pickBestCluster",
+                "preserveSmallClusters", "checkpoint", "extsort",
+                "extractEvidence", "metrics", "networkx", "sklearn.cluster"]
+JOB_SUFFIX = ".job"
+STOP_FILE = "stop"
+
+class spoolJob(object):
+    """A job file and the samples of it that have not finished"""
+    def __init__(self, spoolDir, name):
+        self.name = name
+        self.path = join(spoolDir, name)
+        self.pending = 0
+        self.exitCodes = []
+
+    def finish(self, workDir, exitCode):
+        self.exitCodes.append((workDir, exitCode))
+        self.pending -= 1
+
+    def close(self, message=None):
+        """Record the exit codes and rename the job file to .done or .failed"""
+        failed = message is not None or any(x[1] != 0 for x in self.exitCodes)
+        with open(self.path, "a") as f:
+            if message is not None:
+                print >> f, "# %s" % message
+            for workDir, exitCode in self.exitCodes:
+                print >> f, "# exit code %d: %s" % (exitCode, workDir)
+        status = "failed" if failed else "done"
+        rename(self.path, self.path[:-len(".running")] + "." + status)
+        print >> sys.stderr, "Job %s %s" % (self.name, status)
+
+def warmImports():
+    """Import the modules the jobs use, so that the forked samples find them
+    loaded"""
+    for module in WARM_MODULES:
+        importlib.import_module(module)
+
+def claimJobs(spoolDir):
+    """Rename the new job files to .running, oldest name first"""
+    jobs = []
+    for name in sorted(listdir(spoolDir)):
+        if name.endswith(JOB_SUFFIX):
+            running = name[:-len(JOB_SUFFIX)] + ".running"
+            rename(join(spoolDir, name), join(spoolDir, running))
+            jobs.append(spoolJob(spoolDir, running))
+    return jobs
+
+def reapSamples(running):
+    """Running samples left after recording those that have finished"""
+    left = []
+    for job, workDir, process, started in running:
+        if process.is_alive():
+            left.append((job, workDir, process, started))
+            continue
+        process.join()
+        print >> sys.stderr, "Finished %s (exit code %d) in %.1fs" % \
+            (workDir, process.exitcode, time.time() - started)
+        job.finish(workDir, process.exitcode)
+        if job.pending == 0:
+            job.close()
+    return left
+
+def serveJobs(spoolDir, reference, workers, ignoreBED, nhRegions, options, poll):
+    """Run the jobs of spoolDir until it holds a stop file"""
+    warmImports()
+    useReferenceCache()
+    readReferenceNames(reference)
+    sharedOptions = sampleOptions(ignoreBED, nhRegions, options)
+    print >> sys.stderr, "Serving jobs from %s" % spoolDir
+
+    queue = []
+    running = []
+    while True:
+        stopping = exists(join(spoolDir, STOP_FILE))
+        if not stopping:
+            for job in claimJobs(spoolDir):
+                try:
+                    samples = readSamples(job.path)
+                    # structures are only built for read lengths and
+                    # chromosome sets not seen before
+                    buildReferenceCache(reference, samples, ignoreBED, nhRegions)
+                except (IOError, ValueError) as error:
+                    job.close(str(error))
+                    continue
+                if not samples:
+                    job.close()
+                    continue
+                job.pending = len(samples)
+                queue += [(job, workDir, bams) for workDir, bams in samples]
+
+        while queue and len(running) < workers:
+            job, workDir, bams = queue.pop(0)
+            argv = [DRIVER] + bams + [reference, '-w', workDir] + sharedOptions
+            process = Process(target=runSample, args=(argv,))
+            process.start()
+            print >> sys.stderr, "Started %s" % workDir
+            running.append((job, workDir, process, time.time()))
+
+        if stopping and not queue and not running:
+            break
+        time.sleep(poll)
+        running = reapSamples(running)
+    remove(join(spoolDir, STOP_FILE))
+    print >> sys.stderr, "Stopped serving jobs from %s" % spoolDir
+
+if __name__ == "__main__":
+    PARSER = ap.ArgumentParser(description="""
+    Serve SVXplorer jobs placed in a spool directory as NAME.job files, each
+    listing samples as in a runBatch.py manifest, keeping the stage modules
+    and the reference-level structures loaded between jobs. Options not
+    listed here are passed to SVXplorer for every sample.""",
+    formatter_class=ap.ArgumentDefaultsHelpFormatter)
+    PARSER.add_argument('spoolDir', help='directory polled for NAME.job files; a file named "stop" in it stops the server')
+    PARSER.add_argument('reference', help='path to reference genome')
+    PARSER.add_argument('-j', '--jobs', default=1, type=int, help='number of samples run concurrently')
+    PARSER.add_argument('-i', default=None, help='exclude regions in BED format, as for SVXplorer')
+    PARSER.add_argument('-m', default=None, help='non-homologous regions in BED format, as for SVXplorer')
+    PARSER.add_argument('--max-mem', default=None, type=int, help='memory budget in MB of every sample, as for SVXplorer; also applies to the shared tables')
+    PARSER.add_argument('--poll', default=1.0, type=float, help='seconds between looks at the spool directory')
+    ARGS, OPTIONS = PARSER.parse_known_args()
+    if ARGS.max_mem is not None:
+        setMemoryBudget(ARGS.max_mem*1024*1024)
+        OPTIONS += ['--max-mem', str(ARGS.max_mem)]
+
+    serveJobs(ARGS.spoolDir, ARGS.reference, ARGS.jobs, ARGS.i, ARGS.m, OPTIONS, ARGS.poll)
@@ -0,0 +1,758 @@
+import io
+import zlib
+from array import array
+from bisect import bisect_right
+from os.path import normpath, abspath, getsize, exists
+from sys import stderr
+import numpy as np
+import pysam as ps
+from bitarray import bitarray
+
+# Memory budget in bytes, set by setMemoryBudget() (--max-mem). Tables whose
+# estimated size exceeds it are built in their compact or on-disk variants,
+# and in-memory intermediate files beyond it are written to disk.
+MEMORY_BUDGET = None
+
+def setMemoryBudget(maxBytes):
+    global MEMORY_BUDGET
+    MEMORY_BUDGET = maxBytes
+
+def withinMemoryBudget(estimate):
+    """Whether a table estimated to take estimate bytes fits in the budget"""
+    return MEMORY_BUDGET is None or estimate <= MEMORY_BUDGET
+
+# Threads used by htslib to decompress and compress the BAM files read and
+# written with openBAM(), and by nameSortBAM(); set by setBAMThreads()
+# (--threads).
+BAM_THREADS = 1
+
+def setBAMThreads(threads):
+    global BAM_THREADS
+    BAM_THREADS = max(1, threads)
+
+def openBAM(fileName, mode="rb", **kwargs):
+    """pysam.AlignmentFile with the BGZF threads of the run"""
+    return ps.AlignmentFile(fileName, mode, threads=BAM_THREADS, **kwargs)
+
+def nameSortBAM(inName, outName, tmpPrefix, memory=None):
+    """Name sort inName to outName with the threads of the run, using at most
+    memory bytes for all of them if given"""
+    options = ["-n", "-O", "bam", "-@", str(BAM_THREADS - 1), "-T", tmpPrefix]
+    if memory is not None:
+        options += ["-m", "%dM" % max(1, memory/BAM_THREADS/(1024*1024))]
+    ps.sort(*(options + ["-o", outName, inName]))
+
+# Intermediate text files handed from one stage to the next. When enabled by
+# useMemoryFiles(), files opened for writing with openFile() are kept here,
+# keyed by path, instead of being written to disk, and later openFile() calls
+# read them back from memory. They are held within the memory budget, or
+# within MEMORY_FILES_BUDGET without one; a file that would exceed it is
+# written to disk instead.
+MEMORY_FILES = None
+DEFAULT_MEMORY_FILES_BUDGET = 1024*1024*1024
+MEMORY_FILES_BUDGET = DEFAULT_MEMORY_FILES_BUDGET
+# The largest tables can also be handed on as the records their stage forms,
+# without formatting and parsing them, when enabled by useMemoryFiles(). They
+# are kept here as (records, formatRecord) keyed by path, and are formatted as
+# text by formatRecord only when a stage opens the file with openFile().
+MEMORY_RECORDS = None
+# estimated bytes of a record held in memory, for the budget
+RECORD_BYTES = 300
+
+class memoryFile(object):
+    """Text file held in memory, registered under its path when closed. Once
+    it grows beyond room bytes it is written to disk instead."""
+    def __init__(self, name, room, content=""):
+        self.name = name
+        self.room = room
+        self.buffer = io.BytesIO()
+        self.buffer.write(content)
+        self.disk = None
+        self.closed = False
+
+    def write(self, data):
+        if self.disk is None and self.buffer.tell() + len(data) > self.room:
+            self.disk = open(self.name, "w")
+            self.disk.write(self.buffer.getvalue())
+            self.buffer.close()
+        (self.disk or self.buffer).write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def close(self):
+        if self.closed:
+            return
+        if self.disk is None:
+            MEMORY_FILES[self.name] = self.buffer.getvalue()
+            self.buffer.close()
+        else:
+            self.disk.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def useMemoryFiles(enable=True, budget=DEFAULT_MEMORY_FILES_BUDGET,
+                   records=False):
+    global MEMORY_FILES
+    global MEMORY_FILES_BUDGET
+    global MEMORY_RECORDS
+    MEMORY_FILES_BUDGET = budget
+    MEMORY_FILES = {} if enable else None
+    MEMORY_RECORDS = {} if enable and records else None
+
+def memoryFilesRoom():
+    """Bytes left for in-memory files"""
+    budget = MEMORY_BUDGET if MEMORY_BUDGET is not None else MEMORY_FILES_BUDGET
+    used = sum(len(x) for x in MEMORY_FILES.itervalues())
+    if MEMORY_RECORDS:
+        used += RECORD_BYTES*sum(len(x[0]) for x in MEMORY_RECORDS.itervalues())
+    return budget - used
+
+def heldAsRecords(fileName):
+    return MEMORY_RECORDS is not None and normpath(fileName) in MEMORY_RECORDS
+
+def memoryRecords(fileName):
+    """Records held for fileName, or None if it is held as text"""
+    if not heldAsRecords(fileName):
+        return None
+    return MEMORY_RECORDS[normpath(fileName)][0]
+
+def takeRecords(fileName):
+    """(records, formatRecord) held for fileName, which is no longer held, or
+    None if it is held as text"""
+    if not heldAsRecords(fileName):
+        return None
+    return MEMORY_RECORDS.pop(normpath(fileName))
+
+def handRecords(fileName, records, formatRecord):
+    """Hold records as the content of fileName"""
+    name = normpath(fileName)
+    MEMORY_FILES.pop(name, None)
+    MEMORY_RECORDS[name] = (records, formatRecord)
+
+def formatRecords(fileName):
+    """Replace the records held for fileName by their text"""
+    records, formatRecord = takeRecords(fileName)
+    with openFile(fileName, "w") as f:
+        for record in records:
+            f.write(formatRecord(record))
+    noteRecords(fileName, len(records))
+
+class recordFile(object):
+    """Table written one record at a time. With records enabled by
+    useMemoryFiles() the records are held as they are while they fit in the
+    budget; otherwise, and beyond it, formatRecord(record) is written."""
+    def __init__(self, fileName, formatRecord):
+        self.fileName = fileName
+        self.formatRecord = formatRecord
+        self.records = None
+        self.f = None
+        self.count = 0
+        if MEMORY_RECORDS is not None:
+            MEMORY_FILES.pop(normpath(fileName), None)
+            MEMORY_RECORDS.pop(normpath(fileName), None)
+            self.records = []
+            self.room = memoryFilesRoom()/RECORD_BYTES
+        else:
+            self.f = openFile(fileName, "w")
+
+    def toText(self):
+        if self.records is not None:
+            self.f = openFile(self.fileName, "w")
+            for record in self.records:
+                self.f.write(self.formatRecord(record))
+            self.records = None
+
+    def write(self, record):
+        self.count += 1
+        if self.records is None:
+            self.f.write(self.formatRecord(record))
+            return
+        self.records.append(record)
+        if len(self.records) > self.room:
+            self.toText()
+
+    def writelines(self, lines):
+        """Write lines of text; the table is held as text from then on"""
+        self.toText()
+        self.f.writelines(lines)
+        self.count += len(lines)
+
+    def close(self):
+        if self.records is not None:
+            handRecords(self.fileName, self.records, self.formatRecord)
+            self.records = None
+        elif self.f is not None:
+            self.f.close()
+            self.f = None
+            noteRecords(self.fileName, self.count)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def openFile(fileName, mode="r"):
+    """open() for intermediate files that may be handed over in memory"""
+    if MEMORY_FILES is None:
+        return open(fileName, mode)
+    name = normpath(fileName)
+    if heldAsRecords(name):
+        if mode.startswith("w"):
+            MEMORY_RECORDS.pop(name)
+        else:
+            formatRecords(name)
+    if mode.startswith("r"):
+        if name in MEMORY_FILES:
+            return io.BytesIO(MEMORY_FILES[name])
+        return open(fileName, mode)
+    content = ""
+    if mode.startswith("a"):
+        if name not in MEMORY_FILES:
+            return open(fileName, mode)
+        content = MEMORY_FILES[name]
+    MEMORY_FILES.pop(name, None)
+    room = memoryFilesRoom()
+    # files beyond the memory budget are written to disk
+    if room <= len(content):
+        if content:
+            with open(fileName, "w") as f:
+                f.write(content)
+        return open(fileName, mode)
+    return memoryFile(name, room, content)
+
+def inMemory(fileName):
+    return MEMORY_FILES is not None and \
+        (normpath(fileName) in MEMORY_FILES or heldAsRecords(fileName))
+
+def memoryFileContent(fileName):
+    if heldAsRecords(fileName):
+        formatRecords(fileName)
+    if normpath(fileName) not in MEMORY_FILES:
+        with open(fileName, "r") as f:
+            return f.read()
+    return MEMORY_FILES[normpath(fileName)]
+
+def fileSize(fileName):
+    """Size in bytes of an intermediate file, in memory or on disk; None for
+    one held as records, which are not formatted to measure it"""
+    if heldAsRecords(fileName):
+        return None
+    if inMemory(fileName):
+        return len(memoryFileContent(fileName))
+    return getsize(fileName)
+
+# Number of records written to a file, with its size then, as noted by the
+# step that wrote it
+KNOWN_RECORDS = {}
+
+def noteRecords(fileName, count):
+    """Note that count records were written to fileName, so that they need
+    not be counted by reading it again"""
+    KNOWN_RECORDS[normpath(fileName)] = (count, fileSize(fileName))
+
+def knownRecords(fileName):
+    """Number of records of fileName if it is held as records or they were
+    noted, and it has not been rewritten to another size since; else None"""
+    if memoryRecords(fileName) is not None:
+        return len(memoryRecords(fileName))
+    noted = KNOWN_RECORDS.get(normpath(fileName))
+    if noted is None or not (inMemory(fileName) or exists(fileName)) or \
+       noted[1] != fileSize(fileName):
+        return None
+    return noted[0]
+
+class lineIndex(object):
+    """Lines of a table keyed by the integer in their first column. Only the
+    offsets of the lines are held; a lookup reads its line back and returns
+    parse(line)"""
+    def __init__(self, fileName, parse):
+        self.f = openFile(fileName, "r")
+        self.parse = parse
+        self.offsets = {}
+        offset = 0
+        for line in iter(self.f.readline, ""):
+            self.offsets[int(line.split(None, 1)[0])] = offset
+            offset = self.f.tell()
+
+    def __getitem__(self, key):
+        self.f.seek(self.offsets[key])
+        return self.parse(self.f.readline())
+
+    def close(self):
+        self.f.close()
+
+def writeMemoryFiles(fileNames=None):
+    """Write in-memory files (all of them by default) to disk"""
+    if MEMORY_FILES is None:
+        return
+    if fileNames is None:
+        fileNames = MEMORY_FILES.keys() + (MEMORY_RECORDS or {}).keys()
+    for fileName in fileNames:
+        if inMemory(fileName):
+            content = memoryFileContent(fileName)
+            with open(fileName, "w") as f:
+                f.write(content)
+
+def readRegions(regionsBED, padding=0):
+    """Read target regions from a BED file, pad them on both sides and merge
+    the ones that overlap
+    Outputs:
+        list of (chr, start, stop) regions sorted by chr and start
+    """
+    regions = []
+    with open(regionsBED, "r") as f:
+        for line in f:
+            if line.startswith("#") or line.startswith("track") or \
+               line.startswith("browser") or not line.strip():
+                continue
+            line_s = line.split()
+            regions.append((line_s[0], max(0, int(line_s[1]) - padding),
+                            int(line_s[2]) + padding))
+    regions.sort()
+    return mergeIntervals([x[0] for x in regions], [x[1] for x in regions],
+                          [x[2] for x in regions])
+
+def genomeShard(chromLengths, shard, shards):
+    """Regions of shard (numbered from 1) when the genome is cut into shards
+    pieces of equal length
+    Inputs:
+        chromLengths: (chr, length) of every chromosome in reference order
+    Outputs:
+        list of (chr, start, stop) regions
+    """
+    total = sum(length for _, length in chromLengths)
+    first, last = total*(shard - 1)//shards, total*shard//shards
+    regions = []
+    offset = 0
+    for chrom, length in chromLengths:
+        start, stop = max(first - offset, 0), min(last - offset, length)
+        if stop > start:
+            regions.append((chrom, start, stop))
+        offset += length
+    return regions
+
+def writeShardBED(shardFile, shard, shards, margin, regions):
+    """BED file of the regions of a shard, preceded by a line
+    "# shard K/N margin M" naming the shard and the margin of evidence read
+    around its regions"""
+    with open(shardFile, "w") as f:
+        print >> f, "# shard %d/%d margin %d" % (shard, shards, margin)
+        for region in regions:
+            print >> f, "%s\t%d\t%d" % region
+
+def readShardBED(shardFile):
+    """Shard number, number of shards, margin and regions of writeShardBED"""
+    with open(shardFile, "r") as f:
+        fields = f.readline().split()
+        shard, shards = map(int, fields[2].split("/"))
+        margin = int(fields[4])
+        regions = [(x.split()[0], int(x.split()[1]), int(x.split()[2])) for x in f]
+    return shard, shards, margin, regions
+
+def inRegions(chrom, pos, regions):
+    """Whether chrom:pos lies in one of the (chr, start, stop) regions"""
+    for regionChrom, start, stop in regions:
+        if chrom == regionChrom and start <= pos < stop:
+            return True
+    return False
+
+def fetchRegions(samfile, regions):
+    """Generator of the alignments of an indexed BAM file that overlap the
+    sorted, non-overlapping regions, each alignment returned once"""
+    references = set(samfile.references)
+    prevChr, prevStop = None, -1
+    for chrom, start, stop in regions:
+        if chrom not in references:
+            continue
+        for alignment in samfile.fetch(chrom, start, stop):
+            # alignments spanning two regions were returned for the first
+            if chrom == prevChr and alignment.reference_start < prevStop:
+                continue
+            yield alignment
+        prevChr, prevStop = chrom, stop
+
+def regionAlignments(samfile, regions):
+    """Alignments of an indexed BAM file that overlap the regions, together
+    with the other alignments of their queries found at the mate positions
+    and the supplementary (SA) positions
+    Outputs:
+        list of alignments in coordinate order
+    """
+    selected = {}
+    names = set()
+    matePositions = []
+    def addAlignment(alignment):
+        key = (alignment.query_name, alignment.flag, alignment.reference_id,
+               alignment.reference_start, alignment.cigarstring)
+        selected[key] = alignment
+
+    for alignment in fetchRegions(samfile, regions):
+        addAlignment(alignment)
+        names.add(alignment.query_name)
+        if alignment.is_paired and not alignment.mate_is_unmapped:
+            matePositions.append((alignment.next_reference_name,
+                                  alignment.next_reference_start))
+        if alignment.has_tag("SA"):
+            for entry in alignment.get_tag("SA").split(";"):
+                if entry:
+                    entry_s = entry.split(",")
+                    matePositions.append((entry_s[0], int(entry_s[1]) - 1))
+
+    matePositions.sort()
+    mateRegions = mergeIntervals([x[0] for x in matePositions],
+                                 [x[1] for x in matePositions],
+                                 [x[1] + 1 for x in matePositions])
+    for alignment in fetchRegions(samfile, mateRegions):
+        if alignment.query_name in names:
+            addAlignment(alignment)
+
+    # unmapped alignments without a position go last, as in a sorted file
+    return sorted(selected.values(),
+                  key=lambda x: (x.reference_id < 0, x.reference_id, x.reference_start))
+
+def writeRegionAlignments(bamName, regions, outName):
+    """Write the alignments of bamName selected by regionAlignments() to
+    outName; bamName must be coordinate-sorted and indexed"""
+    samfile = openBAM(bamName, "rb")
+    if not samfile.has_index():
+        print >> stderr, "Targeted regions need a coordinate-sorted and indexed BAM file: %s" % bamName
+        exit(1)
+    outfile = openBAM(outName, "wb", template=samfile)
+    alignments = regionAlignments(samfile, regions)
+    for alignment in alignments:
+        outfile.write(alignment)
+    outfile.close()
+    samfile.close()
+    return len(alignments)
+
+# Reference-level structures (exclude and mappability hash tables, reference
+# sequence names) built once and shared read-only by the samples of a batch
+# run. When enabled by useReferenceCache(), they are kept here keyed by the
+# files and parameters they were built from.
+REFERENCE_CACHE = None
+
+def useReferenceCache(enable=True):
+    """Turn the cache on, keeping what it holds if it is on already, or off"""
+    global REFERENCE_CACHE
+    if not enable:
+        REFERENCE_CACHE = None
+    elif REFERENCE_CACHE is None:
+        REFERENCE_CACHE = {}
+
+def cachedReference(key, build):
+    """Structure cached under key, built by build() if it is not cached yet"""
+    if REFERENCE_CACHE is None:
+        return build()
+    if key not in REFERENCE_CACHE:
+        REFERENCE_CACHE[key] = build()
+    return REFERENCE_CACHE[key]
+
+def lengthsKey(lengths):
+    return tuple(sorted(lengths.items()))
+
+def readReferenceNames(reference):
+    """Names of the sequences in the .fai index of the reference"""
+    def build():
+        with open("%s.fai" % reference, "r") as f:
+            return [line.split("\t")[0] for line in f if line.strip()]
+    return cachedReference(("fai", abspath(reference)), build)
+
+class bamStats(object):
+    """Library statistics of a sample, as written one per line to bamStats.txt
+    by calcMeanSig"""
+    def __init__(self, values):
+        self.rdl, self.mean_IL, self.sd_IL, self.coverage, self.max_IL, \
+            self.disc_thresh, self.dist_penalty, self.dist_end = values[:8]
+
+def readBamStats(statFile):
+    with openFile(statFile, 'r') as fStat:
+        return bamStats([float(line) for line in fStat])
+
+def readReadGroupStats(rgStatFile, rgBinFile):
+    """Read the statistics of the read groups written by writeDiscordantFragments
+    Outputs:
+        rg index -> (rdl, mean_IL, disc_thresh, dist_penalty, dist_end,
+                     IL_BinDistHash, IL_BinTotalEntries)
+    """
+    stats = {}
+    if rgStatFile is None or rgBinFile is None:
+        return stats
+    binHashes = {}
+    with openFile(rgBinFile, "r") as fp:
+        for line in fp:
+            rg, binDist, count = line.split()
+            binHashes.setdefault(int(rg), {})[int(binDist)] = float(count)
+    with openFile(rgStatFile, "r") as fp:
+        for line in fp:
+            parsed = line.split()
+            rg = int(parsed[0])
+            rgHash = binHashes.get(rg, {})
+            stats[rg] = (float(parsed[1]), float(parsed[2]), float(parsed[5]),
+                         float(parsed[7]), float(parsed[8]), rgHash,
+                         sum(rgHash.values()))
+    return stats
+
+def readGroupIndex(header):
+    """Index of every read group ID in a BAM header, if it has several read
+    groups; empty otherwise"""
+    readGroups = header.get('RG', [])
+    if len(readGroups) < 2:
+        return {}
+    return dict((rg['ID'], i) for i, rg in enumerate(readGroups))
+
+def findNumberMatches(cigartups):
+    nummatches = 0
+    if cigartups == None:
+        return 0
+    for op,oplen in cigartups:
+        if op in [0,7]:
+            nummatches += int(oplen)
+
+    return nummatches
+
+def mappedReferences(samfile):
+    """Names of the references with mapped reads in the index of a BAM file,
+    in header order, or of all references if it has no index statistics"""
+    try:
+        return [x.contig for x in samfile.get_index_statistics() if x.mapped > 0]
+    except ValueError:
+        return list(samfile.references)
+
+def readChromosomeLengths(bamfile):
+    lengths = {}
+    bfile = ps.Samfile(bamfile, 'rb')
+    for chrominfo in bfile.header['SQ']:
+        lengths[chrominfo['SN']] = chrominfo['LN']
+    bfile.close()
+    return lengths
+
+class runContext(object):
+    """What the stages of a run read once and share: the headers and
+    chromosome lengths of the BAM files, the library statistics and the region
+    tables. The driver passes one to every stage; a stage called on its own
+    reads what it needs into a context of its own."""
+    def __init__(self):
+        self.headers = {}
+        self.parsed = {}
+
+    def header(self, bamFile):
+        """Header of bamFile as a dict"""
+        if bamFile not in self.headers:
+            samfile = ps.AlignmentFile(bamFile, 'rb')
+            self.headers[bamFile] = samfile.header.to_dict()
+            samfile.close()
+        return self.headers[bamFile]
+
+    def chromosomeLengths(self, bamFile):
+        """Lengths of the chromosomes of bamFile by name, read once as an
+        assembly can have many thousands"""
+        return self.cached(("lengths", bamFile),
+                           lambda: dict((x['SN'], x['LN']) for x in self.header(bamFile)['SQ']))
+
+    def cached(self, key, build):
+        """Value cached under key, a tuple of a name and the files and
+        parameters it is read from, built by build() if it is not cached yet"""
+        if key not in self.parsed:
+            self.parsed[key] = build()
+        return self.parsed[key]
+
+    def bamStats(self, statFile):
+        return self.cached(("bamStats", statFile), lambda: readBamStats(statFile))
+
+    def readGroupStats(self, rgStatFile, rgBinFile):
+        return self.cached(("readGroupStats", rgStatFile, rgBinFile),
+                           lambda: readReadGroupStats(rgStatFile, rgBinFile))
+
+    def table(self, key, build):
+        """Reference-level table cached for the run, and shared with the other
+        samples of a batch when reference caching is on"""
+        return self.cached(key, lambda: cachedReference(key, build))
+
+    def forget(self, fileName):
+        """Drop what was read from fileName, as a stage has written it again"""
+        self.headers.pop(fileName, None)
+        for key in self.parsed.keys():
+            if fileName in key[1:]:
+                del self.parsed[key]
+
+def formExcludeHash(chrHash, ignoreBuffer, ignoreBED, lengths, context=None):
+    """Form double hash table containing chromosomes/genomic units and all corresponding
+    locations where alignments are to be excluded from analysis
+    Inputs:
+        ignoreBED: BED file --'chr start stop'-- containing regions to exclude
+        ignoreBuffer: additional buffer margin added to start and stop if desired
+    Outputs:
+        None
+    """
+    chrHash.update(excludeHash(ignoreBuffer, ignoreBED, lengths, context))
+    return chrHash
+
+def excludeHash(ignoreBuffer, ignoreBED, lengths, context=None):
+    """Hash table of formExcludeHash, shared by the stages given the same
+    context and by the samples of a batch when reference caching is on"""
+    def build():
+        fo=openFile(ignoreBED, "r")
+        table = markExcludeRegions({}, ignoreBuffer,
+                                   (line.split() for line in fo), lengths)
+        fo.close()
+        return table
+    key = ("exclude", abspath(ignoreBED), ignoreBuffer, lengthsKey(lengths))
+    if context is not None:
+        return context.table(key, build)
+    return cachedReference(key, build)
+
+class intervalMask(object):
+    """Marked positions of a chromosome, set and read like a bitarray of its
+    length but stored as sorted, merged intervals"""
+    def __init__(self, length):
+        self.length = length
+        self.marked = []
+        self.starts = array('l')
+        self.stops = array('l')
+
+    def __len__(self):
+        return self.length
+
+    def __setitem__(self, index, value):
+        if not isinstance(index, slice) or value != 1:
+            raise ValueError("intervalMask only marks slices")
+        start, stop, _ = index.indices(self.length)
+        if stop > start:
+            self.marked.append((start, stop))
+
+    def merge(self):
+        """Merge the newly marked slices into the sorted intervals"""
+        intervals = sorted(zip(self.starts, self.stops) + self.marked)
+        self.marked = []
+        self.starts, self.stops = array('l'), array('l')
+        for start, stop in intervals:
+            if len(self.stops) > 0 and start <= self.stops[-1]:
+                self.stops[-1] = max(self.stops[-1], stop)
+            else:
+                self.starts.append(start)
+                self.stops.append(stop)
+
+    def __getitem__(self, pos):
+        if pos < 0:
+            pos += self.length
+        if not 0 <= pos < self.length:
+            raise IndexError("intervalMask index out of range")
+        if self.marked:
+            self.merge()
+        i = bisect_right(self.starts, pos) - 1
+        return int(i >= 0 and pos < self.stops[i])
+
+def positionTable(length, compact=False):
+    """Table of the positions of a chromosome with none marked: a bitarray,
+    or an intervalMask if compact"""
+    if compact:
+        return intervalMask(length)
+    table = bitarray(length)
+    table.setall(0)
+    return table
+
+def compactPositionTables(lengths):
+    """Whether bitarrays of all chromosomes would exceed the memory budget"""
+    return not withinMemoryBudget(sum(lengths.values())/8)
+
+def markExcludeRegions(chrHash, ignoreBuffer, regions, lengths):
+    """Mark (chr, start, stop) regions in the hash table of formExcludeHash"""
+    compact = compactPositionTables(lengths)
+    for region in regions:
+        currentTID = region[0]
+        if currentTID not in chrHash and currentTID in lengths:
+            chrHash[currentTID] = positionTable(lengths[currentTID], compact)
+        if currentTID in chrHash:
+            start = int(region[1])-ignoreBuffer
+            stop = int(region[2])+ignoreBuffer
+            if stop > start:
+                chrHash[currentTID][start:stop] = 1
+    return chrHash
+
+def mergeIntervals(chroms, starts, stops, distance=0):
+    """Merge intervals sorted by chromosome and start, like "bedtools merge -d":
+    an interval is merged into the previous one on its chromosome if it starts
+    at most distance bases after the largest stop seen so far.
+    Inputs:
+        chroms, starts, stops: equally long sequences describing the intervals
+    Outputs:
+        list of merged (chr, start, stop) regions
+    """
+    merged = []
+    chroms = np.asarray(chroms)
+    starts = np.asarray(starts, dtype=np.int64)
+    stops = np.asarray(stops, dtype=np.int64)
+    if len(chroms) == 0:
+        return merged
+    # runs of the same chromosome in input order
+    chromBreaks = np.flatnonzero(chroms[1:] != chroms[:-1]) + 1
+    bounds = np.concatenate(([0], chromBreaks, [len(chroms)]))
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        chrStarts = starts[first:last]
+        chrStops = stops[first:last]
+        maxStops = np.maximum.accumulate(chrStops)
+        groups = np.concatenate(([0],
+                     np.flatnonzero(chrStarts[1:] - maxStops[:-1] > distance) + 1))
+        groupStops = np.maximum.reduceat(chrStops, groups)
+        chrom = str(chroms[first])
+        merged.extend(zip([chrom]*len(groups), chrStarts[groups].tolist(),
+                          groupStops.tolist()))
+    return merged
+
+def ignoreRead(chr_l, loc_l, chr_r, loc_r, chrHash):
+    """Check if a fragment aligned in particular location is to be excluded from analysis
+    Inputs:
+        chr_l: chr name of left alignment
+        chr_r: chr name of right alignment
+        loc_l: left alignment 'arrow-tip' location
+        loc_r: right alignment 'arrow-tip' location
+    Outputs:
+        boolean indicating whether alignment is to be excluded (True) or not (False)
+    """
+    if chr_l in chrHash and chrHash[chr_l][loc_l] == 1:
+        return True
+    if chr_r in chrHash and chrHash[chr_r][loc_r] == 1:
+        return True
+    return False
+
+def countLines(fileName):
+    f= openFile(fileName)
+    line_num = -1
+    for line_num, _ in enumerate(f):
+        pass
+    f.close()
+    return line_num + 1
+
+# support thresholds of a preview are scaled down to this at most
+PREVIEW_MIN_SUPPORT = 2
+
+def splitReadFragment(qname):
+    """Name of the fragment of a split read. The split read files name the
+    split reads of a fragment after it, with a _1 or _2 suffix for the read of
+    the pair they come from."""
+    if qname.endswith("_1") or qname.endswith("_2"):
+        return qname[:-2]
+    return qname
+
+def previewKeeps(qname, fraction):
+    """Whether a preview analyzing this fraction of the fragments keeps the
+    fragment qname. The choice is a hash of the name, so the discordant pair
+    and the split reads of a fragment (named by splitReadFragment()) are kept
+    or dropped together, and in every run."""
+    return fraction >= 1 or \
+        (zlib.crc32(qname) & 0xffffffff) < fraction * 0x100000000
+
+def previewSupport(support, fraction):
+    """Support threshold for a preview analyzing this fraction of the
+    fragments"""
+    if fraction >= 1:
+        return support
+    return max(min(support, PREVIEW_MIN_SUPPORT), int(round(support * fraction)))
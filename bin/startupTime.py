@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+# Measure the startup time of the SVXplorer command line and the import time
+# of every stage module, each in a fresh interpreter. Fails if the command
+# line exceeds its time budget or if importing a stage loads one of the slow
+# libraries that are meant to load only when a stage runs.
+import argparse as ap
+import subprocess
+import sys
+import time
+from os import devnull
+from os.path import dirname, realpath, join
+
+SCRIPT_DIR = dirname(realpath(__file__))
+DRIVER = join(SCRIPT_DIR, "SVXplorer")
+# seconds allowed for "SVXplorer -h" and for a usage error
+STARTUP_BUDGET = 1.0
+# runs of every measurement; the fastest one is reported
+REPEATS = 3
+# libraries imported only by the functions that use them
+LAZY_LIBRARIES = ["networkx", "sklearn", "pandas", "pybedtools"]
+STAGE_MODULES = ["extractEvidence", "writeDiscordantFragments", "formPEClusters",
+                 "consolidatePEClusters", "uniqueSuppFilter", "writeBEDs", "writeVCF",
+                 "addSplitReads", "covPUFilter", "markDuplicateClusterRegions",
+                 "pickBestCluster", "preserveSmallClusters"]
+
+def bestTime(command, repeats):
+    """Fastest wall time of repeats runs of command"""
+    best = None
+    with open(devnull, "w") as fnull:
+        for _ in range(repeats):
+            start = time.time()
+            subprocess.call(command, stdout=fnull, stderr=fnull, cwd=SCRIPT_DIR)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    return best
+
+def lazyLibrariesLoaded(module):
+    """Slow libraries loaded by importing module"""
+    check = "import sys, %s; print ' '.join(x for x in %r if x in sys.modules)" \
+            % (module, LAZY_LIBRARIES)
+    output = subprocess.check_output([sys.executable, "-c", check], cwd=SCRIPT_DIR)
+    return output.split()
+
+def startupTime(budget, repeats):
+    """Print the measurements; returns the list of failed checks"""
+    failed = []
+    print "%-40s %8.3f" % ("python", bestTime([sys.executable, "-c", "pass"], repeats))
+    for name, args in (("SVXplorer -h", ["-h"]), ("SVXplorer (usage error)", [])):
+        elapsed = bestTime([sys.executable, DRIVER] + args, repeats)
+        print "%-40s %8.3f" % (name, elapsed)
+        if elapsed > budget:
+            failed.append("%s took %.3fs, over the budget of %.3fs" % (name, elapsed, budget))
+
+    for module in STAGE_MODULES:
+        elapsed = bestTime([sys.executable, "-c", "import %s" % module], repeats)
+        loaded = lazyLibrariesLoaded(module)
+        print "%-40s %8.3f %s" % ("import " + module, elapsed, " ".join(loaded))
+        if loaded:
+            failed.append("importing %s loads %s" % (module, ", ".join(loaded)))
+    return failed
+
+if __name__ == "__main__":
+    PARSER = ap.ArgumentParser(description="""
+    Check the startup time of SVXplorer and that stage modules import without
+    loading networkx, sklearn or pandas""",
+    formatter_class=ap.ArgumentDefaultsHelpFormatter)
+    PARSER.add_argument('-b', default=STARTUP_BUDGET, dest='budget', type=float,
+        help='Seconds allowed for the command line to print help or a usage error')
+    PARSER.add_argument('-r', default=REPEATS, dest='repeats', type=int,
+        help='Runs of every measurement; the fastest is reported')
+    ARGS = PARSER.parse_args()
+
+    FAILED = startupTime(ARGS.budget, ARGS.repeats)
+    for message in FAILED:
+        print >> sys.stderr, "Startup check failed: %s" % message
+    if FAILED:
+        exit(1)
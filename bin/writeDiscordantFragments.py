@@ -0,0 +1,847 @@
+#!/usr/bin/env python
+
+# Identify all discordant reads, analyze, and write them to allDiscordants.us.txt
+
+import argparse as ap
+import numpy as np
+import json
+import logging
+import sys
+import gc
+from shared import formExcludeHash, excludeHash, ignoreRead, openFile, \
+                   readRegions, fetchRegions, readGroupIndex, runContext, \
+                   openBAM, previewKeeps, mappedReferences, recordFile
+
+## we would not recommended changing any of these
+# primary alignment score threshold (0 recommended due to split reads etc.)
+AS_THRESH = 0
+# %ile of insert-length dist. where IL value indicates discordant alignment
+# due to being too large
+DISC_PERC = .9985
+# %ile of insert-length dist. where IL value indicates discordant alignment
+DISC_PERC_NEG = .0001
+# min almt score required to use concordant almt in calculating BAM statistics
+AS_CALC_THRESH = .999
+# min almt score required to use single mappings from PE reads for de novo INS calls
+UNMAPPED_THRESH = .98
+# facilitator
+BIG_NUM = 100000
+# %ile of (concordant) IL dist. where the IL value is considered too large
+PENALTY_PERC = .999995
+# %tile of IL dist. to start distance penalty assessment
+DIST_END_PERC = .99
+# mapping quality threshold for RF alignments, which tend to be in less mappable regions
+MAP_THRESH_DUP = 20
+# min gap b/w "arrow tips" of RF almt to count as reasonable
+RF_RDL_FACTOR = 2.1
+# min concordant almts of a read group to use its own BAM statistics
+MIN_RG_READS = 1000
+# number of chromosomes whose first bases the coverage is estimated from
+COVERAGE_CHROMS = 23
+
+def sampleAlignments(bamfile, regions):
+    """Alignments used for the BAM statistics: from the start of the file, or
+    from the target regions only"""
+    if regions is None:
+        return iter(bamfile)
+    return fetchRegions(bamfile, regions)
+
+def samplePileups(bamfile, calc_thresh, subsampleRate, regions):
+    """Pileup columns used for the coverage estimate: the first ones of each of
+    the first COVERAGE_CHROMS chromosomes with mapped reads, continued on the
+    later ones while fewer columns than these could give have been sampled,
+    or those of the target regions. An assembly of many short contigs is then
+    sampled by the number of bases, not of contigs."""
+    if regions is not None:
+        counterLoop = 0
+        for chrom, start, stop in regions:
+            for pileupcolumn in bamfile.pileup(chrom, start, stop, truncate=True):
+                yield pileupcolumn
+                counterLoop += 1
+                if counterLoop > calc_thresh/subsampleRate:
+                    return
+        return
+
+    sampled = 0
+    for nChroms, chrom in enumerate(mappedReferences(bamfile)):
+        if nChroms >= COVERAGE_CHROMS and \
+           sampled >= COVERAGE_CHROMS*calc_thresh/subsampleRate:
+            break
+        counterLoop = 0
+        for pileupcolumn in bamfile.pileup(chrom):
+            yield pileupcolumn
+            counterLoop += 1
+            if counterLoop > calc_thresh/subsampleRate:
+                break
+        sampled += counterLoop
+
+def formBinDist(IL_list):
+    """Distribution of the differences between binned insert lengths of pairs
+    of fragments, from sorted insert lengths"""
+    binSize = 10
+    binDist = binSize
+    distHash = {}
+    minIL = IL_list[0]
+    for item in IL_list:
+        if item - minIL < binSize:
+            if binDist not in distHash:
+                distHash[binDist] = 0
+            distHash[binDist] += 1
+        else:
+            binDist += binSize
+            minIL = item
+    binDistHash = {}
+    for item in distHash:
+        for item2 in distHash:
+            temp = item2 - item
+            if temp >= 0:
+                if temp not in binDistHash:
+                    binDistHash[temp] = 0
+                if temp > 0:
+                    binDistHash[temp] += distHash[item]*distHash[item2]
+                else:
+                    binDistHash[temp] += (distHash[item])*(distHash[item] -1)*.5
+    return binDistHash
+
+def libraryStats(IL_list_us):
+    """Insert-length statistics of a library from the insert lengths of its
+    concordant alignments, in the order they were read
+    Outputs:
+        meanIL, stdIL, maxIL, disc_thresh, disc_thresh_neg, dist_penalty,
+        dist_end and the distribution of insert-length differences
+    """
+    meanIL = sum(IL_list_us)/len(IL_list_us)
+    IL_list = sorted(IL_list_us)
+    try:
+        dist_end = IL_list[int(DIST_END_PERC*len(IL_list)) - 1]
+        dist_penalty = IL_list[int(PENALTY_PERC*len(IL_list)) - 1]
+        disc_thresh_neg = IL_list[int(DISC_PERC_NEG*len(IL_list)) - 1] - meanIL
+    except:
+        sys.stderr.write("Please check value of DISC_PERC (discordancy percentile for IL).")
+        exit(1)
+
+    disc_thresh = IL_list[int(DISC_PERC*len(IL_list)) - 1] - meanIL
+    stdIL = sum((IL - meanIL)**2 for IL in IL_list_us)/len(IL_list_us)
+    stdIL = stdIL**(.5)
+    if disc_thresh < 0:
+        disc_thresh = 3*stdIL
+
+    return meanIL, stdIL, IL_list[-1], disc_thresh, disc_thresh_neg, \
+        dist_penalty, dist_end, formBinDist(IL_list)
+
+def fragmentReadGroup(alignments, readGroups):
+    """Index of the read group of a fragment, None if it has none"""
+    if not alignments[0].has_tag("RG"):
+        return None
+    return readGroups.get(alignments[0].get_tag("RG"))
+
+def calcMeanSig(bamfile1, workDir, calc_thresh, regions=None, context=None):
+    """Calculate mean & std of insert-length dist. (and other stats listed below)
+    Inputs:
+        bamfile1: position-sorted BAM file containing all alignments
+        regions: if given, (chr, start, stop) regions the statistics are
+                 sampled from, through the index
+    Outputs:
+        meanIL: mean insert length
+        stdIL: stdev in IL
+        disc_thresh: IL value of the input distribution at DISC_PERC, less meanIL
+        disc_thresh_neg: IL value of the input distribution at DISC_PERC_NEG,
+                         less meanIL (neg value)
+        rgStats: if the BAM has several read groups, the same statistics
+                 (meanQL, meanIL, stdIL, maxIL, disc_thresh, disc_thresh_neg,
+                 dist_penalty, dist_end) of every read group with at least
+                 MIN_RG_READS sampled alignments, by read group index
+    Notes:
+        Quantities not returned explicitly but written to bam_stats.txt file:
+            meanQL: mean query length
+            maxIL: maximum insert length
+            dist_penalty: IL value of the input distribution at PENALTY_PERC
+            dist_end: IL value of the input distribution at DIST_END_PERC
+        'Alignment' here always refers to PE alignment unless otherwise specified
+        Read group statistics are written to readGroupStats.txt and their
+        insert-length difference distributions to readGroupBinDist.txt
+    """
+    if context is None:
+        context = runContext()
+    bamfile = openBAM(bamfile1, "rb")
+    readGroups = readGroupIndex(context.header(bamfile1))
+    alignments = sampleAlignments(bamfile, regions)
+    summedQL = 0
+    counterRead = 0
+    counterLoop = 0
+    IL_list_us = []
+    rgIL_lists = {}
+    rgSummedQL = {}
+
+    while counterRead < calc_thresh and counterLoop < 2*calc_thresh:
+        try:
+            m1 = next(alignments)
+        except StopIteration:
+            break
+
+        # AS_CALC_THRESH condition ensures split read will not be included in
+        # analysis because "next" may not be mate then
+        if m1.is_proper_pair and \
+           m1.is_secondary == False and \
+           m1.is_supplementary == False and \
+           m1.get_tag("AS") > AS_CALC_THRESH*m1.infer_query_length() and m1.template_length > 0:
+
+            IL = m1.template_length
+            IL_list_us.append(IL)
+            summedQL += m1.infer_query_length()
+            counterRead += 1
+
+            if readGroups:
+                rg = fragmentReadGroup([m1], readGroups)
+                if rg is not None:
+                    rgIL_lists.setdefault(rg, []).append(IL)
+                    rgSummedQL[rg] = rgSummedQL.get(rg, 0) + m1.infer_query_length()
+        counterLoop += 1
+    bamfile.close()
+
+    if counterRead == 0:
+        sys.stderr.write("Please check order of name-sorted and position-sorted files supplied.")
+        exit(1)
+    meanQL = summedQL/counterRead
+    meanIL, stdIL, maxIL, disc_thresh, disc_thresh_neg, dist_penalty, dist_end, \
+        binDistHash = libraryStats(IL_list_us)
+
+    fh = openFile(workDir + "/binDist.txt", "w")
+    for item in binDistHash:
+        fh.write("%s\t%s\n" %(item, binDistHash[item]))
+    fh.close()
+
+    # the same statistics for every read group with enough alignments
+    rgStats = {}
+    fRGStats = openFile(workDir + "/readGroupStats.txt", "w")
+    fRGBins = openFile(workDir + "/readGroupBinDist.txt", "w")
+    for rg in sorted(rgIL_lists):
+        if len(rgIL_lists[rg]) < MIN_RG_READS:
+            logging.info("Using the statistics of all read groups for read group %d with %d alignments", rg, len(rgIL_lists[rg]))
+            continue
+        rgMeanIL, rgStdIL, rgMaxIL, rgDiscThresh, rgDiscThreshNeg, rgDistPenalty, \
+            rgDistEnd, rgBinDistHash = libraryStats(rgIL_lists[rg])
+        rgStats[rg] = (rgSummedQL[rg]/len(rgIL_lists[rg]), rgMeanIL, rgStdIL,
+                       rgMaxIL, rgDiscThresh, rgDiscThreshNeg, rgDistPenalty,
+                       rgDistEnd)
+        logging.debug("Read group %d meanQL, meanIL, stdIL, maxIL, disc_thresh: %f %f %f %f %f", rg, rgStats[rg][0], rgMeanIL, rgStdIL, rgMaxIL, rgDiscThresh)
+        fRGStats.write("%s\t%s\n" % (rg, "\t".join(map(str, rgStats[rg]))))
+        for item in rgBinDistHash:
+            fRGBins.write("%s\t%s\t%s\n" % (rg, item, rgBinDistHash[item]))
+    fRGStats.close()
+    fRGBins.close()
+
+    bamfile = openBAM(bamfile1, "rb")
+    cov = 0
+    width = 20
+    counterBase = 0
+    subsampleRate = 10.0
+    for pileupcolumn in samplePileups(bamfile, calc_thresh, subsampleRate, regions):
+        cov += pileupcolumn.n
+        counterBase += 1
+    bamfile.close()
+    if counterBase > 0:
+        cov = cov/counterBase
+
+    binDistHash.clear()
+    del binDistHash
+    gc.collect()
+
+    logging.debug("meanQL, meanIL, stdIL, cov, maxIL, disc_thresh: %f %f %f %f %f %f", meanQL, meanIL, stdIL, cov, maxIL, disc_thresh)
+    with openFile(workDir + "/bamStats.txt", "w") as fp:
+        print >> fp, "%s\n%s\n%s\n%s\n%s\n%s\n%s\n%s" %(meanQL, meanIL, stdIL, cov, maxIL, disc_thresh, dist_penalty, dist_end)
+    for fileName in ["bamStats.txt", "readGroupStats.txt", "readGroupBinDist.txt"]:
+        context.forget("%s/%s" % (workDir, fileName))
+
+    return meanQL, meanIL, disc_thresh, disc_thresh_neg, rgStats
+
+def writeSampleStats(statsFile, stats):
+    """Write the statistics returned by calcMeanSig, unrounded, for
+    readSampleStats()"""
+    meanQL, meanIL, disc_thresh, disc_thresh_neg, rgStats = stats
+    with openFile(statsFile, "w") as fp:
+        fp.write(json.dumps([meanQL, meanIL, disc_thresh, disc_thresh_neg,
+                             sorted(rgStats.items())]))
+
+def readSampleStats(statsFile):
+    with openFile(statsFile, "r") as fp:
+        meanQL, meanIL, disc_thresh, disc_thresh_neg, rgStats = json.loads(fp.read())
+    return meanQL, meanIL, disc_thresh, disc_thresh_neg, \
+           dict((rg, tuple(x)) for rg, x in rgStats)
+
+class alignedFragment(object):
+    def __init__(self):
+        # whether lBound is start or end of left-aligned read (in reference)
+        # depends on orientation of read in reference
+        self.lBound = -1
+        self.rBound = -1
+        self.cType = None #orientation, e.g. "01" represents "FR" etc.
+        self.cMapType = None #0 if both reads map, 1 if one read maps only
+        self.lTID = None
+        self.rTID = None
+        self.mapQual = -1
+        self.discSmall = -1
+        self.readGroup = None #index of read group, if the BAM has several
+
+    def __str__(self):
+        fields = "%s\t%s\t%s\t%s\t%s\t%s\t%s" % (self.lTID, self.lBound, self.rTID,
+                                         self.rBound, self.cType, self.discSmall, self.mapQual)
+        if self.readGroup is not None:
+            fields += "\t%s" % self.readGroup
+        return fields
+
+    def record(self, fragNum):
+        """The fields of the line of allDiscordants.us.txt of fragment
+        fragNum, see formatDiscordant()"""
+        return (fragNum, self.lTID, self.lBound, self.rTID, self.rBound,
+                self.cType, self.discSmall, self.mapQual, self.readGroup)
+
+def formatDiscordant(record):
+    """Line of allDiscordants.us.txt for a record of alignedFragment"""
+    if record[8] is None:
+        return "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % record[:8]
+    return "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % record
+
+def findTotalNMatches(al):
+    """ Calculate how many bases in alignment match reference, given cigar string
+    Inputs:
+        al: pysam alignment read from bamfile
+    Outputs:
+        Number of matches, ratio of number of matches to query length
+    """
+    MDtagPos = str(al).find("MD",10) + 6
+    temp = str(al)[MDtagPos:].find(")")
+    MDtag = str(al)[MDtagPos:MDtagPos +temp-1]
+    # MD tag is set for perfect matches, so if not set, dubious
+    if MDtagPos == 5:
+        return 0,0
+    integers = "0123456789"
+    n_matches = 0
+    prev = "0"
+    n_subs = 0
+    for string in MDtag:
+        if string in integers:
+            prev += string
+        else:
+            n_matches += int(prev)
+            prev = "0"
+            n_subs += 1
+    n_matches += int(prev)
+    if n_matches > 0:
+        return n_matches, float(n_matches)/float(n_matches + n_subs)
+    else:
+        return 0,0
+
+def formDiscordant(aln1s, aln2s, disc_thresh, disc_thresh_neg, mean_IL, chrHash,
+                   nMatchPct_thresh, nMatch_relative_thresh, as_relative_thresh,
+                   map_thresh, permutation_thresh, ignoreBED, ignoreTIDList, ignoreTIDAll, rdl, libDup):
+    """ Analyze all discordant alignment pairs, filter them and write to file those that pass in alignedFragment() format
+    Inputs:
+        aln1s: list of left alignments with same query name
+        aln2s: list of right alignments with same query name
+        matches of given alignment to those of primary alignment of same query
+        disc_thresh: IL value of the input distribution at DISC_PERC, less mean insert length
+        disc_thresh_neg: IL value of the input distribution at DISC_PERC, less
+        mean insert length (neg value)
+        mean_IL: mean insert length
+        locations where alignments are to be excluded from analysis
+    Outputs:
+        dList1: list of filtered PE alignments where both reads map
+        dList2: list of filtered PE alignments where only 1 read maps
+    """
+    dList1 = []
+    dList2 = []
+    counterLoop = 0
+    outerIL = mean_IL
+    firstPass = 1
+
+    for al1 in aln1s:
+        for al2 in aln2s:
+            counterLoop += 1
+            al1_match = 0
+            al2_match = 0
+            l_orient = 2
+            r_orient = 2
+
+            # if both almts unmapped, return nothing
+            if al1.is_unmapped and al2.is_unmapped:
+                return dList1, dList2
+            # if primary alignment and below mapping quality threshold, return nothing
+            if (al1.mapping_quality < map_thresh or al2.mapping_quality < map_thresh) and counterLoop == 1:
+                return dList1, dList2
+            # if too many mappings of one fragment, return nothing
+            if counterLoop > permutation_thresh:
+                return dList1, dList2
+
+            if al1.is_unmapped == False:
+                al1_reference_name = al1.reference_name
+            else:
+                al1_reference_name = None
+
+            if al2.is_unmapped == False:
+                al2_reference_name = al2.reference_name
+            else:
+                al2_reference_name = None
+
+            al1_reference_start, al1_reference_end, al1_is_unmapped, al1_mapping_quality, al1_is_reverse, al1_score, al1_infer_query_length =  al1.reference_start, al1.reference_end, al1.is_unmapped, al1.mapping_quality, al1.is_reverse, float(al1.get_tag("AS")), al1.infer_query_length()
+
+            al2_reference_start, al2_reference_end, al2_is_unmapped, al2_mapping_quality, al2_is_reverse, al2_score, al2_infer_query_length =  al2.reference_start, al2.reference_end, al2.is_unmapped, al2.mapping_quality, al2.is_reverse, float(al2.get_tag("AS")), al2.infer_query_length()
+
+            if al1_reference_start == None and al1_reference_end == None and \
+               al2_reference_start == None and al2_reference_end == None:
+                return dList1, dList2
+
+            nf1, nf2 = False,False
+            if al1_reference_name in ignoreTIDList and al2_reference_name in ignoreTIDList:
+                logging.debug("Ignoring almt combination %s and %s", al1_reference_name, al2_reference_name)
+                continue
+            elif al1_reference_name in ignoreTIDList:
+                nf1 = True
+            elif al2_reference_name in ignoreTIDList:
+                nf2 = True
+            
+            skip = 0
+            for chrI in ignoreTIDAll:
+                if al1_reference_name is not None and al1_reference_name.startswith(chrI):
+                    nf1 = True
+                if al2_reference_name is not None and al2_reference_name.startswith(chrI):
+                    nf2 = True
+
+                if nf1 and nf2:
+                    skip = 1
+                    break
+            if skip:
+                logging.debug("Ignoring almt combination %s and %s as occurs as * entry in ignoreTIDs", al1, al2)
+                continue
+
+            if ignoreBED is not None:
+                if ignoreRead(al1_reference_name, al1_reference_start, al1_reference_name, al1_reference_start, chrHash):
+                    nf1 = True
+                if ignoreRead(al2_reference_name, al2_reference_start, al2_reference_name, al2_reference_start, chrHash):
+                    nf2 = True
+          
+            if nf1 and nf2:        
+                if counterLoop == 1:
+                    return dList1, dList2
+                continue
+            elif nf1:
+                al1_is_unmapped = True
+                al1_score = -1
+            elif nf2:
+                al2_is_unmapped = True
+                al2_score = -1
+
+            if al2_is_unmapped and al1_score < UNMAPPED_THRESH*al1_infer_query_length:
+                continue
+            if al1_is_unmapped and al2_score < UNMAPPED_THRESH*al2_infer_query_length:
+                continue
+
+            if nMatchPct_thresh != 0 or nMatch_relative_thresh != 0:
+                al1_nMatches, al1_nMatchRatio = findTotalNMatches(al1)
+                al2_nMatches, al2_nMatchRatio = findTotalNMatches(al2)
+            else:
+                al1_nMatches = 0
+                al1_nMatchRatio = 0
+                al2_nMatches = 0
+                al2_nMatchRatio = 0
+
+            if firstPass == 1:
+                al1_nMatchRatio_prim = al1_nMatchRatio
+                al2_nMatchRatio_prim = al2_nMatchRatio
+                al1_score_prim = al1_score
+                al2_score_prim = al2_score
+                al1_nMatchRatio = BIG_NUM
+                al2_nMatchRatio = BIG_NUM
+                al1_score = BIG_NUM
+                al2_score = BIG_NUM
+                firstPass = 0
+
+            al1ToPrim_nMatchRatio = 0
+            al2ToPrim_nMatchRatio = 0
+            if al1_nMatchRatio_prim > 0:
+                al1ToPrim_nMatchRatio = float(al1_nMatchRatio)/float(al1_nMatchRatio_prim)
+            if al2_nMatchRatio_prim > 0:
+                al2ToPrim_nMatchRatio = float(al2_nMatchRatio)/float(al2_nMatchRatio_prim)
+
+            try:
+                if al1_score_prim > AS_THRESH and al1_nMatchRatio >= nMatchPct_thresh and \
+                    al1ToPrim_nMatchRatio >= nMatch_relative_thresh and al1_score >= as_relative_thresh*al1_score_prim:
+                    al1_match = 1
+            except:
+                pass
+            try:
+                if al2_score_prim > AS_THRESH and al2_nMatchRatio >= nMatchPct_thresh and \
+                    al2ToPrim_nMatchRatio >= nMatch_relative_thresh and al2_score >= as_relative_thresh*al2_score_prim:
+                    al2_match = 1
+            except:
+                pass
+            if (al1_match == False and al2_match == False):
+                continue
+
+            if al1_match and al2_match:
+                newAlmt = alignedFragment()
+                if counterLoop == 1:
+                    newAlmt.mapQual = min(al1_mapping_quality, al2_mapping_quality)
+                newAlmt.cMapType = 0
+
+                # all right if TID different or orientation different. Won't make any difference in those situations.
+                if (al1_reference_start <= al2_reference_start):
+                    outerIL = abs(al1_reference_end - al2_reference_start) + al1_infer_query_length + al2_infer_query_length
+                    newAlmt.lTID = al1_reference_name
+                    newAlmt.rTID = al2_reference_name
+                    l_orient = int(al1_is_reverse)
+                    r_orient = int(al2_is_reverse)
+
+                else:
+                    outerIL = abs(al2_reference_end - al1_reference_start) + al1_infer_query_length + al2_infer_query_length
+                    newAlmt.lTID = al2_reference_name
+                    newAlmt.rTID = al1_reference_name
+                    l_orient = int(al2_is_reverse)
+                    r_orient = int(al1_is_reverse)
+
+                if (al1_reference_start <= al2_reference_start) and (not al1_is_reverse) and (not al2_is_reverse):
+                    newAlmt.lBound = al1_reference_end
+                    newAlmt.rBound = al2_reference_end
+                elif (al1_reference_start <= al2_reference_start) and (not al1_is_reverse) and (al2_is_reverse):
+                    newAlmt.lBound = al1_reference_end
+                    newAlmt.rBound = al2_reference_start
+                elif (al1_reference_start <= al2_reference_start) and (al1_is_reverse) and (not al2_is_reverse):
+                    newAlmt.lBound = al1_reference_start
+                    newAlmt.rBound = al2_reference_end
+                elif (al1_reference_start <= al2_reference_start) and (al1_is_reverse) and (al2_is_reverse):
+                    newAlmt.lBound = al1_reference_start
+                    newAlmt.rBound = al2_reference_start
+                elif (al1_reference_start > al2_reference_start) and (not al1_is_reverse) and (not al2_is_reverse):
+                    newAlmt.lBound = al2_reference_end
+                    newAlmt.rBound = al1_reference_end
+                elif (al1_reference_start > al2_reference_start) and (not al1_is_reverse) and (al2_is_reverse):
+                    newAlmt.lBound = al2_reference_start
+                    newAlmt.rBound = al1_reference_end
+                elif (al1_reference_start > al2_reference_start) and (al1_is_reverse) and (not al2_is_reverse):
+                    newAlmt.lBound = al2_reference_end
+                    newAlmt.rBound = al1_reference_start
+                elif (al1_reference_start > al2_reference_start) and (al1_is_reverse) and (al2_is_reverse):
+                    newAlmt.lBound = al2_reference_start
+                    newAlmt.rBound = al1_reference_start
+
+                newAlmt.cType = str(l_orient) + str(r_orient)
+                if newAlmt.lTID == newAlmt.rTID and newAlmt.cType == "01" and outerIL - mean_IL < disc_thresh_neg:
+                    newAlmt.discSmall = 1
+
+            elif al2_match and not al1_match:
+
+                newAlmt = alignedFragment()
+                if counterLoop == 1:
+                    newAlmt.mapQual = al2_mapping_quality
+                newAlmt.cMapType = 1
+                # left tid set by convention for one mate mappings
+                newAlmt.lTID = al2_reference_name
+
+                if al2_is_reverse:
+                    newAlmt.lBound = al2_reference_start
+                    l_orient = 1
+                    outerIL = -1
+                else:
+                    newAlmt.lBound = al2_reference_end
+                    l_orient = 0
+                    outerIL = -1
+                newAlmt.cType = str(l_orient) + str(r_orient)
+
+            elif al1_match and not al2_match:
+                newAlmt = alignedFragment()
+                if counterLoop == 1:
+                    newAlmt.mapQual = al1_mapping_quality
+                newAlmt.cMapType = 1
+                # left tid set by convention for one mate mappings
+                newAlmt.lTID = al1_reference_name
+
+                if al1_is_reverse:
+                    newAlmt.lBound = al1_reference_start
+                    l_orient = 1
+                    outerIL = -1
+                else:
+                    newAlmt.lBound = al1_reference_end
+                    l_orient = 0
+                    outerIL = -1
+                newAlmt.cType = str(l_orient) + str(r_orient)
+
+            else:
+                continue
+
+            # RF alignments should be higher mapping quality and sufficiently apart to be reliable
+            if (not libDup) and newAlmt.cType == "10" and \
+                (newAlmt.mapQual < MAP_THRESH_DUP or \
+                newAlmt.rBound - newAlmt.lBound < RF_RDL_FACTOR*rdl):
+                continue
+            
+            if (not libDup) and newAlmt.cType == "01" and newAlmt.lBound > newAlmt.rBound:
+                continue
+
+            # check discordancy even though discordant flag set by aligner
+            if newAlmt.cMapType == 1 or \
+                    (newAlmt.cMapType == 0 and ( outerIL - mean_IL > disc_thresh or \
+                    outerIL - mean_IL < disc_thresh_neg or \
+                    newAlmt.cType != "01" or newAlmt.lTID != newAlmt.rTID )):
+
+                    if newAlmt.lBound == -1 and newAlmt.rBound == -1:
+                        logging.warning("WARNING STORING BAD DATA ", newAlmt)
+
+                    if newAlmt.cMapType == 0:
+                        dList1.append(newAlmt)
+                    elif newAlmt.cMapType == 1:
+                        dList2.append(newAlmt)
+            # if even 1 alignment is concordant, don't use any mappings from read: safe
+            else:
+                dList1 =[]
+                dList2 = []
+                return dList1, dList2
+
+    return dList1, dList2
+
+def fragmentName(qname):
+    """Query name of a read without the /1 or /2 suffix of some aligners"""
+    if qname.endswith("/1") or qname.endswith("/2"):
+        return qname[:-2]
+    return qname
+
+def readFragmentAlignments(bamname):
+    """Generator of alignments returning those of 1 fragment at a time
+    Inputs:
+        bamname: SAM or BAM file, or "-" for stdin, containing the PE
+        alignments of both reads (e.g. can include secondary almts), sorted
+        or grouped by name
+    Outputs:
+        fragment name, list of alignments of read 1, list of alignments of
+        read 2
+    """
+    bamfile = openBAM(bamname, "r")
+    aln1s, aln2s = [], []
+    qname = None
+
+    for alignment in bamfile:
+        # ignore QC failed, duplicate and supplementary alignments
+        if alignment.is_qcfail or \
+           alignment.is_duplicate or \
+           alignment.is_supplementary: 
+           continue
+
+        name = fragmentName(alignment.qname)
+        if name != qname:
+            if qname != None:
+                yield qname, aln1s, aln2s
+            aln1s, aln2s = [], []
+            qname = name
+        if alignment.is_read1:
+            aln1s.append(alignment)
+        else:
+            aln2s.append(alignment)
+
+    if qname != None:
+        yield qname, aln1s, aln2s
+    bamfile.close()
+
+def readIgnoreChr(ignoreChr):
+    """Chromosomes listed to be ignored, and the prefixes of those listed
+    with a "*" to ignore all chromosomes starting with them"""
+    ignoreTIDs = set()
+    ignoreTIDAll = set()
+    if ignoreChr is not None:
+        with open(ignoreChr, 'r') as f:
+            for line in f:
+                chrI = line.strip().split()[0]
+                if not chrI.startswith("*"):
+                    ignoreTIDs.add(chrI)
+                    logging.debug("Chromosome %s will be ignored.", chrI)
+                else:
+                    ignoreTIDAll.add(chrI[1:])
+                    logging.debug("Chr names starting with %s will be ignored", chrI[1:])
+    return ignoreTIDs, ignoreTIDAll
+
+def maskStatus(alignment, ignoreTIDs, ignoreTIDAll, chrHash):
+    """How formDiscordant treats an alignment under the ignored chromosomes
+    and exclude regions: whether its chromosome is ignored, by name or by
+    prefix, and whether its start is excluded"""
+    if alignment.is_unmapped:
+        return False, False, False
+    name, pos = alignment.reference_name, alignment.reference_start
+    return (name in ignoreTIDs, any(name.startswith(x) for x in ignoreTIDAll),
+            ignoreRead(name, pos, name, pos, chrHash))
+
+class previousFragments(object):
+    """The lines of allDiscordants.us.txt of an earlier run, looked up by
+    fragment number in increasing order"""
+    def __init__(self, fileName):
+        self.f = openFile(fileName, "r")
+        self.pending = self.f.readline()
+
+    def lines(self, fragNum):
+        lines = []
+        while self.pending:
+            num = int(self.pending.split("\t", 1)[0])
+            if num > fragNum:
+                break
+            if num == fragNum:
+                lines.append(self.pending)
+            self.pending = self.f.readline()
+        return lines
+
+    def close(self):
+        self.f.close()
+
+def writeDiscordantFragments(workDir, discBAM, bamfile, debug,
+                             ignoreBED, ignoreChr, permutation_thresh,
+                             calc_thresh, nMatchPct_thresh,
+                             nMatch_relative_thresh, as_relative_thresh,
+                             map_thresh, libDup, regions=None, context=None,
+                             previousDir=None, previousIgnoreBED=None,
+                             previousIgnoreChr=None, preview=1.0,
+                             sampleStats=None):
+    """Write the discordant fragments of discBAM to allDiscordants.us.txt.
+    The statistics of bamfile are calculated unless given as sampleStats,
+    as returned by calcMeanSig.
+    If previousDir is the workspace of an earlier run on the same discBAM
+    with the ignored chromosomes and exclude regions previousIgnoreChr and
+    previousIgnoreBED, only the fragments with an alignment that the two sets
+    of masks treat differently are formed again; the lines of the others are
+    taken from the earlier run. A preview keeps only the given fraction of
+    the fragments."""
+    chrHash = {}
+
+    if context is None:
+        context = runContext()
+
+    # calculate some basic stats
+    if sampleStats is None:
+        sampleStats = calcMeanSig(bamfile, workDir, calc_thresh, regions, context)
+    rdl, mean_IL, disc_thresh, disc_thresh_neg, rgStats = sampleStats
+    readGroups = readGroupIndex(context.header(bamfile))
+
+    # read the lengths of the chromosomes
+    chromosome_lengths = context.chromosomeLengths(bamfile)
+
+    ignoreTIDs, ignoreTIDAll = readIgnoreChr(ignoreChr)
+
+    ignoreBuffer = 1*rdl
+    if ignoreBED is not None:
+        logging.info("Regions in %s will be ignored", ignoreBED)
+        chrHash = formExcludeHash(chrHash, ignoreBuffer, ignoreBED, chromosome_lengths, context)
+
+    # the masks of the earlier run, to tell the fragments they affect
+    previous = None
+    if previousDir is not None:
+        previous = previousFragments("%s/allDiscordants.us.txt" % previousDir)
+        previousMasks = readIgnoreChr(previousIgnoreChr) + ({},)
+        if previousIgnoreBED is not None:
+            previousMasks = previousMasks[:2] + (excludeHash(ignoreBuffer,
+                previousIgnoreBED, chromosome_lengths, context),)
+        masks = (ignoreTIDs, ignoreTIDAll, chrHash)
+        nReformed = 0
+
+    # read discordant alignments and write all possible discordant pairs to
+    # file, or hand them to the sort as records with --in-memory
+    with recordFile("%s/allDiscordants.us.txt" % workDir, formatDiscordant) as almtFile:
+        currentFrag = 1
+        logging.info('Started reading discordant pairs')
+        for qname, aln1s, aln2s in readFragmentAlignments(discBAM):
+
+            if (currentFrag % 100000) == 0:
+                logging.debug("%d fragments analyzed", currentFrag)
+            # a read may have no alignments left after the filters above
+            if not aln1s or not aln2s:
+                logging.debug("Skipping %s: alignments of only one read", qname)
+                continue
+            if not previewKeeps(qname, preview):
+                continue
+
+            if previous is not None:
+                lines = previous.lines(currentFrag)
+                if all(maskStatus(x, *masks) == maskStatus(x, *previousMasks)
+                       for x in aln1s + aln2s):
+                    almtFile.writelines(lines)
+                    currentFrag += 1
+                    continue
+                nReformed += 1
+
+            # fragments of a read group are judged by its own statistics
+            rg = None
+            fragStats = (rdl, mean_IL, disc_thresh, disc_thresh_neg)
+            if rgStats:
+                rg = fragmentReadGroup(aln1s, readGroups)
+                if rg in rgStats:
+                    fragStats = (rgStats[rg][0], rgStats[rg][1], rgStats[rg][4], rgStats[rg][5])
+
+            dList1, dList2 = formDiscordant(aln1s, aln2s, fragStats[2],
+                    fragStats[3], fragStats[1], chrHash, nMatchPct_thresh,
+                    nMatch_relative_thresh, as_relative_thresh, map_thresh,
+                    permutation_thresh, ignoreBED, ignoreTIDs, ignoreTIDAll, fragStats[0], libDup)
+            for item in dList1 + dList2:
+                item.readGroup = rg
+            for item in dList1 + dList2:
+                almtFile.write(item.record(currentFrag))
+            currentFrag += 1
+        logging.info('Finished reading discordant pairs')
+    if previous is not None:
+        previous.close()
+        logging.info('Formed %d of %d fragments again for the changed masks; the others were taken from %s',
+                     nReformed, currentFrag - 1, previousDir)
+    
+    chrHash.clear()
+    del chrHash
+    gc.collect()
+
+if __name__ == "__main__":
+
+    # parse arguments
+    PARSER = ap.ArgumentParser(description="""
+    Filter, format and write all PE discordants from a name-sorted or
+    name-grouped discordant SAM/BAM file to allDiscordants.us.txt""",
+    formatter_class=ap.ArgumentDefaultsHelpFormatter)
+    PARSER.add_argument('workDir', help='Work directory')
+    PARSER.add_argument('discBAM', help='Name-sorted or name-grouped SAM/BAM file containing discordant PE almts, or - for stdin')
+    PARSER.add_argument('bamfile', help='Position-sorted BAM alignment file')
+    PARSER.add_argument('-d', action='store_true', dest='debug',
+        help='print debug information')
+    PARSER.add_argument('-i', default=None, dest='ignoreBED',
+        help='Exclude-regions file in BED format')
+    PARSER.add_argument('-c', default=None, dest='ignoreChr',
+        help='File listing chromosomes to exclude, one per line')
+    PARSER.add_argument('-p', default=20, dest='permutation_thresh', type=int,
+        help='If all alignments with same query name exceed this number, do not use any in analysis')
+    PARSER.add_argument('-t', default=1000000, dest='calc_thresh', type=int,
+        help='Max number of concordant alignments to use in calculating BAM statistics')
+    PARSER.add_argument('-n', default=0, dest='nMatchPct_thresh', type=int,
+        help='Threshold of matching base pairs in alignment to reference')
+    PARSER.add_argument('-r', default=0, dest='nMatch_relative_thresh',
+        type=int,
+        help='Threshold of ratio of matching base pairs in \
+        given alignment to primary alignment of same query')
+    PARSER.add_argument('-a', default=2, dest='as_relative_thresh', type=int,
+        help='Threshold of relative alignment score of given alignment to primary alignment of same name\
+        --set to less than 1 (.95 recommended) if using secondary almts')
+    PARSER.add_argument('-m', default=10, dest='map_thresh', type=int,
+        help='Mapping quality threshold')
+    PARSER.add_argument('-g', default=None, dest='regions',
+        help='BED file of target regions to sample the BAM statistics from')
+    PARSER.add_argument('--preview', default=1.0, type=float,
+        help='Fraction of the fragments kept, chosen by a hash of their names')
+    ARGS = PARSER.parse_args()
+
+    LEVEL = logging.INFO
+    if ARGS.debug:
+        LEVEL = logging.DEBUG
+
+    logging.basicConfig(level=LEVEL,
+                        format='%(asctime)s %(levelname)s %(message)s',
+                        datefmt='%m/%d/%Y %I:%M:%S %p')
+
+    writeDiscordantFragments(ARGS.workDir, ARGS.discBAM,
+                             ARGS.bamfile, ARGS.debug, ARGS.ignoreBED,
+                             ARGS.ignoreChr, ARGS.permutation_thresh,
+                             ARGS.calc_thresh, ARGS.nMatchPct_thresh,
+                             ARGS.nMatch_relative_thresh,
+                             ARGS.as_relative_thresh,
+                             ARGS.map_thresh, False,
+                             readRegions(ARGS.regions) if ARGS.regions else None,
+                             preview=ARGS.preview)
+
+    logging.shutdown()
@@ -2,12 +2,12 @@
 
 # Add Split Reads to support existing PE variants and create new SR variants
 
-import pysam
 import sys
 import argparse
 import logging
 import gc
-from shared import formExcludeHash, ignoreRead, readChromosomeLengths, countLines
+from shared import formExcludeHash, ignoreRead, countLines, openFile, runContext, \
+                   openBAM, previewKeeps, splitReadFragment
 
 #global variables
 detectIntraChrCopyInv = 0
@@ -74,10 +74,12 @@ def mapSVtoNum(SV_type):
 def formPEHash(fAV, iObjects, slop):
     logging.info('Started reading the PE variants')
     global SVHashPE
+    nSVsPE = 0
     for line_num, line in enumerate(fAV):
         line_s = line.split()
         SV_specsPE = PEVarDetails()
         SV_specsPE.num = int(line_s[0])
+        nSVsPE = SV_specsPE.num
         SV_specsPE.typeSV= mapSVtoNum(line_s[1])
         if SV_specsPE.typeSV == -1:
             continue
@@ -98,15 +100,20 @@ def formPEHash(fAV, iObjects, slop):
         if almt not in SVHashPE:
             SVHashPE[almt] = SV_specsPE
     logging.info('Finished reading the PE variants')
-    return SV_specsPE.num
+    return nSVsPE
 
 def addSplitReads(workDir, variantMapFilePE, allVariantFilePE, bamFileSR,
                   slop, refRate, min_vs, mapThresh, ignoreChr, minSizeINS,
-                  minSRtoPEsupport, ignoreBED, noCCleanUp, maxClusterMargin):
-    fAV = open(allVariantFilePE,"r")
-    fVM = open(variantMapFilePE,"r")
-    fAVN = open(workDir+"/allVariants.pe_sr.txt","w")
-    fVMN = open(workDir+"/variantMap.pe_sr.txt","w")
+                  minSRtoPEsupport, ignoreBED, noCCleanUp, maxClusterMargin,
+                  context=None, preview=1.0):
+    # a preview keeps the split reads of the fragments that
+    # writeDiscordantFragments keeps
+    if context is None:
+        context = runContext()
+    fAV = openFile(allVariantFilePE,"r")
+    fVM = openFile(variantMapFilePE,"r")
+    fAVN = openFile(workDir+"/allVariants.pe_sr.txt","w")
+    fVMN = openFile(workDir+"/variantMap.pe_sr.txt","w")
     global SVHashPE
     SVHashPE = {}
     SRVarHash = {}
@@ -122,7 +129,7 @@ def addSplitReads(workDir, variantMapFilePE, allVariantFilePE, bamFileSR,
     SRtoPESuppFrags = [[] for _ in range(1+nSVsPE)]
     SRtoPESuppBPs = {}
     newSRList = []
-    bamfile = pysam.Samfile(bamFileSR,"rb")
+    bamfile = openBAM(bamFileSR,"rb")
     # if subsampling: shouldn't be required`
     bp1Prev = -1
     bp1TID = -1
@@ -143,12 +150,12 @@ def addSplitReads(workDir, variantMapFilePE, allVariantFilePE, bamFileSR,
                     ignoreTIDAll.add(chrI[1:])
                     logging.info("Adding SRs: Chr names starting with %s will be ignored", chrI[1:])
 
-    chromosome_lengths = readChromosomeLengths(bamFileSR)
+    chromosome_lengths = context.chromosomeLengths(bamFileSR)
 
     chrHash = {}
     if ignoreBED is not None:
         logging.info("Regions in %s will be ignored", ignoreBED)
-        chrHash = formExcludeHash(chrHash, 0, ignoreBED, chromosome_lengths)
+        chrHash = formExcludeHash(chrHash, 0, ignoreBED, chromosome_lengths, context)
     # all split reads should be mapped, unique alignments
     counterSR = 0
     while True:
@@ -159,6 +166,8 @@ def addSplitReads(workDir, variantMapFilePE, allVariantFilePE, bamFileSR,
             break
         varType = -1
         if sr1.qname == sr2.qname:
+            if not previewKeeps(splitReadFragment(sr1.qname), preview):
+                continue
             SRFrag-=1
             sr_bp1 = sr1.reference_start
             sr_bp2 = sr2.reference_start
@@ -625,6 +634,10 @@ def addSplitReads(workDir, variantMapFilePE, allVariantFilePE, bamFileSR,
                 fVMN.write("\n")
 
     bamfile.close()
+    fAV.close()
+    fVM.close()
+    fAVN.close()
+    fVMN.close()
 
     #free memory
     SVHashPE.clear()
@@ -660,6 +673,8 @@ if __name__ == "__main__":
         help='Minimum size for SR INS calls')
     PARSER.add_argument('-t', default=1, dest='minSRtoPEsupport', type=int,
         help='Minimum support for PE variants required to update breakpoints')
+    PARSER.add_argument('--preview', default=1.0, type=float,
+        help='Fraction of the fragments kept, chosen by a hash of their names')
     ARGS = PARSER.parse_args()
 
     LEVEL = logging.INFO
@@ -673,6 +688,7 @@ if __name__ == "__main__":
     addSplitReads(ARGS.workDir, ARGS.variantMapFilePE, ARGS.allVariantFilePE,
                   ARGS.bamFileSR, ARGS.slop, ARGS.refRate, ARGS.min_vs,
                   ARGS.mapThresh, ARGS.ignoreChr, ARGS.minSizeINS,
-                  ARGS.minSRtoPEsupport, ARGS.ignoreBED, ARGS.x, ARGS.maxClusterMargin)
+                  ARGS.minSRtoPEsupport, ARGS.ignoreBED, ARGS.x, ARGS.maxClusterMargin,
+                  preview=ARGS.preview)
 
     logging.shutdown()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+
+# Record the inputs, parameters and outputs of every pipeline stage in a
+# manifest, so that a rerun can skip stages that are still valid, and run the
+# stages that do not depend on each other at the same time
+import argparse as ap
+import hashlib
+import json
+import logging
+import sys
+import traceback
+from multiprocessing import Process, Queue
+from Queue import Empty
+from os import rename, stat
+from os.path import exists, basename
+from shared import inMemory, memoryFileContent, heldAsRecords
+
+# seconds a stage graph waits for a forked stage before checking that the
+# running stages are alive
+STAGE_POLL = 1.0
+
+def fileChecksum(fileName):
+    # tables handed on as records are not formatted to checksum them; they
+    # are only kept without -d, and so are never there to resume from
+    if heldAsRecords(fileName):
+        return None
+    if inMemory(fileName):
+        return hashlib.md5(memoryFileContent(fileName)).hexdigest()
+    md5 = hashlib.md5()
+    with open(fileName, "rb") as fp:
+        for block in iter(lambda: fp.read(1 << 20), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+def fileFingerprint(fileName):
+    """Size and modification time of an input file; these are outside the
+    workspace and can be large, so they are not checksummed"""
+    if not exists(fileName):
+        return [fileName, None, None]
+    info = stat(fileName)
+    return [fileName, info.st_size, int(info.st_mtime)]
+
+class stageManifest(object):
+    """Stages are run in order through run(). While resuming, a stage is
+    skipped if the previous run completed the same stage at the same position
+    with the same input fingerprints and parameters, and its outputs still
+    have the recorded checksums. Once a stage runs, every later stage runs as
+    well. Stages communicate only through their output files. Stages that run
+    are measured by metrics (a metrics.metricsReport) when one is given.
+    """
+    def __init__(self, manifestFile, version, resume, metrics=None):
+        self.manifestFile = manifestFile
+        self.version = version
+        self.metrics = metrics
+        self.stages = []
+        # stages completed before one recorded ahead of them, by position
+        self.completed = {}
+        self.previous = []
+        self.invalidated = True
+        if resume and exists(manifestFile):
+            with open(manifestFile, "r") as fp:
+                manifest = json.load(fp)
+            if manifest["version"] == version:
+                self.previous = manifest["stages"]
+                self.invalidated = False
+            else:
+                logging.info("Manifest was written by version %s, rerunning all stages", manifest["version"])
+
+    def save(self):
+        with open(self.manifestFile + ".tmp", "w") as fp:
+            json.dump({"version": self.version, "stages": self.stages}, fp,
+                      indent=1, sort_keys=True)
+        rename(self.manifestFile + ".tmp", self.manifestFile)
+
+    def isCurrent(self, name, inputs, params, outputs):
+        position = len(self.stages)
+        if position >= len(self.previous):
+            return False
+        entry = self.previous[position]
+        if entry["name"] != name or entry["inputs"] != inputs or \
+           entry["params"] != params or sorted(entry["outputs"]) != sorted(outputs):
+            return False
+        for output in outputs:
+            if not exists(output) or fileChecksum(output) != entry["outputs"][output]:
+                return False
+        return True
+
+    def current(self, name, inputs, params, outputs):
+        """Whether the next stage can be skipped, in which case it is recorded
+        as completed. Otherwise it and every later stage have to run."""
+        inputs = [fileFingerprint(x) for x in inputs if x is not None]
+        params = json.loads(json.dumps(params))
+        if not self.invalidated and self.isCurrent(name, inputs, params, outputs):
+            logging.info("Skipping stage %s: inputs and parameters unchanged", name)
+            self.stages.append(self.previous[len(self.stages)])
+            if self.metrics is not None:
+                self.metrics.skipped(name)
+            return True
+
+        if not self.invalidated:
+            logging.info("Resuming at stage %s", name)
+        self.invalidated = True
+        # later stages are stale until they rerun
+        self.save()
+        return False
+
+    def complete(self, position, name, inputs, params, outputs):
+        """Record a stage that ran with inputs of the given fingerprints. Stages
+        are recorded in the order they were declared; one completed ahead of
+        a stage before it is held back until that one completes."""
+        self.completed[position] = {"name": name, "inputs": inputs,
+            "params": json.loads(json.dumps(params)),
+            "outputs": dict((x, fileChecksum(x)) for x in outputs)}
+        while len(self.stages) in self.completed:
+            self.stages.append(self.completed.pop(len(self.stages)))
+        self.save()
+
+    def execute(self, position, name, inputs, params, outputs, function, *args, **kwargs):
+        """Run a stage in this process and record it at position"""
+        inputFiles = [x for x in inputs if x is not None]
+        inputs = [fileFingerprint(x) for x in inputFiles]
+        if self.metrics is not None:
+            self.metrics.measure(name, inputFiles, outputs, function, *args, **kwargs)
+        else:
+            function(*args, **kwargs)
+        self.complete(position, name, inputs, params, outputs)
+
+    def run(self, name, inputs, params, outputs, function, *args, **kwargs):
+        if not self.current(name, inputs, params, outputs):
+            self.execute(len(self.stages), name, inputs, params, outputs,
+                         function, *args, **kwargs)
+
+class graphStage(object):
+    """A stage of a stageGraph and the stages it runs after"""
+    def __init__(self, name, after, inputs, params, outputs, function, args, kwargs):
+        self.name = name
+        self.after = after
+        self.inputs = inputs
+        self.params = params
+        self.outputs = outputs
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.position = None
+
+    def run(self, manifest):
+        manifest.execute(self.position, self.name, self.inputs, self.params,
+                         self.outputs, self.function, *self.args, **self.kwargs)
+
+class stageGraph(object):
+    """Stages run through a stageManifest once the stages they depend on have
+    completed. Every stage is added after those it depends on, so the order
+    they are added in is one they can run in, and it is the order in which
+    they are skipped when resuming and recorded in the manifest.
+
+    With more than one worker, stages that are ready at the same time run
+    concurrently, each in a forked process, at most workers at a time. The
+    steps a forked stage measures are added to the metrics of the manifest,
+    and what the context (a shared.runContext) had read from its outputs is
+    dropped. A stage that is the only one able to run runs in this process,
+    so that later stages inherit what it has read. Forked stages only hand
+    their output files on, so intermediate files kept in memory cannot be
+    used with more than one worker.
+    """
+    def __init__(self, manifest, workers=1, context=None):
+        self.manifest = manifest
+        self.workers = workers
+        self.context = context
+        self.stages = []
+
+    def add(self, name, after, inputs, params, outputs, function, *args, **kwargs):
+        """Add a stage run after the stages named in after, which ignores
+        None. Returns the name of the stage."""
+        after = [x for x in after if x is not None]
+        added = set(x.name for x in self.stages)
+        for stage in after:
+            if stage not in added:
+                raise ValueError("Stage %s runs after %s, which was not added before it" % (name, stage))
+        self.stages.append(graphStage(name, after, inputs, params, outputs,
+                                      function, args, kwargs))
+        return name
+
+    def runForked(self, stage, results):
+        # the steps measured here are handed back rather than saved, and None
+        # tells that the stage failed
+        metrics = self.manifest.metrics
+        try:
+            if metrics is not None:
+                metrics.detach()
+                metrics.measure(stage.name, [x for x in stage.inputs if x is not None],
+                                stage.outputs, stage.function, *stage.args, **stage.kwargs)
+                results.put((stage.name, metrics.records))
+            else:
+                stage.function(*stage.args, **stage.kwargs)
+                results.put((stage.name, []))
+        except Exception:
+            traceback.print_exc()
+            results.put((stage.name, None))
+
+    def stopStages(self, running, name):
+        for _, process, _ in running.values():
+            process.terminate()
+        logging.error("Stage %s failed", name)
+        print >> sys.stderr, "Stage %s failed. Quitting." % name
+        sys.exit(1)
+
+    def waitForStage(self, running, results):
+        """Name and measured steps of the next forked stage to complete. Exits
+        if a stage fails, once the others are stopped."""
+        while True:
+            try:
+                name, records = results.get(timeout=STAGE_POLL)
+                if records is None:
+                    self.stopStages(running, name)
+                return name, records
+            except Empty:
+                pass
+            # a stage that exits without a result was stopped or exited itself
+            for name, (stage, process, inputs) in running.items():
+                if not process.is_alive() and results.empty():
+                    self.stopStages(running, name)
+
+    def run(self):
+        pending = list(self.stages)
+        done = set()
+        while pending and self.manifest.current(pending[0].name, pending[0].inputs,
+                                                pending[0].params, pending[0].outputs):
+            done.add(pending.pop(0).name)
+        for i, stage in enumerate(pending):
+            stage.position = len(self.manifest.stages) + i
+
+        results = Queue()
+        running = {}
+        while pending:
+            ready = [x for x in pending if all(y in done for y in x.after)]
+            if self.workers == 1 or not running and len(ready) == 1:
+                pending.remove(ready[0])
+                ready[0].run(self.manifest)
+                done.add(ready[0].name)
+                continue
+
+            for stage in ready[:self.workers - len(running)]:
+                pending.remove(stage)
+                # the inputs are fingerprinted as the stage starts, as they
+                # are when it runs in this process
+                inputs = [fileFingerprint(x) for x in stage.inputs if x is not None]
+                process = Process(target=self.runForked, args=(stage, results))
+                process.start()
+                logging.info("Started stage %s in process %d", stage.name, process.pid)
+                running[stage.name] = (stage, process, inputs)
+
+            name, records = self.waitForStage(running, results)
+            self.finishForked(running.pop(name), records)
+            done.add(name)
+
+        while running:
+            name, records = self.waitForStage(running, results)
+            self.finishForked(running.pop(name), records)
+
+    def finishForked(self, forked, records):
+        stage, process, inputs = forked
+        process.join()
+        if self.context is not None:
+            for output in stage.outputs:
+                self.context.forget(output)
+        if self.manifest.metrics is not None:
+            self.manifest.metrics.add(records)
+        self.manifest.complete(stage.position, stage.name, inputs, stage.params,
+                               stage.outputs)
+
+class previousRun(object):
+    """The stages completed by an earlier run in another output directory,
+    from its manifest, whose outputs a run updating it can reuse. Raises
+    ValueError if the earlier run has no manifest or was made by another
+    version.
+    """
+    def __init__(self, outputDir, version):
+        self.workspace = "%s/workspace" % outputDir
+        manifestFile = "%s/manifest.json" % self.workspace
+        if not exists(manifestFile):
+            raise ValueError("No manifest in %s" % self.workspace)
+        with open(manifestFile, "r") as fp:
+            manifest = json.load(fp)
+        if manifest["version"] != version:
+            raise ValueError("%s was written by version %s" % (manifestFile, manifest["version"]))
+        self.stages = dict((x["name"], x) for x in manifest["stages"])
+
+    def ranWith(self, name, inputs, params, exact=True):
+        """Whether stage name completed with the same parameters and input
+        fingerprints, and its outputs are unchanged. Unless exact, the stage
+        may have had inputs beyond those given."""
+        entry = self.stages.get(name)
+        if entry is None:
+            return False
+        inputs = [fileFingerprint(x) for x in inputs if x is not None]
+        if exact and entry["inputs"] != inputs or \
+           any(x not in entry["inputs"] for x in inputs) or \
+           entry["params"] != json.loads(json.dumps(params)):
+            return False
+        for output, checksum in entry["outputs"].items():
+            if not exists(output) or fileChecksum(output) != checksum:
+                return False
+        return True
+
+    def wrote(self, name, fileName):
+        """Whether stage name of the earlier run wrote the file with the name
+        of fileName to its workspace"""
+        entry = self.stages.get(name)
+        return entry is not None and \
+            "%s/%s" % (self.workspace, basename(fileName)) in entry["outputs"]
+
+    def sameFiles(self, fileNames):
+        """Whether files of this run have the content of the files with the
+        same names in the earlier workspace"""
+        for fileName in fileNames:
+            previous = "%s/%s" % (self.workspace, basename(fileName))
+            if not exists(previous) or fileChecksum(previous) != fileChecksum(fileName):
+                return False
+        return True
+
+if __name__ == "__main__":
+    PARSER = ap.ArgumentParser(description="""
+    List the stages recorded in a workspace manifest and check whether their
+    outputs are unchanged""", formatter_class=ap.ArgumentDefaultsHelpFormatter)
+    PARSER.add_argument('manifestFile', help='Manifest file typically named manifest.json')
+    ARGS = PARSER.parse_args()
+
+    with open(ARGS.manifestFile, "r") as fp:
+        MANIFEST = json.load(fp)
+    print "version\t%s" % MANIFEST["version"]
+    for stage in MANIFEST["stages"]:
+        status = "ok"
+        for output, checksum in stage["outputs"].items():
+            if not exists(output) or fileChecksum(output) != checksum:
+                status = "changed"
+        print "%s\t%s" % (stage["name"], status)
@@ -6,6 +6,11 @@ import argparse
 import logging
 from interlap import InterLap
 from collections import OrderedDict
+from shared import openFile, fileSize, withinMemoryBudget, lineIndex, runContext
+
+# approximate size of the parsed cluster and cluster map tables relative to
+# the size of their files
+PARSED_TABLE_FACTOR = 6
 
 class clusterI(object):
     # "imported" cluster object read from allClusters.txt
@@ -926,30 +931,40 @@ def compareVariant(cluster1, varList, claimedCls, slop, as_relative_thresh,
         claimedCls.add(cluster1.mapNum)
 
 def consolidatePEClusters(workDir, statFile, clusterFile,
-                          clusterMapFile, slop, as_relative_thresh, libDup):
+                          clusterMapFile, slop, as_relative_thresh, libDup,
+                          context=None):
     RDL_Factor=1.2 # default recommended
-    fStat = open(statFile,"r")
-    RDL = int(fStat.readline().split()[0])
-    disc_thresh = int(fStat.readlines()[5].split()[0])
+    if context is None:
+        context = runContext()
+    stats = context.bamStats(statFile)
+    RDL = int(stats.rdl)
+    disc_thresh = int(stats.dist_penalty)
     # clusters sorted by left TID and position and right TID and position for faster comparison
-    fClusters = open(clusterFile,"r")
-    fClusterMap = open(clusterMapFile, "r")
-    fVariantsPE = open(workDir+"/allVariants.pe.txt","w")
-    fVariantMapPE = open(workDir+"/variantMap.pe.txt", "w")
+    fClusters = openFile(clusterFile,"r")
+    fClusterMap = openFile(clusterMapFile, "r")
+    fVariantsPE = openFile(workDir+"/allVariants.pe.txt","w")
+    fVariantMapPE = openFile(workDir+"/variantMap.pe.txt", "w")
     consolidatedCls = OrderedDict()
     claimedCls = set() # clusters that have matched with other clusters or variants
     interCluster = InterLap()
     interVariant = InterLap()
-    clusterHash = {}
+    # beyond the memory budget the clusters and the cluster map are read back
+    # from their files when they are needed
+    compact = not withinMemoryBudget(PARSED_TABLE_FACTOR*
+                                     (fileSize(clusterFile) + fileSize(clusterMapFile)))
+    if compact:
+        logging.info('Reading clusters from %s as needed to stay within the memory budget', clusterFile)
+        clusterHash = lineIndex(clusterFile, clusterI)
+    else:
+        clusterHash = {}
+        for lineC in fClusters:
+            lineC_split = lineC.split()
+            mapNum = int(lineC_split[0])
+            clusterHash[mapNum] = clusterI(lineC)
+        fClusters.seek(0)
 
     # form all possible complex variants from PE clusters
     logging.debug('Started comparison of clusters')
-    for lineC in fClusters:
-        lineC_split = lineC.split()
-        mapNum = int(lineC_split[0])
-        clusterHash[mapNum] = clusterI(lineC)
-    fClusters.seek(0)
-
     for lineC in fClusters:
         cluster = clusterI(lineC)
         dontCompareClSet = None
@@ -994,13 +1009,16 @@ def consolidatePEClusters(workDir, statFile, clusterFile,
 
     # write list of complex variants and complex variant map to 2 sep files
     fVariantsPE.write("VariantNum\tType\tchr1\tstart1\tstop1\tchr2\tstart2\tstop2\tchr3\tstart3\tstop3\tSupportBy\tNPEClusterSupp\tNFragPESupp\tNFragSRSupp\tOrientation\n") 
-    hashedVM = {}
-    for line in fClusterMap:
-        line_split = line.split()
-        clNum = int(line_split[0])
-        clList = line_split[1:]
-        hashedVM[clNum] = clList
-        #print clNum
+    if compact:
+        hashedVM = lineIndex(clusterMapFile, lambda line: line.split()[1:])
+    else:
+        hashedVM = {}
+        for line in fClusterMap:
+            line_split = line.split()
+            clNum = int(line_split[0])
+            clList = line_split[1:]
+            hashedVM[clNum] = clList
+            #print clNum
     logging.debug('Started writing complex variants to output files')
     writeVariants(consolidatedCls, fVariantsPE, fVariantMapPE, hashedVM, 0)
     logging.debug('Finished writing complex variants to output files')
@@ -1011,7 +1029,7 @@ def consolidatePEClusters(workDir, statFile, clusterFile,
     TDArtefacts = []
     varCount = len(consolidatedCls)
     consolidatedCls = {}
-    fClaimed = open(workDir+"/claimedClusters.txt","w")
+    fClaimed = openFile(workDir+"/claimedClusters.txt","w")
     fClusters.seek(0)
     logging.debug('Started recording unclaimed clusters')
     for line in fClusters:
@@ -1103,6 +1121,10 @@ def consolidatePEClusters(workDir, statFile, clusterFile,
     fVariantsPE.close()
     fClusterMap.close()
     fVariantMapPE.close()
+    fClaimed.close()
+    if compact:
+        clusterHash.close()
+        hashedVM.close()
 
 if __name__ == "__main__":
 
@@ -4,13 +4,14 @@
 #PILEUP THRESH should be > 800 and < 10000
 
 from sys import stderr
-import pysam
 from collections import Counter
 import numpy as np
 import argparse
 import logging
-from bitarray import bitarray
-from shared import readChromosomeLengths, readBamStats
+from shared import openFile, readRegions, cachedReference, lengthsKey, \
+                   positionTable, compactPositionTables, runContext, openBAM, \
+                   mappedReferences
+from os.path import abspath
 
 # global variables
 DEL_THRESH_GT = .125
@@ -25,14 +26,35 @@ MQ0_Set = set()
 SD_S = 14
 SD_L = 24
 MIN_SPLIT_INS_COV = 7
+# in assemblies with at least MANY_SHORT_CONTIGS contigs with mapped reads
+# that are shorter than this, such as draft assemblies, these contigs share
+# one median coverage, sampled from all of them, instead of each piling up
+# its own from too few bases
+SHORT_CONTIG = 100000
+MANY_SHORT_CONTIGS = 1000
 
 def countCvg(fBAM, start, stop, chr_n):
     covOut = fBAM.count_coverage(chr_n, start, stop, read_callback="all", quality_threshold = MQT_COV)
     #covTotal = sum(map(covOut[0][1][:][,int))
 
-def formChrHash(NH_REGIONS_FILE, RDL, chrLengths):
+def formChrHash(NH_REGIONS_FILE, RDL, chrLengths, context=None):
     global chrHash
     logging.info("Forming PU hash table...")
+    chrHash.update(goodRegionsHash(NH_REGIONS_FILE, RDL, chrLengths, context))
+    logging.info("Done forming PU hash table")
+
+def goodRegionsHash(NH_REGIONS_FILE, RDL, chrLengths, context=None):
+    """Hash table of formChrHash, shared by the stages given the same context
+    and by the samples of a batch when reference caching is on"""
+    key = ("goodRegions", abspath(NH_REGIONS_FILE), RDL, lengthsKey(chrLengths))
+    build = lambda: readGoodRegions(NH_REGIONS_FILE, RDL, chrLengths)
+    if context is not None:
+        return context.table(key, build)
+    return cachedReference(key, build)
+
+def readGoodRegions(NH_REGIONS_FILE, RDL, chrLengths):
+    chrHash = {}
+    compact = compactPositionTables(chrLengths)
     fo=open(NH_REGIONS_FILE,"r")
     prev_start = -1
     prev_stop = -1
@@ -43,8 +65,7 @@ def formChrHash(NH_REGIONS_FILE, RDL, chrLengths):
         stop = int(line_s[2])+1
         if currentTID not in chrHash:
             prev_stop = -1
-            chrHash[currentTID] = bitarray(chrLengths[currentTID])
-            chrHash[currentTID].setall(0)
+            chrHash[currentTID] = positionTable(chrLengths[currentTID], compact)
             #bed file is 1-based
         # mark unreliable regions as 0 if greater than RDL (almt would be doubtful there)
         if prev_stop != -1 and currentTID == prevTID:
@@ -55,7 +76,75 @@ def formChrHash(NH_REGIONS_FILE, RDL, chrLengths):
         prev_start = start
         prev_stop = stop
         prevTID = currentTID
-    logging.info("Done forming PU hash table")
+    fo.close()
+    return chrHash
+
+def chromosomePileups(fBAM, chr_n):
+    """Pileup columns used for the median coverage of chr_n: the whole
+    chromosome, or in targeted mode its target regions (all target regions if
+    it has none)"""
+    if targetRegions is None:
+        for pileupcolumn in fBAM.pileup(chr_n, stepper="all"):
+            yield pileupcolumn
+        return
+    chrRegions = [x for x in targetRegions if x[0] == chr_n] or targetRegions
+    for chrom, start, stop in chrRegions:
+        for pileupcolumn in fBAM.pileup(chrom, start, stop, stepper="all", truncate=True):
+            yield pileupcolumn
+
+def shortContigs(fBAM):
+    """Contigs with mapped reads that share one median coverage: those
+    shorter than SHORT_CONTIG, and too short to give medianBases of their own,
+    if there are at least MANY_SHORT_CONTIGS of them; none otherwise"""
+    contigs = set(x for x in mappedReferences(fBAM) if
+                  fBAM.get_reference_length(x) < min(SHORT_CONTIG, medianBases))
+    if len(contigs) < MANY_SHORT_CONTIGS:
+        return set()
+    return contigs
+
+def shortContigPileups(fBAM, contigs):
+    """Pileup columns of the contigs, in header order"""
+    for chrom in mappedReferences(fBAM):
+        if chrom in contigs:
+            for pileupcolumn in fBAM.pileup(chrom, stepper="all"):
+                yield pileupcolumn
+
+def medianCoverage(pileupColumns, NH_REGIONS_FILE, chr_n):
+    """Median coverage of the 100 bp bins of the first medianBases columns
+    (in good regions if NH_REGIONS_FILE is given), or 0 if there are none"""
+    bin_size = 100
+    counterBase, refLoop, cov_100bp, totalCov = 0,0,0,0
+    MAX_ARRAY_SIZE = int(1.1*medianBases/bin_size)
+    covList = np.empty((MAX_ARRAY_SIZE,))
+    covListCounter = 0
+    for pileupcolumn in pileupColumns:
+        colChr = pileupcolumn.reference_name
+        if NH_REGIONS_FILE is None or \
+        (colChr in chrHash and pileupcolumn.pos < len(chrHash[colChr]) and chrHash[colChr][pileupcolumn.pos]):
+            cov_100bp += pileupcolumn.n
+            totalCov += pileupcolumn.n
+            counterBase += 1
+            refLoop += 1
+            if refLoop == bin_size:
+                #logging.debug("Covg for chr %s in bin %s: %s", chr_n, 1 + len(covList), cov_100bp)  
+                covList[covListCounter] = 1.0*cov_100bp/refLoop
+                covListCounter+=1
+                cov_100bp, refLoop = 0,0
+            if counterBase > medianBases:
+                break
+    if counterBase > 0:
+        #logging.debug("100bp cvg list: %s", covList)
+        avgCov = 1.0*totalCov/counterBase
+        covList = covList[0:covListCounter]
+        covList.sort()
+        median = covList[covList.size/2] #avgCov
+        #change to debug when test done
+        logging.debug("Median coverage of Chr %s written as %f; average was %f",
+                      chr_n, median, avgCov)
+        return median
+    logging.debug("Unable to calculate coverage reliably in chromosome %s", chr_n)
+    print >> stderr, "Note: unable to calculate coverage reliably in chromosome", chr_n
+    return 0
 
 def calculateLocCovg(NH_REGIONS_FILE,chr_n, bpFirst, bpSecond, PILEUP_THRESH, fBAM, chrHash, 
         GOOD_REG_THRESH, outerBPs, MIN_PILEUP_THRESH, MIN_PILEUP_THRESH_NH, isTD):
@@ -64,40 +153,18 @@ def calculateLocCovg(NH_REGIONS_FILE,chr_n, bpFirst, bpSecond, PILEUP_THRESH, fB
     MIN_BP_SPAN = 80
     bin_size_loc, largeDupBinThresh, TD_SIZE_SUSPECT_BOUND = 20,.5, 100000
     MIN_NBINS_LOC=40 #min((PILEUP_THRESH/bin_size_loc) - 10,40)
-    bin_size = 100
     if chr_n not in covHash:
-        logging.debug("Calculating coverage for %s", chr_n)
-        counterBase, refLoop, cov_100bp, totalCov = 0,0,0,0
-        MAX_ARRAY_SIZE = int(1.1*CALC_THRESH/bin_size)
-        covList = np.empty((MAX_ARRAY_SIZE,))
-        covListCounter = 0
-        for pileupcolumn in fBAM.pileup(chr_n, stepper="all"):
-            if NH_REGIONS_FILE is None or \
-            (chr_n in chrHash and pileupcolumn.pos < len(chrHash[chr_n]) and chrHash[chr_n][pileupcolumn.pos]):
-                cov_100bp += pileupcolumn.n
-                totalCov += pileupcolumn.n
-                counterBase += 1
-                refLoop += 1
-                if refLoop == bin_size:
-                    #logging.debug("Covg for chr %s in bin %s: %s", chr_n, 1 + len(covList), cov_100bp)  
-                    covList[covListCounter] = 1.0*cov_100bp/refLoop
-                    covListCounter+=1
-                    cov_100bp, refLoop = 0,0
-                if counterBase > CALC_THRESH:
-                    break
-        if counterBase > 0:
-            #logging.debug("100bp cvg list: %s", covList)
-            avgCov = 1.0*totalCov/counterBase
-            covList = covList[0:covListCounter]
-            covList.sort()
-            covHash[chr_n] = covList[covList.size/2] #avgCov
-            #change to debug when test done
-            logging.debug("Median coverage of Chr %s written as %f; average was %f",
-                          chr_n, covHash[chr_n], avgCov)
+        if targetRegions is None and chr_n in pooledContigs:
+            # the median shared by the short contigs is kept under None
+            if None not in covHash:
+                logging.debug("Calculating coverage for the %d short contigs", len(pooledContigs))
+                covHash[None] = medianCoverage(shortContigPileups(fBAM, pooledContigs),
+                        NH_REGIONS_FILE, "of less than %d bases" % SHORT_CONTIG)
+            covHash[chr_n] = covHash[None]
         else:
-            logging.debug("Unable to calculate coverage reliably in chromosome %s", chr_n)
-            print >> stderr, "Note: unable to calculate coverage reliably in chromosome", chr_n
-            covHash[chr_n] = 0
+            logging.debug("Calculating coverage for %s", chr_n)
+            covHash[chr_n] = medianCoverage(chromosomePileups(fBAM, chr_n),
+                                            NH_REGIONS_FILE, chr_n)
 
     if bpSecond - bpFirst < MIN_BP_SPAN:
         bpFirstL = outerBPs[0]
@@ -357,6 +424,23 @@ def calculateLocCovg(NH_REGIONS_FILE,chr_n, bpFirst, bpSecond, PILEUP_THRESH, fB
     else:
         return 0, 0,0
 
+def localCoverage(NH_REGIONS_FILE, chr_n, bpFirst, bpSecond, PILEUP_THRESH, fBAM,
+        chrHash, GOOD_REG_THRESH, outerBPs, MIN_PILEUP_THRESH, MIN_PILEUP_THRESH_NH, isTD):
+    """calculateLocCovg, remembered across the calls of covPUFilter that share
+    a coverage cache"""
+    if locCovHash is None:
+        return calculateLocCovg(NH_REGIONS_FILE, chr_n, bpFirst, bpSecond,
+                PILEUP_THRESH, fBAM, chrHash, GOOD_REG_THRESH, outerBPs,
+                MIN_PILEUP_THRESH, MIN_PILEUP_THRESH_NH, isTD)
+    key = (NH_REGIONS_FILE, chr_n, bpFirst, bpSecond, PILEUP_THRESH,
+           GOOD_REG_THRESH, tuple(outerBPs), MIN_PILEUP_THRESH,
+           MIN_PILEUP_THRESH_NH, isTD)
+    if key not in locCovHash:
+        locCovHash[key] = calculateLocCovg(NH_REGIONS_FILE, chr_n, bpFirst,
+                bpSecond, PILEUP_THRESH, fBAM, chrHash, GOOD_REG_THRESH,
+                outerBPs, MIN_PILEUP_THRESH, MIN_PILEUP_THRESH_NH, isTD)
+    return locCovHash[key]
+
 def writeVariants(lineAV_split, swap, bnd, support, GT, fAVN, 
                   SR_DEL_THRESH, MIX_DEL_THRESH, UNIV_VAR_THRESH, covInfo):
    
@@ -383,7 +467,11 @@ def writeVariants(lineAV_split, swap, bnd, support, GT, fAVN,
 
 def covPUFilter(workDir, avFile, vmFile, ufFile, statFile, bamFile,
                 NH_REGIONS_FILE, DEL_THRESH, DUP_THRESH, splitINS, 
-                PILEUP_THRESH, GOOD_REG_THRESH, minVariantSize):
+                PILEUP_THRESH, GOOD_REG_THRESH, minVariantSize, regions=None,
+                coverageCache=None, context=None, preview=1.0):
+    # coverageCache, if given, is a dict that keeps the chromosome medians and
+    # local coverages for later calls on the same BAM and good-regions files.
+    # A preview samples the coverage from the given fraction of the bases.
 
     #statistical constants 
     MIN_PILEUP_THRESH = 80
@@ -392,13 +480,18 @@ def covPUFilter(workDir, avFile, vmFile, ufFile, statFile, bamFile,
     INS_VAR_THRESH = minVariantSize
     SR_DEL_THRESH = max(80, minVariantSize)
     MIX_DEL_THRESH = max(50, minVariantSize)
-    fAV = open(avFile,"r")
-    fVM=open(vmFile,"r")
-    fUF = open(ufFile,"r")
-    fAVN = open(workDir+"/allVariants.pu.txt","w")
+    if preview < 1:
+        PILEUP_THRESH = max(MIN_PILEUP_THRESH, PILEUP_THRESH*preview)
+    fAV = openFile(avFile,"r")
+    fVM=openFile(vmFile,"r")
+    fUF = openFile(ufFile,"r")
+    fAVN = openFile(workDir+"/allVariants.pu.txt","w")
     fAVN.write("VariantNum\tType\tchr1\tstart1\tstop1\tchr2\tstart2\tstop2\tchr3\tstart3\tstop3\t SupportBy\tNPEClusterSupp\tNFragPESupp\tNFragSRSupp\tSwapBP\tBNDFlag\tSupport\tGT\n")
     logging.info("Writing final bedpe files using coverage information")
-    RDL,SD,COV = readBamStats(statFile)
+    if context is None:
+        context = runContext()
+    stats = context.bamStats(statFile)
+    RDL, SD = stats.rdl, stats.sd_IL
     logging.info("Some stats from BAM. RDL: %d, Sd: %f", 
                   RDL, SD)
 
@@ -410,17 +503,29 @@ def covPUFilter(workDir, avFile, vmFile, ufFile, statFile, bamFile,
     uniqueFilterSVs = set()
     global chrHash
     global covHash
+    global targetRegions
+    global locCovHash
+    global medianBases
+    global pooledContigs
     chrHash = {}
-    covHash = {}
+    medianBases = CALC_THRESH*preview
+    if coverageCache is None:
+        covHash = {}
+        locCovHash = None
+    else:
+        covHash = coverageCache.setdefault("chromosomes", {})
+        locCovHash = coverageCache.setdefault("regions", {})
+    targetRegions = regions
 
     for line in fUF:
         uniqueFilterSVs.add(int(line))
 
-    fBAM = pysam.AlignmentFile(bamFile, "rb" )
+    fBAM = openBAM(bamFile, "rb")
+    pooledContigs = shortContigs(fBAM)
     if NH_REGIONS_FILE is not None:
         logging.info("Using good-regions BED file %s in cov PU", NH_REGIONS_FILE)
-        chrLengths = readChromosomeLengths(bamFile)
-        formChrHash(NH_REGIONS_FILE, RDL, chrLengths)
+        chrLengths = context.chromosomeLengths(bamFile)
+        formChrHash(NH_REGIONS_FILE, RDL, chrLengths, context)
     else:
         print >> stderr, "Warning! Not using a good regions file for pile-up filter! This can affect some coverage-based results adversely."
 
@@ -460,7 +565,7 @@ def covPUFilter(workDir, avFile, vmFile, ufFile, statFile, bamFile,
 
                     if svtype.startswith("TD"):
                         isTD = 1
-                    covLocM, confMiddle, largeDupRet = calculateLocCovg(NH_REGIONS_FILE,lineAV_split[2],
+                    covLocM, confMiddle, largeDupRet = localCoverage(NH_REGIONS_FILE,lineAV_split[2],
                             int(lineAV_split[4]), int(lineAV_split[6]),
                             PILEUP_THRESH, fBAM, chrHash, GOOD_REG_THRESH, [int(lineAV_split[3]), int(lineAV_split[7])],
                             MIN_PILEUP_THRESH, MIN_PILEUP_THRESH_NH, isTD)
@@ -502,7 +607,7 @@ def covPUFilter(workDir, avFile, vmFile, ufFile, statFile, bamFile,
                     #use inner bounds for all
                     start = int(lineAV_split[7])
                     stop = int(lineAV_split[9])
-                    covLoc_23, conf_23, _ = calculateLocCovg(NH_REGIONS_FILE,lineAV_split[5],
+                    covLoc_23, conf_23, _ = localCoverage(NH_REGIONS_FILE,lineAV_split[5],
                             start, stop, PILEUP_THRESH, fBAM, chrHash, GOOD_REG_THRESH, 
                             [int(lineAV_split[6]), int(lineAV_split[10])], MIN_PILEUP_THRESH, MIN_PILEUP_THRESH_NH, isTD)
                     covInfo = covLoc_23
@@ -517,7 +622,7 @@ def covPUFilter(workDir, avFile, vmFile, ufFile, statFile, bamFile,
                         stop = int(lineAV_split[3])
                         outerBPs = [int(lineAV_split[9]), int(lineAV_split[4])]
                     if lineAV_split[2] == lineAV_split[5]:
-                        covLoc_12, conf_12, _ = calculateLocCovg(NH_REGIONS_FILE,lineAV_split[5],
+                        covLoc_12, conf_12, _ = localCoverage(NH_REGIONS_FILE,lineAV_split[5],
                                 start, stop, PILEUP_THRESH, fBAM, chrHash, GOOD_REG_THRESH, outerBPs, 
                                 MIN_PILEUP_THRESH, MIN_PILEUP_THRESH_NH, isTD)
                     else:
@@ -535,7 +640,7 @@ def covPUFilter(workDir, avFile, vmFile, ufFile, statFile, bamFile,
                             stop = int(lineAV_split[3])
                             outerBPs = [int(lineAV_split[6]), int(lineAV_split[4])]
                         if lineAV_split[2] == lineAV_split[5]:
-                            covLoc_13, conf_13, _ = calculateLocCovg(NH_REGIONS_FILE,lineAV_split[5],
+                            covLoc_13, conf_13, _ = localCoverage(NH_REGIONS_FILE,lineAV_split[5],
                                     start, stop, PILEUP_THRESH, fBAM, chrHash, GOOD_REG_THRESH, outerBPs, 
                                     MIN_PILEUP_THRESH, MIN_PILEUP_THRESH_NH, isTD)
 
@@ -682,7 +787,8 @@ def covPUFilter(workDir, avFile, vmFile, ufFile, statFile, bamFile,
     fBAM.close()
     chrHash.clear()
     del chrHash
-    covHash.clear()
+    if coverageCache is None:
+        covHash.clear()
     del covHash
 
 if __name__ == "__main__":
@@ -711,6 +817,10 @@ if __name__ == "__main__":
         help='Liberal INV calling: 1 PE cluster + SR support sufficient')
     PARSER.add_argument('-s', default=100, dest='minVarSize', type=int, help='minimum size of variants called')
     PARSER.add_argument('-v', default=0, dest='verbose', type=int, help='Verbose output')
+    PARSER.add_argument('-r', default=None, dest='regions',
+        help='BED file of target regions to sample the median coverage from')
+    PARSER.add_argument('--preview', default=1.0, type=float,
+        help='Fraction of the fragments kept by a preview; the coverage is sampled from this fraction of the bases')
     ARGS = PARSER.parse_args()
 
     LEVEL = logging.INFO
@@ -724,6 +834,8 @@ if __name__ == "__main__":
     covPUFilter(ARGS.workDir, ARGS.avFile, ARGS.vmFile, ARGS.ufFile, 
                 ARGS.statFile, ARGS.bamFile, ARGS.NH_REGIONS_FILE,
                 ARGS.DEL_THRESH, ARGS.DUP_THRESH, ARGS.splitINS,
-                ARGS.PILEUP_THRESH, ARGS.GOOD_REG_THRESH, ARGS.minVarSize)
+                ARGS.PILEUP_THRESH, ARGS.GOOD_REG_THRESH, ARGS.minVarSize,
+                readRegions(ARGS.regions) if ARGS.regions else None,
+                preview=ARGS.preview)
 
     logging.shutdown()
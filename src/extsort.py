@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+# Stable external merge sort of tab-separated tables, so that sorting the
+# discordant and cluster tables does not need them to fit in memory
+import argparse as ap
+import heapq
+import logging
+from itertools import groupby
+import sys
+import tempfile
+from os import fdopen, remove
+from shared import openFile, noteRecords
+
+# default memory budget for the lines held by one sort
+DEFAULT_MAX_MEMORY = 512*1024*1024
+# smaller budgets are raised to this, as the BAM name sorts do, so that a run
+# holds more than a line or two
+MIN_MAX_MEMORY = 1024*1024
+# at most this many sorted runs are merged, and so open, at once
+MAX_MERGE_RUNS = 64
+# approximate bookkeeping cost per line (list slot, key tuple, its items)
+LINE_OVERHEAD = 160
+
+# keys matching the pandas sorts they replace; string columns compare as
+# strings and position columns as integers
+def discordantKey(line):
+    # allDiscordants: index lchr lpos rchr rpos ...
+    fields = line.split("\t", 5)
+    return (fields[1], fields[3], int(fields[2]), int(fields[4]))
+
+def discordantRecordKey(record):
+    # discordantKey of a record handed on by writeDiscordantFragments
+    return (record[1], record[3], record[2], record[4])
+
+def discordantPairKey(line):
+    # the chromosome pair (lchr, rchr) that leads discordantKey
+    fields = line.split("\t", 4)
+    return (fields[1], fields[3])
+
+def clusterLeftKey(line):
+    # allClusters: index ns orient lchr lpos ...
+    fields = line.split("\t", 5)
+    return (fields[3], int(fields[4]))
+
+def clusterRightKey(line):
+    # allClusters: ... rchr rpos rend small
+    fields = line.split("\t", 8)
+    return (fields[6], int(fields[7]))
+
+def bedKey(line):
+    fields = line.split("\t", 2)
+    return (fields[0], int(fields[1]))
+
+def writeRun(lines, tmpDir):
+    fd, runFile = tempfile.mkstemp(suffix=".run", dir=tmpDir)
+    with fdopen(fd, "w") as f:
+        f.writelines(lines)
+    return runFile
+
+def readRun(runFile, key, runNum):
+    # the run number breaks ties between runs, so that equal keys keep their
+    # input order; lines of one run are never compared to each other
+    with open(runFile, "r") as f:
+        for line in f:
+            yield key(line), runNum, line
+
+def mergeRuns(runs, key, tmpDir):
+    """(key, run number, line) of the lines of the sorted runs in order. While
+    there are more than MAX_MERGE_RUNS runs, consecutive runs are merged into
+    one in their place, so that equal keys keep their order"""
+    while len(runs) > MAX_MERGE_RUNS:
+        logging.debug("Merging %d sorted runs into %d", len(runs),
+                      (len(runs) + MAX_MERGE_RUNS - 1)/MAX_MERGE_RUNS)
+        i = 0
+        while i < len(runs):
+            batch = runs[i:i + MAX_MERGE_RUNS]
+            if len(batch) > 1:
+                merged = heapq.merge(*[readRun(x, key, j)
+                                       for j, x in enumerate(batch)])
+                runs[i:i + MAX_MERGE_RUNS] = [writeRun((x[2] for x in merged), tmpDir)]
+                for runFile in batch:
+                    remove(runFile)
+            i += 1
+    return heapq.merge(*[readRun(x, key, i) for i, x in enumerate(runs)])
+
+def externalSort(inFile, outFile, key, maxMemory=DEFAULT_MAX_MEMORY, tmpDir=None):
+    """Sort the lines of inFile by key into outFile. The sort is stable and
+    holds at most about maxMemory bytes of lines; beyond that sorted runs are
+    spilled to tmpDir (the directory of outFile by default) and merged.
+    Budgets below MIN_MAX_MEMORY are raised to it. Returns the number of
+    lines sorted.
+    """
+    if tmpDir is None:
+        tmpDir = outFile.rsplit("/", 1)[0] if "/" in outFile else "."
+    maxMemory = max(maxMemory, MIN_MAX_MEMORY)
+    runs = []
+    lines = []
+    used = 0
+    nLines = 0
+    try:
+        with openFile(inFile, "r") as fIn:
+            for line in fIn:
+                if not line.endswith("\n"):
+                    line += "\n"
+                lines.append(line)
+                used += sys.getsizeof(line) + LINE_OVERHEAD
+                nLines += 1
+                if used >= maxMemory:
+                    lines.sort(key=key)
+                    runs.append(writeRun(lines, tmpDir))
+                    lines = []
+                    used = 0
+        lines.sort(key=key)
+
+        with openFile(outFile, "w") as fOut:
+            if not runs:
+                fOut.writelines(lines)
+            else:
+                runs.append(writeRun(lines, tmpDir))
+                lines = []
+                logging.debug("Merging %d sorted runs of %s", len(runs), inFile)
+                for _, _, line in mergeRuns(runs, key, tmpDir):
+                    fOut.write(line)
+        noteRecords(inFile, nLines)
+        noteRecords(outFile, nLines)
+    finally:
+        for runFile in runs:
+            remove(runFile)
+    return nLines
+
+def sortedGroups(inFile, outFile, key, groupKey, maxMemory=DEFAULT_MAX_MEMORY,
+                 tmpDir=None):
+    """Sort inFile into outFile as externalSort() does, yielding the lines of
+    every group of lines with the same groupKey as soon as they are written.
+    groupKey must order the lines as the leading items of key do. Lines held
+    in memory are sorted one group at a time, so the first group is yielded
+    without sorting the others.
+    """
+    if tmpDir is None:
+        tmpDir = outFile.rsplit("/", 1)[0] if "/" in outFile else "."
+    maxMemory = max(maxMemory, MIN_MAX_MEMORY)
+    runs = []
+    lines = []
+    used = 0
+    nLines = 0
+    try:
+        with openFile(inFile, "r") as fIn:
+            for line in fIn:
+                if not line.endswith("\n"):
+                    line += "\n"
+                lines.append(line)
+                used += sys.getsizeof(line) + LINE_OVERHEAD
+                nLines += 1
+                if used >= maxMemory:
+                    lines.sort(key=key)
+                    runs.append(writeRun(lines, tmpDir))
+                    lines = []
+                    used = 0
+
+        with openFile(outFile, "w") as fOut:
+            if not runs:
+                # the groups keep the input order, which the stable sort of
+                # each keeps among equal keys
+                groups = {}
+                for line in lines:
+                    groups.setdefault(groupKey(line), []).append(line)
+                del lines[:]
+                for group in sorted(groups):
+                    groupLines = groups.pop(group)
+                    groupLines.sort(key=key)
+                    fOut.writelines(groupLines)
+                    yield groupLines
+            else:
+                lines.sort(key=key)
+                runs.append(writeRun(lines, tmpDir))
+                lines = []
+                logging.debug("Merging %d sorted runs of %s", len(runs), inFile)
+                merged = mergeRuns(runs, key, tmpDir)
+                for _, group in groupby((x[2] for x in merged), groupKey):
+                    groupLines = list(group)
+                    fOut.writelines(groupLines)
+                    yield groupLines
+        noteRecords(inFile, nLines)
+        noteRecords(outFile, nLines)
+    finally:
+        for runFile in runs:
+            remove(runFile)
+
+if __name__ == "__main__":
+    PARSER = ap.ArgumentParser(description="""
+    Sort a discordant, cluster or BED table with bounded memory""",
+    formatter_class=ap.ArgumentDefaultsHelpFormatter)
+    PARSER.add_argument('inFile', help='Input table')
+    PARSER.add_argument('outFile', help='Sorted output table')
+    PARSER.add_argument('-k', default='discordant', dest='key',
+        choices=['discordant', 'clusterLeft', 'clusterRight', 'bed'],
+        help='Columns to sort by')
+    PARSER.add_argument('-m', default=DEFAULT_MAX_MEMORY/(1024*1024), dest='maxMemory',
+        type=int, help='Memory budget in MB')
+    PARSER.add_argument('-T', default=None, dest='tmpDir',
+        help='Directory for sorted runs')
+    ARGS = PARSER.parse_args()
+
+    KEYS = {'discordant': discordantKey, 'clusterLeft': clusterLeftKey,
+            'clusterRight': clusterRightKey, 'bed': bedKey}
+    externalSort(ARGS.inFile, ARGS.outFile, KEYS[ARGS.key],
+                 ARGS.maxMemory*1024*1024, ARGS.tmpDir)
@@ -1,12 +1,17 @@
 #!/usr/bin/env python
 
 # Form PE clusters from discordant PE alignments written by writeDiscordantFragments.py, via a maximal clique formulation
-import pysam
-import networkx as nx
+# networkx and sklearn are slow to import, so they are imported by the
+# functions that use them
 import argparse as ap
+import hashlib
 import logging
 import gc
-from sklearn.cluster import KMeans
+from cStringIO import StringIO
+from itertools import imap, chain
+from multiprocessing import Pool
+from os.path import exists
+from shared import openFile, readReadGroupStats, runContext, memoryRecords
 
 ##global variables
 #margin to increase max_cluster_length due to split reads affecting insert size
@@ -14,6 +19,8 @@ SR_GRACE_MARGIN = 40
 # subsampling routine variables
 block_gap_thresh = 25
 block_thresh = 20 # no more than 20 almts processed within a slop of 25
+# IL distributions of the read groups, if the BAM has several
+RG_STATS = {}
 
 class fragment(object):
     def __init__(self):
@@ -44,18 +51,11 @@ class cluster(object):
         self.clSmall = -1
         self.fragNum = -1
         self.used = 0
+        self.readGroup = None
 
     def __str__(self):
         return "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s" % (self.count, self.cType, self.lTID, self.l_start, self.l_end, self.rTID, self.r_start, self.r_end, self.clSmall)
 
-def readBamStats(statFile):
-    stats = []
-    with open(statFile,"r") as fp:
-        for line in fp:
-            stats.append(line)
-    stats = map(float,stats)
-    return stats[0], stats[1], stats[5], stats[6], stats[7]
-
 def readDistHash(fp):
     global IL_BinDistHash
     total_entries = 0
@@ -65,6 +65,17 @@ def readDistHash(fp):
         total_entries+= ls1
     return total_entries
 
+def maxClusterLength(stats, disc_enhancer, rgStats):
+    """Longest span of a cluster allowed by the IL distribution of the
+    library (stats, as read from bamStats.txt), or by the widest one if there
+    are several read groups"""
+    max_cluster_length = stats.mean_IL + disc_enhancer*stats.disc_thresh - \
+                         2*stats.rdl + SR_GRACE_MARGIN
+    for rgRdl, rgMeanIL, rgDiscThresh, _, _, _, _ in rgStats.values():
+        max_cluster_length = max(max_cluster_length, rgMeanIL + \
+            disc_enhancer*rgDiscThresh - 2*rgRdl + SR_GRACE_MARGIN)
+    return max_cluster_length
+
 def calcDistPen(f1_lPos, f2_lPos, rdl, dist_end, mean_IL, dist_penalty):
         
     if dist_penalty <= dist_end:
@@ -172,6 +183,8 @@ def calculateMargin(clusterC, max_cluster_length, disc_thresh, bp_margin):
 def writeClusters(fragGraph, fragHash, fCliques, fClusters, fClusterMap,
                   preserveList, clusterNum, mean_IL, disc_thresh,
                   max_cluster_length, bp_margin, min_cluster_size, debug):
+    import networkx as nx
+    from sklearn.cluster import KMeans
 
     max_clique_list = []
     # do not form cliques out of most recent fragments, as they will connect further
@@ -212,7 +225,9 @@ def writeClusters(fragGraph, fragHash, fCliques, fClusters, fClusterMap,
                     sample.append([fragHash[item].l_bound, fragHash[item].r_bound])
 
             if len(sample) > 1:
-                kmeans = KMeans(n_clusters=2)
+                # fixed seed so that clusters do not depend on which process
+                # (or how many earlier calls) consumed the global random state
+                kmeans = KMeans(n_clusters=2, random_state=0)
                 kmeans = kmeans.fit(sample)
                 label = kmeans.predict(sample)
                 labelList = list(label)
@@ -352,7 +367,15 @@ def processNewFrag(fragList, almt, IL_BinTotalEntries, fragmentGraph,
             f1_rPos = storedAlmt.r_bound
             f2_lPos = almt.l_bound
             f2_rPos = almt.r_bound
-            edge_weight = calcEdgeWeight(f1_lPos, f1_rPos, f2_lPos, f2_rPos, IL_BinTotalEntries, almt.cType, dist_penalty, dist_end, rdl, IL_BinDistHash, mean_IL, almt.clSmall)
+            if almt.readGroup is not None and \
+               almt.readGroup == storedAlmt.readGroup and \
+               almt.readGroup in RG_STATS:
+                # both fragments come from the same library
+                rgRdl, rgMeanIL, _, rgDistPenalty, rgDistEnd, rgBinDistHash, \
+                    rgBinTotalEntries = RG_STATS[almt.readGroup]
+                edge_weight = calcEdgeWeight(f1_lPos, f1_rPos, f2_lPos, f2_rPos, rgBinTotalEntries, almt.cType, rgDistPenalty, rgDistEnd, rgRdl, rgBinDistHash, rgMeanIL, almt.clSmall)
+            else:
+                edge_weight = calcEdgeWeight(f1_lPos, f1_rPos, f2_lPos, f2_rPos, IL_BinTotalEntries, almt.cType, dist_penalty, dist_end, rdl, IL_BinDistHash, mean_IL, almt.clSmall)
             if edge_weight > 0: logging.debug("Edge weight is: %f", edge_weight)
 
             # only add node if calculation threshold to get edge_weight_thresh
@@ -361,6 +384,13 @@ def processNewFrag(fragList, almt, IL_BinTotalEntries, fragmentGraph,
                 if storedAlmt.fragNum != almt.fragNum:
                     fragmentGraph.add_edge(storedAlmt.fragNum, almt.fragNum)
 
+def pruneFragHash(fragHash, fragmentGraph):
+    """Drop the fragments that have left the graph, as their clusters have
+    been written and they are not looked up again"""
+    for fragNum in fragHash.keys():
+        if fragNum not in fragmentGraph:
+            del fragHash[fragNum]
+
 def refreshFragList(fragList, almt, fragmentGraph, fragHash,
                     fCliques, fClusters, fClusterMap, max_cluster_length,
                     clusterNum, newClusterBlock, mean_IL, disc_thresh,
@@ -374,6 +404,7 @@ def refreshFragList(fragList, almt, fragmentGraph, fragHash,
             clusterNum = writeClusters(fragmentGraph, fragHash, fCliques, fClusters, fClusterMap, [], clusterNum, mean_IL, disc_thresh, max_cluster_length, bp_margin, min_cluster_size, debug)
             fragmentGraph.clear()
             fragmentGraph.add_node(fragList[0].fragNum)
+            pruneFragHash(fragHash, fragmentGraph)
         elif almt.lTID == fragList[newClusterBlock].lTID and \
                 (almt.l_bound - fragList[newClusterBlock].l_bound) > 2*max_cluster_length:
             nodeList = {}
@@ -381,56 +412,67 @@ def refreshFragList(fragList, almt, fragmentGraph, fragHash,
                 nodeList[frag.fragNum] = 1
             clusterNum = writeClusters(fragmentGraph, fragHash, fCliques, fClusters, fClusterMap, nodeList, clusterNum, mean_IL, disc_thresh, max_cluster_length, bp_margin, min_cluster_size, debug)
             del fragList[0:newClusterBlock]
+            pruneFragHash(fragHash, fragmentGraph)
             logging.debug('Deleted %d elems from list', newClusterBlock)
             newClusterBlock = len(fragList)-1
 
     return fragList, clusterNum, newClusterBlock, fragHash
 
-def formPEClusters(workDir, statFile, IL_BinFile, min_cluster_size,
-                   disc_enhancer, bp_margin, subsample, debug):
-    # read the stats
-    rdl, mean_IL, disc_thresh, dist_penalty, dist_end = readBamStats(statFile)
-    max_cluster_length = mean_IL + disc_enhancer*disc_thresh - 2*rdl + SR_GRACE_MARGIN
-    logging.info('max_cluster_length is %f', max_cluster_length)
-
+def readDiscordant(line):
+    """Parse one line of allDiscordants.txt into a cluster() object"""
+    parsed = line.strip().split()
+    almt = cluster()
+    almt.l_bound = int(parsed[2])
+    almt.r_bound = int(parsed[4])
+    almt.cType = parsed[5]
+    almt.lTID = parsed[1]
+    almt.rTID = parsed[3]
+    almt.clSmall = int(parsed[6])
+    almt.fragNum = parsed[0]
+    if len(parsed) > 8:
+        almt.readGroup = int(parsed[8])
+    return almt
+
+def recordDiscordant(record):
+    """readDiscordant() of a record handed on in memory by
+    writeDiscordantFragments"""
+    almt = cluster()
+    almt.fragNum, almt.lTID, almt.l_bound, almt.rTID, almt.r_bound, \
+        almt.cType, almt.clSmall = record[:7]
+    almt.fragNum = str(almt.fragNum)
+    if record[8] is not None:
+        almt.readGroup = record[8]
+    return almt
+
+def isArtefact(almt):
+    return almt.lTID == almt.rTID and almt.l_bound == almt.r_bound and \
+        (almt.cType == "00" or almt.cType == "11")
+
+def clusterDiscordants(fDiscAlmts, secCounter, fClusters, fClusterMap, fCliques,
+                       rdl, mean_IL, disc_thresh, dist_penalty, dist_end,
+                       max_cluster_length, IL_BinTotalEntries,
+                       min_cluster_size, bp_margin, subsample, debug,
+                       parse=readDiscordant):
+    """Form clusters from the sorted discordant alignments in fDiscAlmts,
+    each read by parse, and write them out numbered from 1. Returns the
+    number of clusters written.
+    """
+    import networkx as nx
     edge_weight_thresh = 0.00
-    global IL_BinDistHash
-    global block_hash
-    IL_BinDistHash = {}
-    block_hash = {}
     fragList = []
-    fBin=open(IL_BinFile,"r")
-    IL_BinTotalEntries = readDistHash(fBin)
     fragHash = {}
-    secCounter = {}
     fragmentGraph = nx.Graph()
     clusterNum = 1
     newClusterBlock = 0
 
-    fDiscAlmts=open(workDir+"/allDiscordants.txt","r")
-    fClusters=open(workDir+"/allClusters.txt","w")
-    fClusterMap=open(workDir+"/clusterMap.txt","w")
-    fCliques = None
-    if debug:
-        fCliques = open(workDir+"/clusterCliques.txt","w")
-
-    logging.info('Started PE cluster formation')
     for line_num,line in enumerate(fDiscAlmts):
         if line_num % 1000 == 0:
             logging.debug("Processed %s alignments", line_num)
 
-        parsed = line.strip().split()
-        almt = cluster()
-        almt.l_bound = int(parsed[2])
-        almt.r_bound = int(parsed[4])
-        almt.cType = parsed[5]
-        almt.lTID = parsed[1]
-        almt.rTID = parsed[3]
-        almt.clSmall = int(parsed[6])
-        almt.fragNum = parsed[0]
+        almt = parse(line)
 
         #ignore artefact seen often
-        if almt.lTID == almt.rTID and almt.l_bound == almt.r_bound and (almt.cType == "00" or almt.cType == "11"):
+        if isArtefact(almt):
             logging.debug("Fragment %s appears to be an alignment artefact", almt.fragNum)
             continue
 
@@ -453,7 +495,7 @@ def formPEClusters(workDir, statFile, IL_BinFile, min_cluster_size,
                 block_hash[(almt.l_bound, almt.r_bound)] = 1
 
         fragmentGraph.add_node(almt.fragNum)
-        if almt.fragNum not in fragHash:
+        if almt.fragNum not in secCounter:
             fragHash[almt.fragNum] = almt
             secCounter[almt.fragNum] = 1
         # add sec almts of same fragment with underscore
@@ -468,11 +510,343 @@ def formPEClusters(workDir, statFile, IL_BinFile, min_cluster_size,
 
         # refresh fragment list
         fragList, clusterNum, newClusterBlock, fragHash = refreshFragList(fragList, almt, fragmentGraph, fragHash, fCliques,  fClusters, fClusterMap, max_cluster_length, clusterNum, newClusterBlock, mean_IL, disc_thresh, bp_margin, debug, min_cluster_size)
-    logging.info('Finished PE cluster formation')
 
-    logging.info('Started writing remaining clusters')
     clusterNum = writeClusters(fragmentGraph, fragHash, fCliques, fClusters, fClusterMap, [], clusterNum, mean_IL, disc_thresh, max_cluster_length, bp_margin, min_cluster_size, debug)
-    logging.info('Finished writing remaining clusters')
+
+    fragHash.clear()
+    del fragHash
+
+    return clusterNum - 1
+
+def partitionDiscordants(discFile):
+    """Split the sorted allDiscordants.txt into runs of alignments that share
+    (lchr, rchr). Clusters never span two such runs, so each run can be
+    clustered independently. Returns a list of (start, end, secCounter) with
+    byte offsets of each run and the secondary alignment counts carried into
+    it from earlier runs, so that fragment labels match a serial pass.
+    """
+    partitions = []
+    secCounter = {}
+    key = None
+    start = 0
+    with openFile(discFile, "r") as fp:
+        while True:
+            offset = fp.tell()
+            line = fp.readline()
+            if not line:
+                break
+            almt = readDiscordant(line)
+            if (almt.lTID, almt.rTID) != key:
+                if key is not None:
+                    partitions.append((start, offset, carried))
+                key = (almt.lTID, almt.rTID)
+                start = offset
+                carried = {}
+                seen = set()
+            if isArtefact(almt):
+                continue
+            if almt.fragNum not in seen:
+                seen.add(almt.fragNum)
+                if almt.fragNum in secCounter:
+                    carried[almt.fragNum] = secCounter[almt.fragNum]
+            secCounter[almt.fragNum] = secCounter.get(almt.fragNum, 0) + 1
+        if key is not None:
+            partitions.append((start, offset, carried))
+
+    secCounter.clear()
+    del secCounter
+    return partitions
+
+def carriedCounts(lines, secCounter):
+    """Secondary alignment counts carried into the partition of lines from
+    the partitions before it, as partitionDiscordants() finds them; secCounter
+    is updated with its alignments."""
+    carried = {}
+    seen = set()
+    for line in lines:
+        almt = readDiscordant(line)
+        if isArtefact(almt):
+            continue
+        if almt.fragNum not in seen:
+            seen.add(almt.fragNum)
+            if almt.fragNum in secCounter:
+                carried[almt.fragNum] = secCounter[almt.fragNum]
+        secCounter[almt.fragNum] = secCounter.get(almt.fragNum, 0) + 1
+    return carried
+
+def readPartition(discFile, start, end):
+    with openFile(discFile, "r") as fp:
+        fp.seek(start)
+        while fp.tell() < end:
+            yield fp.readline()
+
+def initClusterWorker(IL_BinFile, rgStatFile, rgBinFile):
+    global IL_BinDistHash
+    global block_hash
+    global RG_STATS
+    IL_BinDistHash = {}
+    block_hash = {}
+    with openFile(IL_BinFile, "r") as fBin:
+        readDistHash(fBin)
+    RG_STATS = readReadGroupStats(rgStatFile, rgBinFile)
+
+def clusterPartition(args):
+    """Cluster one partition from partitionDiscordants() in a worker process.
+    Returns the cluster, cluster map and clique records numbered from 1.
+    """
+    discFile, start, end, secCounter, params = args
+    return clusterLines((readPartition(discFile, start, end), secCounter, params))
+
+def clusterLines(args):
+    """Cluster the lines of one partition, as clusterPartition() does"""
+    lines, secCounter, params = args
+    fClusters = StringIO()
+    fClusterMap = StringIO()
+    fCliques = StringIO()
+    nClusters = clusterDiscordants(lines, secCounter, fClusters, fClusterMap,
+                                   fCliques, *params)
+    return nClusters, fClusters.getvalue(), fClusterMap.getvalue(), \
+        fCliques.getvalue()
+
+def renumberClusters(records, offset, prefix=""):
+    """Shift the cluster numbers of records written by writeClusters()"""
+    out = []
+    for line in records.splitlines(True):
+        if line.startswith(prefix):
+            num, rest = line[len(prefix):].split("\t", 1)
+            line = "%s%d\t%s" % (prefix, int(num) + offset, rest)
+        out.append(line)
+    return "".join(out)
+
+def partitionDigest(discFile, start, end, carried):
+    """Chromosome pair of a partition from partitionDiscordants(), and a
+    digest of its alignments and the counts carried into it. Partitions with
+    the same digest form the same clusters."""
+    return linesDigest(readPartition(discFile, start, end), carried)
+
+def linesDigest(lines, carried):
+    md5 = hashlib.md5()
+    key = None
+    for line in lines:
+        if key is None:
+            fields = line.split("\t")
+            key = (fields[1], fields[3])
+        md5.update(line)
+    md5.update(repr(sorted(carried.items())))
+    return key, md5.hexdigest()
+
+def readPreviousClusters(previousDir, debug):
+    """Cluster, cluster map and clique records of an earlier run, grouped by
+    chromosome pair. Returns a dictionary of [first cluster number, number of
+    clusters, clusters, cluster map, cliques] for every pair."""
+    groups = {}
+    clusterKeys = {}
+    with openFile(previousDir + "/allClusters.txt", "r") as fp:
+        for line in fp:
+            fields = line.split("\t")
+            key = (fields[3], fields[6])
+            if key not in groups:
+                groups[key] = [int(fields[0]), 0, [], [], []]
+            groups[key][1] += 1
+            groups[key][2].append(line)
+            clusterKeys[fields[0]] = key
+    with openFile(previousDir + "/clusterMap.txt", "r") as fp:
+        for line in fp:
+            groups[clusterKeys[line.split("\t", 1)[0]]][3].append(line)
+    if debug:
+        with openFile(previousDir + "/clusterCliques.txt", "r") as fp:
+            for line in fp:
+                if line.startswith("@Cluster"):
+                    key = clusterKeys[line[len("@Cluster"):].split("\t", 1)[0]]
+                groups[key][4].append(line)
+    for group in groups.values():
+        group[2:] = ["".join(x) for x in group[2:]]
+    return groups
+
+def writePartition(result, clusterNum, fClusters, fClusterMap, fCliques):
+    """Write the records of a partition, as (number of its first cluster,
+    number of clusters, clusters, cluster map, cliques), numbered from
+    clusterNum. Returns the number of the next cluster."""
+    first, nClusters, clusters, clusterMap, cliques = result
+    fClusters.write(renumberClusters(clusters, clusterNum - first))
+    fClusterMap.write(renumberClusters(clusterMap, clusterNum - first))
+    if fCliques is not None:
+        fCliques.write(renumberClusters(cliques, clusterNum - first, "@Cluster"))
+    return clusterNum + nClusters
+
+def writeFinishedPartitions(pending, clusterNum, fClusters, fClusterMap,
+                            fCliques, wait):
+    """Write the partitions at the head of pending, each the records of
+    writePartition() or the AsyncResult of clusterLines(), that are clustered;
+    all of them if wait. Returns the number of the next cluster."""
+    while pending:
+        if isinstance(pending[0], tuple):
+            result = pending.pop(0)
+        elif wait or pending[0].ready():
+            result = (1,) + pending.pop(0).get()
+        else:
+            break
+        clusterNum = writePartition(result, clusterNum, fClusters, fClusterMap,
+                                    fCliques)
+    return clusterNum
+
+def formPEClusters(workDir, statFile, IL_BinFile, min_cluster_size,
+                   disc_enhancer, bp_margin, subsample, debug, threads=1,
+                   rgStatFile=None, rgBinFile=None, context=None,
+                   previous=None, groups=None):
+    """Form the PE clusters of allDiscordants.txt in workDir. If previous is
+    the workspace of an earlier run with the same statistics and parameters,
+    the clusters of the chromosome pairs whose alignments are unchanged are
+    taken from it. If groups is given, it yields the lines of every
+    chromosome pair of allDiscordants.txt as it is sorted (see
+    extsort.sortedGroups), and each pair is handed to the clustering
+    processes as it comes instead of once the file is complete."""
+    if context is None:
+        context = runContext()
+    # read the stats
+    stats = context.bamStats(statFile)
+    rdl, mean_IL, disc_thresh = stats.rdl, stats.mean_IL, stats.disc_thresh
+    dist_penalty, dist_end = stats.dist_penalty, stats.dist_end
+
+    # fragments of a read group are weighed by its own IL distribution
+    global RG_STATS
+    RG_STATS = context.readGroupStats(rgStatFile, rgBinFile)
+    max_cluster_length = maxClusterLength(stats, disc_enhancer, RG_STATS)
+    if RG_STATS:
+        logging.info('Using the IL distributions of %d read groups', len(RG_STATS))
+    logging.info('max_cluster_length is %f', max_cluster_length)
+
+    global IL_BinDistHash
+    global block_hash
+    IL_BinDistHash = {}
+    block_hash = {}
+    fBin=openFile(IL_BinFile,"r")
+    IL_BinTotalEntries = readDistHash(fBin)
+    fBin.close()
+    params = (rdl, mean_IL, disc_thresh, dist_penalty, dist_end,
+              max_cluster_length, IL_BinTotalEntries, min_cluster_size,
+              bp_margin, subsample, debug)
+
+    discFile = workDir+"/allDiscordants.txt"
+    fClusters=openFile(workDir+"/allClusters.txt","w")
+    fClusterMap=openFile(workDir+"/clusterMap.txt","w")
+    fCliques = None
+    if debug:
+        fCliques = openFile(workDir+"/clusterCliques.txt","w")
+
+    # subsampling shares its blocks across chromosomes and a cluster of size 1
+    # can be claimed while the previous chromosome pair is flushed, so both
+    # need the serial pass to reproduce its output
+    if (threads > 1 or previous is not None) and (subsample or min_cluster_size < 2):
+        logging.info('Forming PE clusters serially for subsampling or minimum cluster size below 2')
+        threads = 1
+        previous = None
+    if previous is not None and debug and \
+       not exists(previous + "/clusterCliques.txt"):
+        logging.info('Forming all PE clusters as %s has no cliques', previous)
+        previous = None
+
+    logging.info('Started PE cluster formation')
+    if groups is not None and (threads > 1 or previous is not None):
+        # clusters of the unchanged chromosome pairs of the earlier run
+        if previous is not None:
+            previousFile = previous + "/allDiscordants.txt"
+            previousDigests = dict(partitionDigest(previousFile, *x)
+                                   for x in partitionDiscordants(previousFile))
+            previousClusters = readPreviousClusters(previous, debug)
+        pool = None
+        if threads > 1:
+            logging.info('Clustering chromosome pairs with %d processes as they are sorted', threads)
+            pool = Pool(threads, initClusterWorker, (IL_BinFile, rgStatFile, rgBinFile))
+        secCounter = {}
+        pending = []
+        clusterNum = 1
+        nPartitions = 0
+        nReused = 0
+        for lines in groups:
+            nPartitions += 1
+            carried = carriedCounts(lines, secCounter)
+            if previous is not None:
+                key, digest = linesDigest(lines, carried)
+                if previousDigests.get(key) == digest:
+                    pending.append(tuple(previousClusters.get(key, [1, 0, "", "", ""])))
+                    nReused += 1
+                    continue
+            job = (lines, carried, params)
+            if pool is not None:
+                pending.append(pool.apply_async(clusterLines, (job,)))
+            else:
+                pending.append((1,) + clusterLines(job))
+            clusterNum = writeFinishedPartitions(pending, clusterNum, fClusters,
+                                                 fClusterMap, fCliques, False)
+        clusterNum = writeFinishedPartitions(pending, clusterNum, fClusters,
+                                             fClusterMap, fCliques, True)
+        if previous is not None:
+            logging.info('Reusing the clusters of %d of %d chromosome pairs from %s',
+                         nReused, nPartitions, previous)
+        if pool is not None:
+            pool.close()
+            pool.join()
+        secCounter.clear()
+        del secCounter
+    elif groups is not None:
+        # the pairs are clustered in this process as they are sorted
+        secCounter = {}
+        clusterDiscordants(chain.from_iterable(groups), secCounter, fClusters,
+                           fClusterMap, fCliques, *params)
+        secCounter.clear()
+        del secCounter
+    elif threads > 1 or previous is not None:
+        partitions = partitionDiscordants(discFile)
+        # clusters of the unchanged chromosome pairs of the earlier run
+        reused = {}
+        if previous is not None:
+            previousFile = previous + "/allDiscordants.txt"
+            previousDigests = dict(partitionDigest(previousFile, *x)
+                                   for x in partitionDiscordants(previousFile))
+            previousClusters = readPreviousClusters(previous, debug)
+            for index, (start, end, carried) in enumerate(partitions):
+                key, digest = partitionDigest(discFile, start, end, carried)
+                if previousDigests.get(key) == digest:
+                    reused[index] = previousClusters.get(key, [1, 0, "", "", ""])
+            logging.info('Reusing the clusters of %d of %d chromosome pairs from %s',
+                         len(reused), len(partitions), previous)
+        jobs = [(discFile, start, end, carried, params)
+                for index, (start, end, carried) in enumerate(partitions)
+                if index not in reused]
+        pool = None
+        if threads > 1:
+            logging.info('Clustering %d chromosome pairs with %d processes', len(jobs), threads)
+            pool = Pool(threads, initClusterWorker, (IL_BinFile, rgStatFile, rgBinFile))
+            results = pool.imap(clusterPartition, jobs)
+        else:
+            results = imap(clusterPartition, jobs)
+        clusterNum = 1
+        for index in xrange(len(partitions)):
+            if index in reused:
+                result = reused[index]
+            else:
+                result = (1,) + next(results)
+            clusterNum = writePartition(result, clusterNum, fClusters,
+                                        fClusterMap, fCliques)
+        if pool is not None:
+            pool.close()
+            pool.join()
+    elif memoryRecords(discFile) is not None:
+        # the discordants handed on in memory are clustered as they are
+        secCounter = {}
+        clusterDiscordants(memoryRecords(discFile), secCounter, fClusters,
+                           fClusterMap, fCliques, *params, parse=recordDiscordant)
+        secCounter.clear()
+        del secCounter
+    else:
+        secCounter = {}
+        with openFile(discFile, "r") as fDiscAlmts:
+            clusterDiscordants(fDiscAlmts, secCounter, fClusters, fClusterMap,
+                               fCliques, *params)
+        secCounter.clear()
+        del secCounter
+    logging.info('Finished PE cluster formation')
 
     if debug:
         fCliques.close()
@@ -481,12 +855,10 @@ def formPEClusters(workDir, statFile, IL_BinFile, min_cluster_size,
 
     IL_BinDistHash.clear()
     del IL_BinDistHash
-    fragHash.clear()
-    del fragHash
-    secCounter.clear()
-    del secCounter
     block_hash.clear()
     del block_hash
+    # the statistics belong to the context and may be used by later stages
+    RG_STATS = {}
 
     gc.collect()
 
@@ -512,6 +884,12 @@ if __name__== "__main__":
         or negative value')
     PARSER.add_argument('-s', action='store_true',
         help='Subsample alignments. Set to 1 ONLY if code is slow, e.g. taking hours on large file')
+    PARSER.add_argument('-t', default=1, dest='threads', type=int,
+        help='Number of processes used to cluster chromosome pairs in parallel')
+    PARSER.add_argument('-g', default=None, dest='rgStatFile',
+        help='File containing BAM statistics per read group typically named readGroupStats.txt')
+    PARSER.add_argument('-b', default=None, dest='rgBinFile',
+        help='File containing insert length statistics per read group typically named readGroupBinDist.txt')
     ARGS = PARSER.parse_args()
 
     LEVEL = logging.INFO
@@ -524,6 +902,7 @@ if __name__== "__main__":
 
     formPEClusters(ARGS.workDir, ARGS.statFile, ARGS.IL_BinFile,
                    ARGS.min_cluster_size, ARGS.disc_enhancer,
-                   ARGS.bp_margin, ARGS.s, ARGS.debug)
+                   ARGS.bp_margin, ARGS.s, ARGS.debug, ARGS.threads,
+                   ARGS.rgStatFile, ARGS.rgBinFile)
 
     logging.shutdown()
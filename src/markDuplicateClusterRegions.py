@@ -1,7 +1,7 @@
 import sys
-import pandas as pd
-import numpy as np
 import argparse
+from shared import openFile
+from extsort import externalSort, clusterRightKey, DEFAULT_MAX_MEMORY
 
 #global
 CLEANUP_THRESH_MCS = 3
@@ -50,13 +50,13 @@ def separateClusters(line, overlap, badRegFile, listT, chr_n, start, chr_prev, p
 
     return listT
 
-def markDuplicateClusterRegions(clusterFile, wdir):
+def markDuplicateClusterRegions(clusterFile, wdir, maxMemory=DEFAULT_MAX_MEMORY):
     prev_stop01, prev_stop10, chr_prev01, chr_prev10 = 0, 0, "*", "*"
     prev_stop00, prev_stop11, chr_prev00, chr_prev11 = 0, 0, "*", "*"
     chrB_prev01, chrB_prev10, chrB_prev00, chrB_prev11 = "*", "*", "*", "*"
     list01, list10, list11, list00 = [], [], [], []
-    fCL = open(clusterFile, "r")
-    badRegFile = open(wdir + "/badRegions.bed", "w")
+    fCL = openFile(clusterFile, "r")
+    badRegFile = openFile(wdir + "/badRegions.bed", "w")
 
     for line in fCL:
         line_split = line.split()
@@ -90,13 +90,8 @@ def markDuplicateClusterRegions(clusterFile, wdir):
     chrB_prev01, chrB_prev10, chrB_prev00, chrB_prev11 = "*", "*", "*", "*"
     list01, list10, list00, list11 = [], [], [], []
 
-    data = pd.read_table(clusterFile,
-                         names=['index', 'ns', 'orient', 'lchr', 'lpos', 'lend',
-                                 'rchr', 'rpos', 'rend', 'small'],
-                         dtype={'lchr':np.str, 'rchr':np.str, 'orient':np.str})
-    data = data.sort_values(by = ['rchr', 'rpos'])
-    data.to_csv(wdir + "/allClusters.rs.txt", header=None, index=None, sep='\t')
-    fCNR = open(wdir + "/allClusters.rs.txt", "r")
+    externalSort(clusterFile, wdir + "/allClusters.rs.txt", clusterRightKey, maxMemory)
+    fCNR = openFile(wdir + "/allClusters.rs.txt", "r")
 
     for line in fCNR:
         line_split = line.split()
@@ -131,6 +126,8 @@ if __name__=="__main__":
                                     description='Mark poor-mappability regions based on overlapping clusters')
     PARSER.add_argument('clusterFile', help='file containing all discordant clusters')
     PARSER.add_argument('wdir', help='working directory')
+    PARSER.add_argument('-m', default=DEFAULT_MAX_MEMORY/(1024*1024), dest='maxMemory',
+        type=int, help='memory budget in MB for sorting clusters')
     ARGS = PARSER.parse_args()
-    markDuplicateClusterRegions(ARGS.clusterFile, ARGS.wdir)
+    markDuplicateClusterRegions(ARGS.clusterFile, ARGS.wdir, ARGS.maxMemory*1024*1024)
 
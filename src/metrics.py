@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+# Record wall time, CPU time, peak memory and the sizes of the inputs and
+# outputs of pipeline steps in a machine-readable metrics.json
+import argparse as ap
+import json
+import resource
+import time
+from os.path import exists
+import pysam
+from shared import openFile, inMemory, fileSize, knownRecords
+
+def countBytes(fileName):
+    """Size of an input or output of a step; None when it does not exist"""
+    if fileName is None or not (inMemory(fileName) or exists(fileName)):
+        return None
+    return fileSize(fileName)
+
+def countRecords(fileName):
+    """Number of records in a text file (comment lines excluded) or, from its
+    index, in a BAM file; None when it cannot be counted cheaply"""
+    if fileName is None or not (inMemory(fileName) or exists(fileName)):
+        return None
+    if fileName.endswith(".bam"):
+        bamfile = pysam.AlignmentFile(fileName, "rb")
+        count = None
+        if bamfile.has_index():
+            count = bamfile.mapped + bamfile.unmapped
+        bamfile.close()
+        return count
+    count = 0
+    with openFile(fileName, "r") as f:
+        for line in f:
+            if not line.startswith("#"):
+                count += 1
+    return count
+
+class metricsReport(object):
+    """Every step run through measure() is appended to the report, which is
+    rewritten after each step so an interrupted run keeps what it measured.
+    Steps measured inside another step name it as their stage. The inputs
+    and outputs of a step are measured in bytes and in records: those noted
+    by the steps that wrote them, and those of BAM files from their index.
+    With countRecords the records of the other text files are also counted,
+    which reads them through again.
+    """
+    def __init__(self, metricsFile, countRecords=False):
+        self.metricsFile = metricsFile
+        self.countRecords = countRecords
+        self.records = []
+        self.running = []
+
+    def save(self):
+        if self.metricsFile is None:
+            return
+        with open(self.metricsFile, "w") as fp:
+            json.dump(self.records, fp, indent=1, sort_keys=True)
+
+    def detach(self):
+        """Keep the steps measured from now on in memory only, for a forked
+        process to hand them back to the report through add()"""
+        self.metricsFile = None
+        self.records = []
+
+    def add(self, records):
+        self.records += records
+        self.save()
+
+    def skipped(self, name):
+        self.records.append({"name": name, "skipped": True})
+        self.save()
+
+    def recordCount(self, fileName):
+        count = knownRecords(fileName)
+        if count is None and (self.countRecords or fileName.endswith(".bam")):
+            count = countRecords(fileName)
+        return count
+
+    def sizes(self, fileNames):
+        """Bytes and records of files by name; None where unknown"""
+        fileNames = [x for x in fileNames if x is not None]
+        return {"bytes": dict((x, countBytes(x)) for x in fileNames),
+                "records": dict((x, self.recordCount(x)) for x in fileNames)}
+
+    def measure(self, name, inputs, outputs, function, *args, **kwargs):
+        sizesIn = self.sizes(inputs)
+        self.running.append(name)
+        wallStart = time.time()
+        usageSelf = resource.getrusage(resource.RUSAGE_SELF)
+        usageChildren = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        result = function(*args, **kwargs)
+
+        wall = time.time() - wallStart
+        usageSelfEnd = resource.getrusage(resource.RUSAGE_SELF)
+        usageChildrenEnd = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.running.pop()
+        cpu = usageSelfEnd.ru_utime - usageSelf.ru_utime + \
+              usageSelfEnd.ru_stime - usageSelf.ru_stime
+        cpuChildren = usageChildrenEnd.ru_utime - usageChildren.ru_utime + \
+                      usageChildrenEnd.ru_stime - usageChildren.ru_stime
+
+        record = {"name": name,
+                  "stage": self.running[0] if self.running else name,
+                  "wall_s": round(wall, 3),
+                  "cpu_s": round(cpu + cpuChildren, 3),
+                  "cpu_children_s": round(cpuChildren, 3),
+                  # ru_maxrss is in kilobytes on Linux
+                  "peak_rss_kb": usageSelfEnd.ru_maxrss,
+                  "peak_rss_delta_kb": usageSelfEnd.ru_maxrss - usageSelf.ru_maxrss,
+                  "children_peak_rss_kb": usageChildrenEnd.ru_maxrss}
+        for kind, counts in sizesIn.items():
+            record["%s_in" % kind] = counts
+        for kind, counts in self.sizes(outputs).items():
+            record["%s_out" % kind] = counts
+        self.records.append(record)
+        self.save()
+        return result
+
+def compareWallTimes(baseline, records):
+    """(name, baseline wall_s, wall_s) of the steps run in both lists of
+    records, matching the n-th run of a step in one to the n-th in the other"""
+    def byName(recordList):
+        steps = {}
+        for record in recordList:
+            if not record.get("skipped"):
+                steps.setdefault(record["name"], []).append(record["wall_s"])
+        return steps
+    before = byName(baseline)
+    seen = {}
+    rows = []
+    for record in records:
+        if record.get("skipped"):
+            continue
+        name = record["name"]
+        n = seen.get(name, 0)
+        seen[name] = n + 1
+        if n < len(before.get(name, [])):
+            rows.append((name, before[name][n], record["wall_s"]))
+    return rows
+
+if __name__ == "__main__":
+    PARSER = ap.ArgumentParser(description="""
+    Print the steps recorded in a metrics file as a table""",
+    formatter_class=ap.ArgumentDefaultsHelpFormatter)
+    PARSER.add_argument('metricsFile', help='Metrics file typically named metrics.json')
+    PARSER.add_argument('-c', default=None, dest='baselineFile',
+        help='Metrics file of another run of the same data, e.g. with fewer --threads; the wall time of every step is compared with it')
+    ARGS = PARSER.parse_args()
+
+    with open(ARGS.metricsFile, "r") as fp:
+        RECORDS = json.load(fp)
+    if ARGS.baselineFile is not None:
+        with open(ARGS.baselineFile, "r") as fp:
+            BASELINE = json.load(fp)
+        print "\t".join(["name", "baseline_wall_s", "wall_s", "speedup"])
+        for name, before, after in compareWallTimes(BASELINE, RECORDS):
+            speedup = "%.2f" % (before/after) if after > 0 else "-"
+            print "\t".join(map(str, [name, before, after, speedup]))
+        exit(0)
+    def total(record, key):
+        counts = [x for x in record.get(key, {}).values() if x is not None]
+        if not counts:
+            return "-"
+        return sum(counts)
+
+    print "\t".join(["stage", "name", "wall_s", "cpu_s", "peak_rss_delta_kb",
+                     "bytes_in", "bytes_out", "records_in", "records_out"])
+    for record in RECORDS:
+        if record.get("skipped"):
+            print "%s\t%s\tskipped" % (record["name"], record["name"])
+            continue
+        print "\t".join(map(str, [record["stage"], record["name"],
+            record["wall_s"], record["cpu_s"], record["peak_rss_delta_kb"]] +
+            [total(record, x) for x in
+             ["bytes_in", "bytes_out", "records_in", "records_out"]]))
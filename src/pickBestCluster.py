@@ -1,9 +1,6 @@
 import sys
-import pandas as pd
-import numpy as np
-import pysam as ps
 import argparse
-from shared import readChromosomeLengths, formExcludeHash
+from shared import formExcludeHash, markExcludeRegions, openFile, runContext
 
 SUPP_PERC=.5
 MIN_SUPP=10
@@ -17,15 +14,21 @@ def determineMin1(chr1, start1, chrHash):
             break
     return index
 
-def pickBestCluster(clusterFile, wdir, ignoreRegions, sampleBAM):
+def pickBestCluster(clusterFile, wdir, ignoreRegions, sampleBAM, context=None):
 
     ignBuffer = 0
-    fCN = open(wdir + "/allClusters.postClean.txt", "w")
-    fSuppHist = open(wdir + "/suppHist.txt", "w")
-    fCl = open(clusterFile, "r")
+    if context is None:
+        context = runContext()
+    fCN = openFile(wdir + "/allClusters.postClean.txt", "w")
+    fSuppHist = openFile(wdir + "/suppHist.txt", "w")
+    fCl = openFile(clusterFile, "r")
     chrHash = {}
-    chrLengths = readChromosomeLengths(sampleBAM)
-    chrHash = formExcludeHash(chrHash, ignBuffer, ignoreRegions, chrLengths)
+    chrLengths = context.chromosomeLengths(sampleBAM)
+    # poor-mappability regions are either a BED file or (chr, start, stop) regions
+    if isinstance(ignoreRegions, basestring):
+        chrHash = formExcludeHash(chrHash, ignBuffer, ignoreRegions, chrLengths, context)
+    else:
+        chrHash = markExcludeRegions(chrHash, ignBuffer, ignoreRegions, chrLengths)
     compHash = {}
 
     for line in fCl:
@@ -84,6 +87,7 @@ def pickBestCluster(clusterFile, wdir, ignoreRegions, sampleBAM):
 
     fCl.close()
     fCN.close()
+    fSuppHist.close()
 
 
 if __name__=="__main__":
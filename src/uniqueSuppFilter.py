@@ -7,16 +7,28 @@ import math
 from collections import Counter
 import argparse
 import logging
+from shared import openFile, runContext, previewSupport, memoryRecords
 
-def readBamStats(statFile):
-    f=open(statFile,"r")
-    for i,line in enumerate(f):
-        if i==3:
-            break
-    return float(line.split()[0])
+# fragments passing the mapping quality threshold, keyed by discordants file
+# and threshold; every filtering pass of a run reads the same discordants
+MQ_SETS = {}
+
+def resetMQSets():
+    MQ_SETS.clear()
 
-def formMQSet(mapThresh, mqSet, allDiscordantsFile):
-    f=open(allDiscordantsFile,"r")
+def formMQSet(mapThresh, allDiscordantsFile):
+    if (allDiscordantsFile, mapThresh) in MQ_SETS:
+        return MQ_SETS[(allDiscordantsFile, mapThresh)]
+    mqSet = set()
+    records = memoryRecords(allDiscordantsFile)
+    if records is not None:
+        # fragment and mapping quality of the discordants handed on in memory
+        for record in records:
+            if record[7] >= mapThresh:
+                mqSet.add(record[0])
+        MQ_SETS[(allDiscordantsFile, mapThresh)] = mqSet
+        return mqSet
+    f=openFile(allDiscordantsFile,"r")
     for line in f:
         line_split = line.split()
         frag = int(line_split[0])
@@ -25,6 +37,8 @@ def formMQSet(mapThresh, mqSet, allDiscordantsFile):
         if frag not in mqSet and mq >= mapThresh:
             mqSet.add(frag)
     f.close()
+    MQ_SETS[(allDiscordantsFile, mapThresh)] = mqSet
+    return mqSet
 
 def calculateSVThresh(SVType, SVSupp, complex_thresh, sr_thresh, pe_thresh, 
                       mix_thresh, NPEClusters, pe_min):
@@ -43,7 +57,7 @@ def calculateSVThresh(SVType, SVSupp, complex_thresh, sr_thresh, pe_thresh,
         disjThresh = mix_thresh
     return disjThresh
 
-def uniquenessFilter(fragmentList, nInputVariants, mqSet, allDiscordantsFile,
+def uniquenessFilter(fragmentList, nInputVariants, allDiscordantsFile,
                      mapThresh,variantMapFile, allVariantFile, 
                      rdFragIndex, workDir, complex_thresh, 
                      sr_thresh, pe_thresh, mix_thresh, pe_min):
@@ -52,10 +66,10 @@ def uniquenessFilter(fragmentList, nInputVariants, mqSet, allDiscordantsFile,
     disjointness = [0]*nInputVariants
     pickV = [0]*nInputVariants
     varNum = []
-    fVM=open(variantMapFile,"r")
-    fAV=open(allVariantFile,"r")
-    fUF=open(workDir+"/variants.uniqueFilter.txt","w")
-    formMQSet(mapThresh, mqSet, allDiscordantsFile)
+    fVM=openFile(variantMapFile,"r")
+    fAV=openFile(allVariantFile,"r")
+    fUF=openFile(workDir+"/variants.uniqueFilter.txt","w")
+    mqSet = formMQSet(mapThresh, allDiscordantsFile)
     header = fAV.readline()
     logging.info("Applying uniqueness filter.")
     nFragOccrns = Counter(fragmentList)
@@ -108,23 +122,24 @@ def uniquenessFilter(fragmentList, nInputVariants, mqSet, allDiscordantsFile,
     return nSVs
 
 def readVariantMap(filename, allFrags):
-    f=open(filename, 'r')
-    index = 0
-    for counter, line in enumerate(f):
+    f=openFile(filename, 'r')
+    nVariants = 0
+    for line in f:
         parsed = map(int, line.split())
         for frag in parsed[1:]:
             allFrags.append(frag)
-        index = counter
+        nVariants += 1
     f.close()
-    return index + 1
+    return nVariants
 
 def uniqueSuppFilter(workDir, statFile, variantMapFile, allVariantFile, 
                      allDiscordantsFile, map_thresh,
                      pe_thresh_max, sr_thresh_max, 
                      pe_thresh_min, sr_thresh_min,
-                     rdFragIndex, unfilter):
+                     rdFragIndex, unfilter, context=None, preview=1.0):
     allFrags = []
-    mqSet = set()
+    if context is None:
+        context = runContext()
 
     # linear model to calculate support threshold by category
     # familiar developers may tweak model here directly
@@ -138,7 +153,7 @@ def uniqueSuppFilter(workDir, statFile, variantMapFile, allVariantFile,
     il_low2 = 35
     covg_cusp = 8
     # apply above-mentioned support threshold model
-    covg = readBamStats(statFile)
+    covg = context.bamStats(statFile).coverage
     if covg <= covg_cusp or unfilter:
         complex_thresh, mix_thresh = 3, 3
     else:
@@ -158,14 +173,19 @@ def uniqueSuppFilter(workDir, statFile, variantMapFile, allVariantFile,
         pe_thresh = pe_thresh_min
     if sr_thresh < sr_thresh_min:
         sr_thresh = sr_thresh_min
+    # a preview sees only a fraction of the supporting fragments
+    if preview < 1:
+        complex_thresh, mix_thresh, sr_thresh, pe_thresh = \
+            [previewSupport(x, preview) for x in
+             (complex_thresh, mix_thresh, sr_thresh, pe_thresh)]
     logging.info("sr, pe threshes, covg are: %d, %d, %d", sr_thresh, pe_thresh, covg)
 
     nInputVariants = readVariantMap(variantMapFile, allFrags)
-    nSVs = uniquenessFilter(allFrags, nInputVariants, mqSet, allDiscordantsFile, 
+    nSVs = uniquenessFilter(allFrags, nInputVariants, allDiscordantsFile, 
                             map_thresh, variantMapFile, allVariantFile,
                             rdFragIndex, workDir, complex_thresh, 
                             sr_thresh, pe_thresh, mix_thresh, pe_low)
-    fNSVs= open(workDir+"/NSVs.txt","w")
+    fNSVs= openFile(workDir+"/NSVs.txt","w")
     fNSVs.write("%s\n" %nSVs)
     fNSVs.close()
 
@@ -189,6 +209,8 @@ if __name__ == "__main__":
         help='Mapping quality threshold for fragments uniquely supporting variant')
     PARSER.add_argument('-i', default=100000000, dest='rdFragIndex', type=int,
         help=argparse.SUPPRESS)
+    PARSER.add_argument('--preview', default=1.0, type=float,
+        help='Fraction of the fragments kept by a preview; the support thresholds are scaled to it')
     ARGS = PARSER.parse_args()
 
     LEVEL = logging.INFO
@@ -204,6 +226,6 @@ if __name__ == "__main__":
                      ARGS.map_thresh, ARGS.pe_thresh_max,
                      ARGS.sr_thresh_max, ARGS.pe_thresh_min,
                      ARGS.sr_thresh_min,
-                     ARGS.rdFragIndex, False)
+                     ARGS.rdFragIndex, False, preview=ARGS.preview)
 
     logging.shutdown()
@@ -5,21 +5,22 @@
 import argparse
 import sys
 import logging
+from shared import openFile
 
 def writeBEDs(variantFile, passFile, outname, libINV): 
     passed = None
     if passFile != None:
         passed = set()
-        with open(passFile, 'r') as f:
+        with openFile(passFile, 'r') as f:
             for line in f:
                 passed.add(line.strip())
     if passed != None:
         logging.info('%d variants passed threshold', len(passed))
 
     outfile = sys.stdout
-    if outname != sys.stdout: outfile = open(outname, 'w')
+    if outname != sys.stdout: outfile = openFile(outname, 'w')
     outfile.write("%s\n" %("chr1\tstart1\tstop1\tchr2\tstart2\tstop2\tnameID\tscore\tstrand1\tstrand2\tSVType\tSupportedBy\tconfPos\tconfEnd\tInverted\tGT\tNSupport\tBNDTag\tSVSubtype\tN_PE\tN_SR\tN_PE_Cl\tBNDAlt1\tBNDAlt2\tGROUPID\tcovLocRejection"))
-    with open(variantFile, 'r') as fAV:
+    with openFile(variantFile, 'r') as fAV:
         header = fAV.readline()
         for counter, lineAV in enumerate(fAV):
             tokens = lineAV.split()
@@ -2,14 +2,15 @@
 
 # Identify all discordant reads, analyze, and write them to allDiscordants.us.txt
 
-from itertools import izip
 import argparse as ap
 import numpy as np
-import pysam as ps
+import json
 import logging
 import sys
 import gc
-from shared import formExcludeHash, ignoreRead, readChromosomeLengths
+from shared import formExcludeHash, excludeHash, ignoreRead, openFile, \
+                   readRegions, fetchRegions, readGroupIndex, runContext, \
+                   openBAM, previewKeeps, mappedReferences, recordFile
 
 ## we would not recommended changing any of these
 # primary alignment score threshold (0 recommended due to split reads etc.)
@@ -33,17 +34,123 @@ DIST_END_PERC = .99
 MAP_THRESH_DUP = 20
 # min gap b/w "arrow tips" of RF almt to count as reasonable
 RF_RDL_FACTOR = 2.1
+# min concordant almts of a read group to use its own BAM statistics
+MIN_RG_READS = 1000
+# number of chromosomes whose first bases the coverage is estimated from
+COVERAGE_CHROMS = 23
+
+def sampleAlignments(bamfile, regions):
+    """Alignments used for the BAM statistics: from the start of the file, or
+    from the target regions only"""
+    if regions is None:
+        return iter(bamfile)
+    return fetchRegions(bamfile, regions)
+
+def samplePileups(bamfile, calc_thresh, subsampleRate, regions):
+    """Pileup columns used for the coverage estimate: the first ones of each of
+    the first COVERAGE_CHROMS chromosomes with mapped reads, continued on the
+    later ones while fewer columns than these could give have been sampled,
+    or those of the target regions. An assembly of many short contigs is then
+    sampled by the number of bases, not of contigs."""
+    if regions is not None:
+        counterLoop = 0
+        for chrom, start, stop in regions:
+            for pileupcolumn in bamfile.pileup(chrom, start, stop, truncate=True):
+                yield pileupcolumn
+                counterLoop += 1
+                if counterLoop > calc_thresh/subsampleRate:
+                    return
+        return
+
+    sampled = 0
+    for nChroms, chrom in enumerate(mappedReferences(bamfile)):
+        if nChroms >= COVERAGE_CHROMS and \
+           sampled >= COVERAGE_CHROMS*calc_thresh/subsampleRate:
+            break
+        counterLoop = 0
+        for pileupcolumn in bamfile.pileup(chrom):
+            yield pileupcolumn
+            counterLoop += 1
+            if counterLoop > calc_thresh/subsampleRate:
+                break
+        sampled += counterLoop
+
+def formBinDist(IL_list):
+    """Distribution of the differences between binned insert lengths of pairs
+    of fragments, from sorted insert lengths"""
+    binSize = 10
+    binDist = binSize
+    distHash = {}
+    minIL = IL_list[0]
+    for item in IL_list:
+        if item - minIL < binSize:
+            if binDist not in distHash:
+                distHash[binDist] = 0
+            distHash[binDist] += 1
+        else:
+            binDist += binSize
+            minIL = item
+    binDistHash = {}
+    for item in distHash:
+        for item2 in distHash:
+            temp = item2 - item
+            if temp >= 0:
+                if temp not in binDistHash:
+                    binDistHash[temp] = 0
+                if temp > 0:
+                    binDistHash[temp] += distHash[item]*distHash[item2]
+                else:
+                    binDistHash[temp] += (distHash[item])*(distHash[item] -1)*.5
+    return binDistHash
+
+def libraryStats(IL_list_us):
+    """Insert-length statistics of a library from the insert lengths of its
+    concordant alignments, in the order they were read
+    Outputs:
+        meanIL, stdIL, maxIL, disc_thresh, disc_thresh_neg, dist_penalty,
+        dist_end and the distribution of insert-length differences
+    """
+    meanIL = sum(IL_list_us)/len(IL_list_us)
+    IL_list = sorted(IL_list_us)
+    try:
+        dist_end = IL_list[int(DIST_END_PERC*len(IL_list)) - 1]
+        dist_penalty = IL_list[int(PENALTY_PERC*len(IL_list)) - 1]
+        disc_thresh_neg = IL_list[int(DISC_PERC_NEG*len(IL_list)) - 1] - meanIL
+    except:
+        sys.stderr.write("Please check value of DISC_PERC (discordancy percentile for IL).")
+        exit(1)
+
+    disc_thresh = IL_list[int(DISC_PERC*len(IL_list)) - 1] - meanIL
+    stdIL = sum((IL - meanIL)**2 for IL in IL_list_us)/len(IL_list_us)
+    stdIL = stdIL**(.5)
+    if disc_thresh < 0:
+        disc_thresh = 3*stdIL
+
+    return meanIL, stdIL, IL_list[-1], disc_thresh, disc_thresh_neg, \
+        dist_penalty, dist_end, formBinDist(IL_list)
 
-def calcMeanSig(bamfile1, workDir, calc_thresh):
+def fragmentReadGroup(alignments, readGroups):
+    """Index of the read group of a fragment, None if it has none"""
+    if not alignments[0].has_tag("RG"):
+        return None
+    return readGroups.get(alignments[0].get_tag("RG"))
+
+def calcMeanSig(bamfile1, workDir, calc_thresh, regions=None, context=None):
     """Calculate mean & std of insert-length dist. (and other stats listed below)
     Inputs:
         bamfile1: position-sorted BAM file containing all alignments
+        regions: if given, (chr, start, stop) regions the statistics are
+                 sampled from, through the index
     Outputs:
         meanIL: mean insert length
         stdIL: stdev in IL
         disc_thresh: IL value of the input distribution at DISC_PERC, less meanIL
         disc_thresh_neg: IL value of the input distribution at DISC_PERC_NEG,
                          less meanIL (neg value)
+        rgStats: if the BAM has several read groups, the same statistics
+                 (meanQL, meanIL, stdIL, maxIL, disc_thresh, disc_thresh_neg,
+                 dist_penalty, dist_end) of every read group with at least
+                 MIN_RG_READS sampled alignments, by read group index
     Notes:
         Quantities not returned explicitly but written to bam_stats.txt file:
             meanQL: mean query length
@@ -51,19 +158,24 @@ def calcMeanSig(bamfile1, workDir, calc_thresh):
             dist_penalty: IL value of the input distribution at PENALTY_PERC
             dist_end: IL value of the input distribution at DIST_END_PERC
         'Alignment' here always refers to PE alignment unless otherwise specified
+        Read group statistics are written to readGroupStats.txt and their
+        insert-length difference distributions to readGroupBinDist.txt
     """
-    bamfile = ps.Samfile(bamfile1, "rb")
-    summedIL = 0
+    if context is None:
+        context = runContext()
+    bamfile = openBAM(bamfile1, "rb")
+    readGroups = readGroupIndex(context.header(bamfile1))
+    alignments = sampleAlignments(bamfile, regions)
     summedQL = 0
     counterRead = 0
-    stdIL = 0
-    maxIL = 0
     counterLoop = 0
     IL_list_us = []
+    rgIL_lists = {}
+    rgSummedQL = {}
 
     while counterRead < calc_thresh and counterLoop < 2*calc_thresh:
         try:
-            m1 = bamfile.next()
+            m1 = next(alignments)
         except StopIteration:
             break
 
@@ -76,121 +188,86 @@ def calcMeanSig(bamfile1, workDir, calc_thresh):
 
             IL = m1.template_length
             IL_list_us.append(IL)
-
-            if IL > maxIL:
-                maxIL = IL
-            summedIL += IL
             summedQL += m1.infer_query_length()
             counterRead += 1
+
+            if readGroups:
+                rg = fragmentReadGroup([m1], readGroups)
+                if rg is not None:
+                    rgIL_lists.setdefault(rg, []).append(IL)
+                    rgSummedQL[rg] = rgSummedQL.get(rg, 0) + m1.infer_query_length()
         counterLoop += 1
+    bamfile.close()
 
-    try:
-        meanIL = summedIL/counterRead
-        meanQL = summedQL/counterRead
-    except ZeroDivisionError:
+    if counterRead == 0:
         sys.stderr.write("Please check order of name-sorted and position-sorted files supplied.")
         exit(1)
+    meanQL = summedQL/counterRead
+    meanIL, stdIL, maxIL, disc_thresh, disc_thresh_neg, dist_penalty, dist_end, \
+        binDistHash = libraryStats(IL_list_us)
 
-    IL_list = sorted(IL_list_us)
-    try:
-        dist_end = IL_list[int(DIST_END_PERC*len(IL_list)) - 1]
-        dist_penalty = IL_list[int(PENALTY_PERC*len(IL_list)) - 1]
-        disc_thresh_neg = IL_list[int(DISC_PERC_NEG*len(IL_list)) - 1] - meanIL
-    except:
-        sys.stderr.write("Please check value of DISC_PERC (discordancy percentile for IL).")
-        exit(1)
-
-    disc_thresh = IL_list[int(DISC_PERC*len(IL_list)) - 1] - meanIL
-    bamfile.close()
-
-    binSize = 10
-    binDist = binSize
-    distHash = {}
-    minIL = IL_list[0]
-    for item in IL_list:
-        if item - minIL < binSize:
-            if binDist not in distHash:
-                distHash[binDist] = 0
-            distHash[binDist] += 1
-        else:
-            binDist += binSize
-            minIL = item
-    binDistHash = {}
-    for item in distHash:
-        for item2 in distHash:
-            temp = item2 - item
-            if temp >= 0:
-                if temp not in binDistHash:
-                    binDistHash[temp] = 0
-                if temp > 0:
-                    binDistHash[temp] += distHash[item]*distHash[item2]
-                else:
-                    binDistHash[temp] += (distHash[item])*(distHash[item] -1)*.5
-    fh = open(workDir + "/binDist.txt", "w")
+    fh = openFile(workDir + "/binDist.txt", "w")
     for item in binDistHash:
         fh.write("%s\t%s\n" %(item, binDistHash[item]))
-
-    bamfile = ps.Samfile(bamfile1, "rb")
-    counterLoop = 0
-    counterRead = 0
-    while counterRead < calc_thresh and counterLoop < 2*calc_thresh:
-        try:
-            m1 = bamfile.next()
-        except StopIteration:
-            break
-
-        if m1.is_proper_pair and not m1.is_secondary and \
-            not m1.is_supplementary and \
-            m1.get_tag("AS") > AS_CALC_THRESH*m1.infer_query_length() and \
-            m1.template_length > 0:
-            stdIL += (m1.template_length - meanIL)**2
-            counterRead += 1
-        counterLoop += 1
-
-    bamfile.close()
-    stdIL = stdIL/counterRead
-    stdIL = stdIL**(.5)
-
-    bamfile = ps.AlignmentFile(bamfile1, "rb")
+    fh.close()
+
+    # the same statistics for every read group with enough alignments
+    rgStats = {}
+    fRGStats = openFile(workDir + "/readGroupStats.txt", "w")
+    fRGBins = openFile(workDir + "/readGroupBinDist.txt", "w")
+    for rg in sorted(rgIL_lists):
+        if len(rgIL_lists[rg]) < MIN_RG_READS:
+            logging.info("Using the statistics of all read groups for read group %d with %d alignments", rg, len(rgIL_lists[rg]))
+            continue
+        rgMeanIL, rgStdIL, rgMaxIL, rgDiscThresh, rgDiscThreshNeg, rgDistPenalty, \
+            rgDistEnd, rgBinDistHash = libraryStats(rgIL_lists[rg])
+        rgStats[rg] = (rgSummedQL[rg]/len(rgIL_lists[rg]), rgMeanIL, rgStdIL,
+                       rgMaxIL, rgDiscThresh, rgDiscThreshNeg, rgDistPenalty,
+                       rgDistEnd)
+        logging.debug("Read group %d meanQL, meanIL, stdIL, maxIL, disc_thresh: %f %f %f %f %f", rg, rgStats[rg][0], rgMeanIL, rgStdIL, rgMaxIL, rgDiscThresh)
+        fRGStats.write("%s\t%s\n" % (rg, "\t".join(map(str, rgStats[rg]))))
+        for item in rgBinDistHash:
+            fRGBins.write("%s\t%s\t%s\n" % (rg, item, rgBinDistHash[item]))
+    fRGStats.close()
+    fRGBins.close()
+
+    bamfile = openBAM(bamfile1, "rb")
     cov = 0
     width = 20
     counterBase = 0
-    tidCounter = 0
-    tidThresh = 22
     subsampleRate = 10.0
-    while True:
-        try:
-            chrom = bamfile.get_reference_name(tidCounter)
-            if tidCounter > tidThresh or chrom == None or chrom == -1:
-                break
-        except:
-            break
-        tidCounter += 1
-        counterLoop = 0
-        for pileupcolumn in bamfile.pileup(chrom):
-            cov += pileupcolumn.n
-            counterBase += 1
-            counterLoop += 1
-            if counterLoop > calc_thresh/subsampleRate:
-                break
+    for pileupcolumn in samplePileups(bamfile, calc_thresh, subsampleRate, regions):
+        cov += pileupcolumn.n
+        counterBase += 1
     bamfile.close()
     if counterBase > 0:
         cov = cov/counterBase
 
-    if disc_thresh < 0:
-        disc_thresh = 3*stdIL
-
-    distHash.clear()
-    del distHash
     binDistHash.clear()
     del binDistHash
     gc.collect()
 
     logging.debug("meanQL, meanIL, stdIL, cov, maxIL, disc_thresh: %f %f %f %f %f %f", meanQL, meanIL, stdIL, cov, maxIL, disc_thresh)
-    with open(workDir + "/bamStats.txt", "w") as fp:
+    with openFile(workDir + "/bamStats.txt", "w") as fp:
         print >> fp, "%s\n%s\n%s\n%s\n%s\n%s\n%s\n%s" %(meanQL, meanIL, stdIL, cov, maxIL, disc_thresh, dist_penalty, dist_end)
+    for fileName in ["bamStats.txt", "readGroupStats.txt", "readGroupBinDist.txt"]:
+        context.forget("%s/%s" % (workDir, fileName))
 
-    return meanQL, meanIL, disc_thresh, disc_thresh_neg
+    return meanQL, meanIL, disc_thresh, disc_thresh_neg, rgStats
+
+def writeSampleStats(statsFile, stats):
+    """Write the statistics returned by calcMeanSig, unrounded, for
+    readSampleStats()"""
+    meanQL, meanIL, disc_thresh, disc_thresh_neg, rgStats = stats
+    with openFile(statsFile, "w") as fp:
+        fp.write(json.dumps([meanQL, meanIL, disc_thresh, disc_thresh_neg,
+                             sorted(rgStats.items())]))
+
+def readSampleStats(statsFile):
+    with openFile(statsFile, "r") as fp:
+        meanQL, meanIL, disc_thresh, disc_thresh_neg, rgStats = json.loads(fp.read())
+    return meanQL, meanIL, disc_thresh, disc_thresh_neg, \
+           dict((rg, tuple(x)) for rg, x in rgStats)
 
 class alignedFragment(object):
     def __init__(self):
@@ -204,10 +281,26 @@ class alignedFragment(object):
         self.rTID = None
         self.mapQual = -1
         self.discSmall = -1
+        self.readGroup = None #index of read group, if the BAM has several
 
     def __str__(self):
-        return "%s\t%s\t%s\t%s\t%s\t%s\t%s" % (self.lTID, self.lBound, self.rTID,
+        fields = "%s\t%s\t%s\t%s\t%s\t%s\t%s" % (self.lTID, self.lBound, self.rTID,
                                          self.rBound, self.cType, self.discSmall, self.mapQual)
+        if self.readGroup is not None:
+            fields += "\t%s" % self.readGroup
+        return fields
+
+    def record(self, fragNum):
+        """The fields of the line of allDiscordants.us.txt of fragment
+        fragNum, see formatDiscordant()"""
+        return (fragNum, self.lTID, self.lBound, self.rTID, self.rBound,
+                self.cType, self.discSmall, self.mapQual, self.readGroup)
+
+def formatDiscordant(record):
+    """Line of allDiscordants.us.txt for a record of alignedFragment"""
+    if record[8] is None:
+        return "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % record[:8]
+    return "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" % record
 
 def findTotalNMatches(al):
     """ Calculate how many bases in alignment match reference, given cigar string
@@ -505,16 +598,24 @@ def formDiscordant(aln1s, aln2s, disc_thresh, disc_thresh_neg, mean_IL, chrHash,
 
     return dList1, dList2
 
-def readNextReadAlignments(bamname):
-    """Generator of alignments returning 1 list of alignments with same name at a time
+def fragmentName(qname):
+    """Query name of a read without the /1 or /2 suffix of some aligners"""
+    if qname.endswith("/1") or qname.endswith("/2"):
+        return qname[:-2]
+    return qname
+
+def readFragmentAlignments(bamname):
+    """Generator of alignments returning those of 1 fragment at a time
     Inputs:
-        bamname: BAM file containing all left (or right) PE alignments
-        (e.g. can include secondary almts) almts
+        bamname: SAM or BAM file, or "-" for stdin, containing the PE
+        alignments of both reads (e.g. can include secondary almts), sorted
+        or grouped by name
     Outputs:
-        1 list of alignments with same name at a time
+        fragment name, list of alignments of read 1, list of alignments of
+        read 2
     """
-    bamfile = ps.AlignmentFile(bamname)
-    alignments = []
+    bamfile = openBAM(bamname, "r")
+    aln1s, aln2s = [], []
     qname = None
 
     for alignment in bamfile:
@@ -524,34 +625,26 @@ def readNextReadAlignments(bamname):
            alignment.is_supplementary: 
            continue
 
-        if qname == None:
-            qname = alignment.qname
-            alignments.append(alignment)
-        elif qname == alignment.qname:
-            alignments.append(alignment)
+        name = fragmentName(alignment.qname)
+        if name != qname:
+            if qname != None:
+                yield qname, aln1s, aln2s
+            aln1s, aln2s = [], []
+            qname = name
+        if alignment.is_read1:
+            aln1s.append(alignment)
         else:
-            yield qname, alignments
-            alignments = [alignment]
-            qname = alignment.qname
+            aln2s.append(alignment)
 
     if qname != None:
-        yield qname, alignments
+        yield qname, aln1s, aln2s
+    bamfile.close()
 
-def writeDiscordantFragments(workDir, readAlmts1, readAlmts2, bamfile, debug,
-                             ignoreBED, ignoreChr, permutation_thresh,
-                             calc_thresh, nMatchPct_thresh,
-                             nMatch_relative_thresh, as_relative_thresh,
-                             map_thresh, libDup):
+def readIgnoreChr(ignoreChr):
+    """Chromosomes listed to be ignored, and the prefixes of those listed
+    with a "*" to ignore all chromosomes starting with them"""
     ignoreTIDs = set()
     ignoreTIDAll = set()
-    chrHash = {}
-
-    # calculate some basic stats
-    rdl, mean_IL, disc_thresh, disc_thresh_neg = calcMeanSig(bamfile, workDir, calc_thresh)
-
-    # read the lengths of the chromosomes
-    chromosome_lengths = readChromosomeLengths(bamfile)
-
     if ignoreChr is not None:
         with open(ignoreChr, 'r') as f:
             for line in f:
@@ -562,38 +655,135 @@ def writeDiscordantFragments(workDir, readAlmts1, readAlmts2, bamfile, debug,
                 else:
                     ignoreTIDAll.add(chrI[1:])
                     logging.debug("Chr names starting with %s will be ignored", chrI[1:])
+    return ignoreTIDs, ignoreTIDAll
+
+def maskStatus(alignment, ignoreTIDs, ignoreTIDAll, chrHash):
+    """How formDiscordant treats an alignment under the ignored chromosomes
+    and exclude regions: whether its chromosome is ignored, by name or by
+    prefix, and whether its start is excluded"""
+    if alignment.is_unmapped:
+        return False, False, False
+    name, pos = alignment.reference_name, alignment.reference_start
+    return (name in ignoreTIDs, any(name.startswith(x) for x in ignoreTIDAll),
+            ignoreRead(name, pos, name, pos, chrHash))
+
+class previousFragments(object):
+    """The lines of allDiscordants.us.txt of an earlier run, looked up by
+    fragment number in increasing order"""
+    def __init__(self, fileName):
+        self.f = openFile(fileName, "r")
+        self.pending = self.f.readline()
+
+    def lines(self, fragNum):
+        lines = []
+        while self.pending:
+            num = int(self.pending.split("\t", 1)[0])
+            if num > fragNum:
+                break
+            if num == fragNum:
+                lines.append(self.pending)
+            self.pending = self.f.readline()
+        return lines
+
+    def close(self):
+        self.f.close()
+
+def writeDiscordantFragments(workDir, discBAM, bamfile, debug,
+                             ignoreBED, ignoreChr, permutation_thresh,
+                             calc_thresh, nMatchPct_thresh,
+                             nMatch_relative_thresh, as_relative_thresh,
+                             map_thresh, libDup, regions=None, context=None,
+                             previousDir=None, previousIgnoreBED=None,
+                             previousIgnoreChr=None, preview=1.0,
+                             sampleStats=None):
+    """Write the discordant fragments of discBAM to allDiscordants.us.txt.
+    The statistics of bamfile are calculated unless given as sampleStats,
+    as returned by calcMeanSig.
+    If previousDir is the workspace of an earlier run on the same discBAM
+    with the ignored chromosomes and exclude regions previousIgnoreChr and
+    previousIgnoreBED, only the fragments with an alignment that the two sets
+    of masks treat differently are formed again; the lines of the others are
+    taken from the earlier run. A preview keeps only the given fraction of
+    the fragments."""
+    chrHash = {}
+
+    if context is None:
+        context = runContext()
+
+    # calculate some basic stats
+    if sampleStats is None:
+        sampleStats = calcMeanSig(bamfile, workDir, calc_thresh, regions, context)
+    rdl, mean_IL, disc_thresh, disc_thresh_neg, rgStats = sampleStats
+    readGroups = readGroupIndex(context.header(bamfile))
+
+    # read the lengths of the chromosomes
+    chromosome_lengths = context.chromosomeLengths(bamfile)
+
+    ignoreTIDs, ignoreTIDAll = readIgnoreChr(ignoreChr)
 
     ignoreBuffer = 1*rdl
     if ignoreBED is not None:
         logging.info("Regions in %s will be ignored", ignoreBED)
-        chrHash = formExcludeHash(chrHash, ignoreBuffer, ignoreBED, chromosome_lengths)
-
-    # read discordant alignments and write all possible discordant pairs to file.
-    with open("%s/allDiscordants.us.txt" % workDir, "w") as almtFile:
+        chrHash = formExcludeHash(chrHash, ignoreBuffer, ignoreBED, chromosome_lengths, context)
+
+    # the masks of the earlier run, to tell the fragments they affect
+    previous = None
+    if previousDir is not None:
+        previous = previousFragments("%s/allDiscordants.us.txt" % previousDir)
+        previousMasks = readIgnoreChr(previousIgnoreChr) + ({},)
+        if previousIgnoreBED is not None:
+            previousMasks = previousMasks[:2] + (excludeHash(ignoreBuffer,
+                previousIgnoreBED, chromosome_lengths, context),)
+        masks = (ignoreTIDs, ignoreTIDAll, chrHash)
+        nReformed = 0
+
+    # read discordant alignments and write all possible discordant pairs to
+    # file, or hand them to the sort as records with --in-memory
+    with recordFile("%s/allDiscordants.us.txt" % workDir, formatDiscordant) as almtFile:
         currentFrag = 1
         logging.info('Started reading discordant pairs')
-        for (q1, aln1s),(q2, aln2s) in izip(readNextReadAlignments(readAlmts1), readNextReadAlignments(readAlmts2)):
+        for qname, aln1s, aln2s in readFragmentAlignments(discBAM):
 
             if (currentFrag % 100000) == 0:
                 logging.debug("%d fragments analyzed", currentFrag)
-            try:
-                assert q1[:-2] == q2[:-2]
-            except AssertionError:
-                logging.debug("Assertion error on query name being same in writeDiscordants")
-                sys.stderr.write("Please check if reads pass vendor checks \
-                \n{0}\n{1}\nQuitting.\n" .format(q1,q2))
-                exit(1)
-
-            dList1, dList2 = formDiscordant(aln1s, aln2s, disc_thresh,
-                    disc_thresh_neg, mean_IL, chrHash, nMatchPct_thresh,
+            # a read may have no alignments left after the filters above
+            if not aln1s or not aln2s:
+                logging.debug("Skipping %s: alignments of only one read", qname)
+                continue
+            if not previewKeeps(qname, preview):
+                continue
+
+            if previous is not None:
+                lines = previous.lines(currentFrag)
+                if all(maskStatus(x, *masks) == maskStatus(x, *previousMasks)
+                       for x in aln1s + aln2s):
+                    almtFile.writelines(lines)
+                    currentFrag += 1
+                    continue
+                nReformed += 1
+
+            # fragments of a read group are judged by its own statistics
+            rg = None
+            fragStats = (rdl, mean_IL, disc_thresh, disc_thresh_neg)
+            if rgStats:
+                rg = fragmentReadGroup(aln1s, readGroups)
+                if rg in rgStats:
+                    fragStats = (rgStats[rg][0], rgStats[rg][1], rgStats[rg][4], rgStats[rg][5])
+
+            dList1, dList2 = formDiscordant(aln1s, aln2s, fragStats[2],
+                    fragStats[3], fragStats[1], chrHash, nMatchPct_thresh,
                     nMatch_relative_thresh, as_relative_thresh, map_thresh,
-                    permutation_thresh, ignoreBED, ignoreTIDs, ignoreTIDAll, rdl, libDup)
-            for item in dList1:
-                print >> almtFile, "%s\t%s" %(currentFrag, item)
-            for item in dList2:
-                print >> almtFile, "%s\t%s" %(currentFrag, item)
+                    permutation_thresh, ignoreBED, ignoreTIDs, ignoreTIDAll, fragStats[0], libDup)
+            for item in dList1 + dList2:
+                item.readGroup = rg
+            for item in dList1 + dList2:
+                almtFile.write(item.record(currentFrag))
             currentFrag += 1
         logging.info('Finished reading discordant pairs')
+    if previous is not None:
+        previous.close()
+        logging.info('Formed %d of %d fragments again for the changed masks; the others were taken from %s',
+                     nReformed, currentFrag - 1, previousDir)
     
     chrHash.clear()
     del chrHash
@@ -603,12 +793,11 @@ if __name__ == "__main__":
 
     # parse arguments
     PARSER = ap.ArgumentParser(description="""
-    Filter, format and write all PE discordants from 2 input discordant BAM
-    files, each containing first- or second-in-pair discordant alignments, to
-    allDiscordants.us.txt""", formatter_class=ap.ArgumentDefaultsHelpFormatter)
+    Filter, format and write all PE discordants from a name-sorted or
+    name-grouped discordant SAM/BAM file to allDiscordants.us.txt""",
+    formatter_class=ap.ArgumentDefaultsHelpFormatter)
     PARSER.add_argument('workDir', help='Work directory')
-    PARSER.add_argument('readAlmts1', help='BAM file containing first-in-pair discodrant PE almts')
-    PARSER.add_argument('readAlmts2', help='BAM file containing second-in-pair discordant PE almts')
+    PARSER.add_argument('discBAM', help='Name-sorted or name-grouped SAM/BAM file containing discordant PE almts, or - for stdin')
     PARSER.add_argument('bamfile', help='Position-sorted BAM alignment file')
     PARSER.add_argument('-d', action='store_true', dest='debug',
         help='print debug information')
@@ -631,6 +820,10 @@ if __name__ == "__main__":
         --set to less than 1 (.95 recommended) if using secondary almts')
     PARSER.add_argument('-m', default=10, dest='map_thresh', type=int,
         help='Mapping quality threshold')
+    PARSER.add_argument('-g', default=None, dest='regions',
+        help='BED file of target regions to sample the BAM statistics from')
+    PARSER.add_argument('--preview', default=1.0, type=float,
+        help='Fraction of the fragments kept, chosen by a hash of their names')
     ARGS = PARSER.parse_args()
 
     LEVEL = logging.INFO
@@ -641,12 +834,14 @@ if __name__ == "__main__":
                         format='%(asctime)s %(levelname)s %(message)s',
                         datefmt='%m/%d/%Y %I:%M:%S %p')
 
-    writeDiscordantFragments(ARGS.workDir, ARGS.readAlmts1, ARGS.readAlmts2,
+    writeDiscordantFragments(ARGS.workDir, ARGS.discBAM,
                              ARGS.bamfile, ARGS.debug, ARGS.ignoreBED,
                              ARGS.ignoreChr, ARGS.permutation_thresh,
                              ARGS.calc_thresh, ARGS.nMatchPct_thresh,
                              ARGS.nMatch_relative_thresh,
                              ARGS.as_relative_thresh,
-                             ARGS.map_thresh, False)
+                             ARGS.map_thresh, False,
+                             readRegions(ARGS.regions) if ARGS.regions else None,
+                             preview=ARGS.preview)
 
     logging.shutdown()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+# Write the variants of a BEDPE file written by writeBEDs.py in VCF format
+
+import argparse
+from os.path import dirname, realpath
+from sys import stderr
+from shared import openFile, runContext
+
+def vcfHeader(sampleBAM, reference, version, context=None):
+    """Header of the VCF file of the sample in sampleBAM"""
+    if context is None:
+        context = runContext()
+    #read sample name
+    bamHeader = context.header(sampleBAM)
+    try:
+        sampleName = bamHeader['RG'][0]['ID']
+        # the read groups of one sample are merged into a single call set
+        samples = set(rg.get('SM') for rg in bamHeader['RG'])
+        if len(bamHeader['RG']) > 1 and len(samples) == 1 and None not in samples:
+            sampleName = samples.pop()
+    except KeyError:
+        print >> stderr, "Missing headers. Please check if BAM was correctly written."
+        exit(1)
+
+    header = ["##fileformat=VCF4.3", "##source=SVXplorer-" + version,
+              "##reference=" + reference]
+    header.append("""##INFO=<ID=END,Number=1,Type=Integer,Description=\"end point of SV\">
+##INFO=<ID=SVTYPE,Number=1,Type=String,Description=\"SV Type\">
+##INFO=<ID=CM,Number=1,Type=String,Description=\"SV Type for all entries with current GROUPID combined, e.g. 'Cut-paste insertion'\">
+##INFO=<ID=PROBTYPE,Number=1,Type=String,Description=\"Likely or possible SV Type for BND event\"> 
+##INFO=<ID=ISINV,Number=.,Type=Flag,Description=\"Whether on inverted or positive strand\">
+##INFO=<ID=CHR2,Number=1,Type=Integer,Description=\"For BNDs the reference ID of the 'END' breakpoint if different from that of start 'POS'\">
+##INFO=<ID=GROUPID,Number=1,Type=String,Description=\"ID tag correlating events arising from a single complex event, e.g. translocation, copy-paste insertion etc; also used for adjacencies of BND events\">
+##INFO=<ID=SVLEN,Number=1,Type=Integer,Description="Difference in length between REF and ALT alleles">
+##INFO=<ID=IMPRECISE,Number=.,Type=Flag,Description="Imprecise structural variation">
+##INFO=<ID=PRECISE,Number=.,Type=Flag,Description="Precise structural variation">
+##INFO=<ID=CIPOS,Number=2,Type=Integer,Description="Confidence interval around POS for imprecise variants">
+##INFO=<ID=CIEND,Number=2,Type=Integer,Description="Confidence interval around END for imprecise variants">
+##INFO=<ID=MATEID,Number=1,Type=String,Description="ID of mate breakends for BND events">
+##INFO=<ID=SUPPORT,Number=1,Type=Integer,Description="PE+SR">
+##INFO=<ID=PE,Number=1,Type=Integer,Description="Number of paired-end reads supporting the variant">
+##INFO=<ID=SR,Number=1,Type=Integer,Description="Number of split reads supporting the variant">
+##INFO=<ID=CR,Number=1,Type=String,Description="Reason for rejection of variant as putative DEL/TD due to corresponding local read depth relative to median of chromosome in question">
+##INFO=<ID=CINFO,Number=1,Type=Float,Description=\"Local read depth of SV 'source' location relative to chromosome median coverage\">
+##ALT=<ID=DEL,Description="Deletion">
+##ALT=<ID=DUP,Description="Duplication">
+##ALT=<ID=INV,Description="Inversion">
+##ALT=<ID=DUP:TANDEM,Description="Tandem duplication">
+##ALT=<ID=INS,Description="Insertion of novel sequence">
+##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">
+##FORMAT=<ID=SU,Number=1,Type=Integer,Description="PE+SR">
+##FORMAT=<ID=PE,Number=1,Type=Integer,Description="Number of paired-end reads supporting the variant">
+##FORMAT=<ID=SR,Number=1,Type=Integer,Description="Number of split reads supporting the variant\">""")
+    header.append("\t".join(["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT", sampleName]))
+    return "\n".join(header) + "\n"
+
+def writeVCF(inputFile, outputFile, header):
+    """Read the BEDPE and convert to VCF with the given header."""
+    with openFile(inputFile, 'r') as inpt, openFile(outputFile,'w') as otpt:
+        counter = -1
+        otpt.write(header)
+        for line in inpt:
+            counter+=1
+            if counter == 0:
+                #header
+                continue
+            tokens = line.split()
+            precise=tokens[11].find("SR")
+            support="SUPPORT=" + tokens[16] + ";PE=" + tokens[19] + ";SR=" + tokens[20] + ";"
+            chr1 = tokens[0]
+            chr1Start = tokens[1]
+            chr1End = tokens[2]
+            chr2Start = tokens[4]
+            chr2End = tokens[5]
+            name = tokens[10]
+            bnd = tokens[17]
+            CM = tokens[18]
+            cl_support = tokens[21]
+            cipos = str(int(chr1End)-int(chr1Start))
+            svlen = str(abs(int(chr2End) - int(chr1Start)))
+            covInfo = float(tokens[25])
+
+            if precise == -1:
+                precise = "IMPRECISE"
+            else:
+                precise="PRECISE"
+
+            chr2=""
+            if chr1 != chr2:
+                chr2="CHR2="+ tokens[3] + ";"
+            covRejInfo = ""
+            if covInfo > 0 and CM == "INS_halfRF":
+                covRejInfo= ";CR=TD_rejected_due_to_relative_coverage_" + str(covInfo)
+            elif covInfo > 0 and CM == "INS_halfFR":
+                covRejInfo= ";CR=DEL_rejected_due_to_relative_coverage_" + str(covInfo)
+            elif covInfo > 0:
+                covRejInfo= ";CINFO=" + str(covInfo)
+
+            if name == "BND":
+                GROUPID = "GROUPID=" + tokens[24] + ";"
+                if CM.startswith("INS_C"):
+                    CM = "Translocation"
+                elif CM.startswith("INS_half"):
+                    CM = "TranslocationOrDuplication"
+                elif CM.startswith("INS") or CM.startswith("TD"):
+                    CM = "Duplication"
+                elif CM.startswith("INV"):
+                    CM = "Inversion"
+                elif CM.startswith("DN_INS"):
+                    CM = "DeNovoInsertion"
+
+                if tokens[22] != "." and tokens[23] != ".":
+                    BNDAlt1, BNDAlt2 = tokens[22].replace("p", tokens[3] + ":" + chr2End),\
+                    tokens[23].replace("p", chr1 + ":" + chr1Start)
+                else:
+                    BNDAlt1, BNDAlt2 = ".", "."
+                
+                print >> otpt, "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s" % (chr1, chr1Start, counter, "N", BNDAlt1, ".","PASS", "SVTYPE=BND;CIPOS=0," + cipos + ";CIEND=-" + cipos + ",0;PROBTYPE=" + CM + ";MATEID=" + str(counter + 1) + ";" + GROUPID + support + precise + covRejInfo, "GT:SU:PE:SR", "./.:" + tokens[16] + ":" + tokens[19] + ":" + tokens[20])
+                print >> otpt, "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s" % (tokens[3], chr2End, counter + 1, "N", BNDAlt2, ".","PASS", "SVTYPE=BND;CIPOS=0," + cipos + ";CIEND=-" + cipos + ",0;PROBTYPE=" + CM + ";MATEID=" + str(counter) + ";" + GROUPID + support + precise + covRejInfo, "GT:SU:PE:SR", "./.:" + tokens[16] + ":" + tokens[19] + ":" + tokens[20])
+                counter+= 1
+            elif name == "DN_INS":
+                print >> otpt, "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s" % (chr1, chr1Start,counter,"N", "<INS>",".","PASS", "SVTYPE=INS;CIPOS=0," + cipos + support + precise, "GT:SU:PE:SR", "./.:" + tokens[16] + ":" + tokens[19] + ":" + tokens[20])
+            elif name == "DEL":
+                print >> otpt, "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s" % (chr1, chr1Start,counter,"N", "<DEL>",".","PASS", "SVTYPE=DEL;END=" + chr2End + ";SVLEN=-" + svlen + ";CIPOS=0," + cipos + ";CIEND=-" + cipos + ",0;" + support + precise + covRejInfo, "GT:SU:PE:SR", "./.:" + tokens[16] + ":" + tokens[19] + ":" + tokens[20])
+            elif name == "TD" or name == "TD_INV":
+                isinv=""
+                svlen = str(abs(int(chr2Start) - int(chr1End)))
+                if name=="TD_INV":
+                    isinv="ISINV;"
+                print >> otpt, "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s" % (chr1, chr1End,counter,"N", "<DUP:TANDEM>",".","PASS", "SVTYPE=DUP;END=" + chr2Start + ";SVLEN=" + svlen + ";CIPOS=-" + cipos + ",0;CIEND=0," + cipos + ";" + isinv + support + precise + covRejInfo, "GT:SU:PE:SR", "./.:" + tokens[16] + ":" + tokens[19] + ":" + tokens[20])
+            elif name == "INV":
+                ciend = int(chr2End) - int(chr2Start)
+                pos = int((int(chr1Start) + int(chr1End))/2.0)
+                end = int((int(chr2Start) + int(chr2End))/2.0)
+                svlen = str(abs(end - pos))
+                print >> otpt, "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s" % (chr1, pos, counter,"N", "<INV>",".","PASS", "SVTYPE=INV;END=" + str(end) + ";SVLEN=" + svlen + ";CIPOS=-" + str(int(int(cipos)/2.0)) +"," + str(int(int(cipos)/2.0)) + ";CIEND=-" + str(int(int(ciend)/2.0)) +"," + str(int(int(ciend)/2.0)) + ";" + support + precise, "GT:SU:PE:SR", "./.:" + tokens[16] + ":" + tokens[19] + ":" + tokens[20])
+            elif name in ["INS","INS_I","INS_C_P","INS_C_I_P"]:
+                GROUPID= "GROUPID=" + tokens[24] + ";"
+                if name in ["INS","INS_I"]:
+                    field1 = "DUP"
+                    svlen = str(abs(int(chr1End)-int(chr1Start)))
+                    CM = "CopyPasteInsertion"
+                else:
+                    field1 = "DEL"
+                    CM = "CutPasteInsertion"
+                    svlen = "-" + str(abs(int(chr1End)-int(chr1Start)))
+                cipos = int(chr2End)-int(chr2Start)
+                isinv=""
+                if name=="INS_I":
+                    isinv="ISINV;"
+                 
+                BNDAlt1, BNDAlt2 = "N[" + chr1 + ":" + chr1Start + "[", "]" + tokens[3] + ":" + chr2Start + "]N"
+                BNDAlt3, BNDAlt4 = "]" + tokens[3] + ":" + chr2Start + "]N", "N[" + chr1 + ":" + chr1End + "["
+                print >> otpt, "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s" % (chr1, chr1Start,counter,"N", "<" + field1 + ">", ".","PASS", "SVTYPE=" + field1 + ";CM=" + CM + ";END=" + chr1End + ";SVLEN=" + svlen + ";CIPOS=0," + str(cipos) + ";CIEND=-" + str(cipos) +",0;" + GROUPID + isinv + support + precise + covRejInfo, "GT:SU:PE:SR", "./.:" + tokens[16] + ":" + tokens[19] + ":" + tokens[20])
+                print >> otpt, "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s" % (tokens[3], chr2Start, counter + 1,"N", BNDAlt1,".","PASS", "SVTYPE=BND;CM=" + CM + ";SVLEN=" + svlen + ";CIPOS=0," + str(cipos) + ";CIEND=0," + str(cipos) + ";" + GROUPID + "MATEID=" + str(counter + 2) + ";" + support + precise, "GT:SU:PE:SR", "./.:" + tokens[16] + ":" + tokens[19] + ":" + tokens[20])
+                print >> otpt, "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s" % (chr1, chr1Start, counter + 2,"N", BNDAlt2, ".","PASS", "SVTYPE=BND;CM=" + CM + ";SVLEN=" + svlen + ";CIPOS=0," + str(cipos) + ";CIEND=0," + str(cipos) + ";" + GROUPID + "MATEID=" + str(counter + 1) + ";" + support + precise, "GT:SU:PE:SR", "./.:" + tokens[16] + ":" + tokens[19] + ":" + tokens[20])
+                print >> otpt, "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s" % (chr1, chr1End, counter + 3,"N", BNDAlt3, ".","PASS", "SVTYPE=BND;CM=" + CM + ";SVLEN=" + svlen + ";CIPOS=0," + str(cipos) + ";CIEND=0," + str(cipos) + ";" + GROUPID + "MATEID=" + str(counter + 4) + ";" + support + precise, "GT:SU:PE:SR", "./.:" + tokens[16] + ":" + tokens[19] + ":" + tokens[20])
+                print >> otpt, "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s" % (tokens[3], chr2Start, counter + 4,"N", BNDAlt4, ".","PASS", "SVTYPE=BND;CM=" + CM + ";SVLEN=" + svlen + ";CIPOS=0," + str(cipos) + ";CIEND=0," + str(cipos) + ";" + GROUPID + "MATEID=" + str(counter + 3) + ";" + support + precise, "GT:SU:PE:SR", "./.:" + tokens[16] + ":" + tokens[19] + ":" + tokens[20])
+                counter+= 4
+            else:
+                print>>stderr, "Unrecognized SV type"
+                exit(1)
+
+if __name__ == "__main__":
+    PARSER = argparse.ArgumentParser(description='Convert a BEDPE file of variants written by writeBEDs.py to VCF', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    PARSER.add_argument('bedpeFile', help='BEDPE file of variants')
+    PARSER.add_argument('vcfFile', help='VCF file to write')
+    PARSER.add_argument('sampleBAM', help='BAM file of the sample, for the sample name')
+    PARSER.add_argument('reference', help='path to reference genome')
+    ARGS = PARSER.parse_args()
+
+    with open(dirname(realpath(__file__)) + '/VERSION', "r") as version_file:
+        VERSION = version_file.read().strip()
+    writeVCF(ARGS.bedpeFile, ARGS.vcfFile,
+             vcfHeader(ARGS.sampleBAM, ARGS.reference, VERSION))